@@ -0,0 +1,49 @@
+"""
+テストの共通設定。
+
+yahooフォルダのモジュールはフラットにimportする(from const import ...)ため、yahooフォルダとリポジトリのルートをパスに追加する。
+モジュールのimport時に作成されるログファイル(scrapy.log)やSQLiteのファイルがリポジトリ内に作成されないよう、
+一時フォルダを作業ディレクトリにしてから実行する。
+spiderはリトライの待機とスクリーンショットの取得を省略したNewsSpider(クローラー無し)を返す。
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'yahoo'), ROOT]
+os.chdir(tempfile.mkdtemp(prefix='yahoo-tests-'))
+
+
+@pytest.fixture
+def spider(monkeypatch):
+    from scrapy.settings import Settings
+    from seen_urls import SeenUrlIndex
+    from spiders import news
+
+    async def capture(page, name, release, error=False):
+        await release()
+
+    monkeypatch.setattr(news, 'retry_backoff', lambda retry_times: 0)
+    spider = news.NewsSpider()
+    spider.settings = Settings({'RETRY_TIMES': 1})
+    spider.seen_urls = SeenUrlIndex()
+    spider.screenshots.capture = capture
+    return spider
+
+
+def run_errback(spider, request, exception=None):
+    """
+    リクエストが失敗したものとしてerrbackを実行し、返されたリクエスト・アイテムのリストを返す。
+    """
+    from twisted.python.failure import Failure
+
+    failure = Failure(exception or TimeoutError('Timeout 30000ms exceeded.'))
+    failure.request = request
+
+    async def collect():
+        return [output async for output in spider.errback(failure)]
+    return asyncio.run(collect())
@@ -0,0 +1,91 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from scrapy.http import Request
+
+from browser import PagePool, should_abort_request
+
+
+class FakePage:
+    def __init__(self, fail_goto=False):
+        self.closed = False
+        self.fail_goto = fail_goto
+        self.visited = []
+
+    def is_closed(self):
+        return self.closed
+
+    async def goto(self, url):
+        if self.fail_goto:
+            raise RuntimeError('Target closed')
+        self.visited.append(url)
+
+    async def close(self):
+        self.closed = True
+
+
+def test_pool_reuses_released_pages():
+    pool = PagePool(size=2, contexts=['a', 'b'])
+    assert [pool.acquire() for _ in range(3)] == [(None, 'a'), (None, 'b'), (None, 'a')]
+    page = FakePage()
+    asyncio.run(pool.release(page, 'b'))
+    assert page.visited == ['about:blank'] and not page.closed
+    assert pool.acquire() == (page, 'b')
+    assert pool.reuse_count == 1
+    assert pool.acquire() == (None, 'b')
+
+
+def test_pool_closes_pages_it_cannot_keep():
+    pool = PagePool(size=1, contexts=['a'])
+    (kept, extra, broken, closed) = (FakePage(), FakePage(), FakePage(fail_goto=True), FakePage())
+    closed.closed = True
+    for page in (kept, extra, closed):
+        asyncio.run(pool.release(page, 'a'))
+    assert pool.idle_pages == [(kept, 'a')] and extra.closed
+    pool.idle_pages = []
+    asyncio.run(pool.release(broken, 'a'))
+    assert broken.closed and pool.idle_pages == []
+    asyncio.run(pool.release(kept, 'a'))
+    kept.closed = True
+    assert pool.acquire() == (None, 'a') and pool.reuse_count == 0
+    pool.idle_pages = [(extra, 'a'), (FakePage(), 'a')]
+    extra.closed = False
+    asyncio.run(pool.close())
+    assert extra.closed and pool.idle_pages == []
+
+
+def test_middleware_assigns_pooled_pages_to_playwright_requests():
+    from middlewares import PagePoolMiddleware
+
+    middleware = PagePoolMiddleware()
+    middleware.pool = PagePool(size=2, contexts=['a'])
+    pooled = FakePage()
+    middleware.pool.idle_pages.append((pooled, 'a'))
+    request = Request('https://news.yahoo.co.jp/', meta={'playwright': True})
+    middleware.process_request(request, None)
+    assert request.meta['playwright_page'] is pooled and request.meta['playwright_context'] == 'a'
+    middleware.process_request(request, None) # 割り当て済のページ(リトライ等)はそのまま使用する
+    assert request.meta['playwright_page'] is pooled and middleware.pool.reuse_count == 1
+    pooled.closed = True
+    middleware.process_request(request, None)
+    assert 'playwright_page' not in request.meta
+    plain = Request('https://news.yahoo.co.jp/robots.txt')
+    middleware.process_request(plain, None)
+    assert 'playwright_context' not in plain.meta
+
+
+@pytest.mark.parametrize('resource_type, url, expected', [
+    ('image', 'https://news.yahoo.co.jp/a.jpg', True),
+    ('media', 'https://news.yahoo.co.jp/a.mp4', True),
+    ('font', 'https://s.yimg.jp/font.woff2', True),
+    ('script', 'https://www.googletagmanager.com/gtm.js', True),
+    ('xhr', 'https://securepubads.g.doubleclick.net/gampad/ads', True),
+    ('script', 'https://s.yimg.jp/images/ds/yjtag.jp/yjtag.js', True),
+    ('script', 'https://yads.yahoo.co.jp/tag', True),
+    ('document', 'https://news.yahoo.co.jp/articles/1', False),
+    ('script', 'https://s.yimg.jp/news/app.js', False),
+    ('stylesheet', 'https://s.yimg.jp/news/app.css', False),
+])
+def test_should_abort_request(resource_type, url, expected):
+    assert should_abort_request(SimpleNamespace(resource_type=resource_type, url=url)) is expected
@@ -0,0 +1,41 @@
+import pytest
+
+import compression
+
+pytest.importorskip('zstandard')
+
+FOOTER = '（共同通信）\n【関連記事】最新のニュースはこちら。記事の無断転載を禁じます。'
+
+
+def article(number):
+    return f"東京都は{number}日、新たに{number * 7}人の感染を確認したと発表した。{FOOTER}"
+
+
+def test_round_trip_without_dictionary():
+    text = article(18)
+    data = compression.compress(text)
+    assert isinstance(data, bytes) and data != text.encode('utf-8')
+    assert compression.decompress(data) == text
+
+
+def test_round_trip_with_trained_dictionary():
+    dictionary = compression.train_dictionary([article(number) for number in range(1, 400)], 2048)
+    text = article(1000)
+    loaded = []
+
+    def load_dictionary(dict_id):
+        loaded.append(dict_id)
+        return dictionary
+
+    data = compression.compress(text, dict_id=9001, dict_data=dictionary)
+    assert len(data) < len(compression.compress(text))
+    assert compression.decompress(data, 9001, load_dictionary) == text
+    assert compression.decompress(compression.compress(article(1001), 9001), 9001, load_dictionary) == article(1001)
+    assert loaded == [9001]
+
+
+def test_decompress_requires_zstandard(monkeypatch):
+    monkeypatch.setattr(compression, 'zstandard', None)
+    assert not compression.available()
+    with pytest.raises(RuntimeError):
+        compression.decompress(b'')
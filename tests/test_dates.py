@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from dates import TIMEZONE, RunClock, format_post_date, parse_post_date, to_naive
+
+
+def clock(*args):
+    return RunClock(datetime(*args, tzinfo=TIMEZONE))
+
+
+@pytest.mark.parametrize('now, text, expected', [
+    ((2024, 6, 10, 12, 0), '6/10(月) 9:03', datetime(2024, 6, 10, 9, 3, tzinfo=TIMEZONE)),
+    ((2024, 1, 2, 8, 0), '12/31(月) 23:59', datetime(2023, 12, 31, 23, 59, tzinfo=TIMEZONE)),
+    ((2024, 12, 31, 23, 30), '1/1(月) 0:10', datetime(2024, 1, 1, 0, 10, tzinfo=TIMEZONE)),
+    ((2025, 3, 1, 9, 0), '2/29(木) 10:00', datetime(2024, 2, 29, 10, 0, tzinfo=TIMEZONE)),
+    ((2024, 6, 10, 12, 0), '6/10(月) 12:30', datetime(2024, 6, 10, 12, 30, tzinfo=TIMEZONE)),
+    ((2024, 6, 10, 12, 0), '6/10(月) 14:00', datetime(2023, 6, 10, 14, 0, tzinfo=TIMEZONE)),
+])
+def test_run_clock_fills_in_the_year(now, text, expected):
+    assert clock(*now).parse(text) == expected
+
+
+@pytest.mark.parametrize('text', [None, '', '配信', '13/45 9:03'])
+def test_run_clock_rejects_malformed_text(text):
+    assert clock(2024, 6, 10).parse(text) is None
+
+
+def test_is_today_uses_japan_time():
+    run = clock(2024, 6, 10, 0, 30)
+    assert run.is_today(datetime(2024, 6, 9, 15, 30, tzinfo=timezone.utc))
+    assert not run.is_today(datetime(2024, 6, 9, 14, 59, tzinfo=timezone.utc))
+    assert not run.is_today(None)
+
+
+def test_post_date_round_trip():
+    posted_at = parse_post_date('202406100903')
+    assert posted_at == datetime(2024, 6, 10, 9, 3, tzinfo=TIMEZONE)
+    assert format_post_date(posted_at) == '202406100903'
+    assert format_post_date(None) == ''
+
+
+@pytest.mark.parametrize('post_date', [None, '', '-', '20240610'])
+def test_parse_post_date_rejects_malformed_values(post_date):
+    assert parse_post_date(post_date) is None
+
+
+def test_to_naive_converts_to_japan_time():
+    assert to_naive(datetime(2024, 6, 9, 15, 3, tzinfo=timezone.utc)) == datetime(2024, 6, 10, 0, 3)
+    assert to_naive(datetime(2024, 6, 10, 0, 3)) == datetime(2024, 6, 10, 0, 3)
+    assert to_naive(None) is None
+    assert to_naive(parse_post_date('202406100903')).tzinfo is None
+    assert to_naive(parse_post_date('202406100903') + timedelta(hours=15)) == datetime(2024, 6, 11, 0, 3)
@@ -0,0 +1,154 @@
+from collections import Counter
+
+import pytest
+from scrapy.exceptions import CloseSpider
+from scrapy.http import HtmlResponse, Request
+
+from conftest import run_errback
+from extraction import CHAINS, compile_selector, probe, selector_exists, selector_for, selector_report
+
+LISTING = """
+<div id="uamods-topics"><span class="eFboGc">25件</span><ul>
+<li class="newsFeed_item"><a class="newsFeed_item_link" href="https://news.yahoo.co.jp/pickup/1">
+<div class="newsFeed_item_title">見出し1</div><time class="newsFeed_item_date">6/10(月) 9:03</time></a></li>
+<li class="newsFeed_item"><a class="newsFeed_item_link" href="https://news.yahoo.co.jp/pickup/2">
+<div class="newsFeed_item_title">見出し2</div><time class="newsFeed_item_date">6/10(月) 8:00</time></a></li>
+</ul></div>
+"""
+ARTICLE = '<article id="uamods-1"><div class="article_body"><p>本文<b>です</b></p></div></article>'
+
+
+def html(body, url='https://news.yahoo.co.jp/pickup/1'):
+    return HtmlResponse(url, body=body, encoding='utf-8')
+
+
+@pytest.fixture(autouse=True)
+def reset_chains():
+    yield
+    for chain in CHAINS.values():
+        chain.order = list(chain.candidates)
+        chain.hits = Counter()
+        chain.lookups = 0
+
+
+def test_compiled_selector_text_attribute_and_element():
+    response = html(LISTING)
+    assert compile_selector('div.newsFeed_item_title::text').getall(response) == ['見出し1', '見出し2']
+    assert compile_selector('a::attr(href)').get(response) == 'https://news.yahoo.co.jp/pickup/1'
+    assert compile_selector('li').get(response).tag == 'li'
+    assert compile_selector('time.missing::text').get(response, 'なし') == 'なし'
+    assert not compile_selector('time.missing').exists(response)
+    assert compile_selector('li') is compile_selector('li')
+
+
+def test_chain_falls_back_to_the_next_candidate_and_counts_hits():
+    response = html(LISTING)
+    articles = CHAINS['articles']
+    items = articles.getall(response)
+    assert len(items) == 2
+    assert CHAINS['title'].get(items[0]) == '見出し1'
+    assert CHAINS['post_date'].get(items[1]) == '6/10(月) 8:00'
+    assert articles.hits == Counter({'li.newsFeed_item': 1})
+    assert CHAINS['title'].hits == Counter({'div.newsFeed_item_title::text': 1})
+    assert CHAINS['post_date'].hits == Counter({'time.newsFeed_item_date::text': 1})
+    assert CHAINS['next_page'].get(response) is None
+    assert CHAINS['next_page'].lookups == 1 and not CHAINS['next_page'].hits
+
+
+def test_probe_switches_to_the_matching_candidate():
+    result = probe('listing', html(LISTING))
+    assert result.failed == []
+    assert result.switched == {'post_date': 'time.newsFeed_item_date::text'}
+    assert result.matched['next_page'] is None
+    assert CHAINS['post_date'].active.css == 'time.newsFeed_item_date::text'
+    assert CHAINS['post_date'].lookups == 0
+
+
+def test_probe_reports_missing_required_fields():
+    result = probe('article', html('<article id="uamods-1"><div>本文なし</div></article>'))
+    assert result.matched['article_root'] == 'article[id*=uamods]'
+    assert result.failed == ['article_content']
+    assert CHAINS['article_content'].active.css == 'div.article_body *::text'
+
+
+def test_selector_report_lists_rates_and_misses():
+    chain = CHAINS['article_content']
+    chain.getall(html(ARTICLE))
+    chain.getall(html('<div></div>'))
+    assert selector_report() == ['article_content: div.article_body *::text 50%(1/2), 不一致 50%(1/2)']
+    assert selector_report(degraded_only=True) == []
+
+
+def test_selector_exists_does_not_count_lookups():
+    response = html(ARTICLE)
+    assert selector_exists('div.article_body *::text', response)
+    assert selector_exists('article[id*=uamods]', response)
+    assert not selector_exists('a.bxbqJP', response)
+    assert not selector_exists('span.unknown', response)
+    assert all(not chain.lookups and not chain.hits for chain in CHAINS.values())
+    assert selector_for('span.unknown') is compile_selector('span.unknown')
+
+
+def test_http_first_check_does_not_count_lookups():
+    from handlers import HttpFirstDownloadHandler
+
+    selectors = ['article[id*=uamods]', ('a.bxbqJP', 'div.article_body *::text')]
+    assert HttpFirstDownloadHandler._has_selectors(html(ARTICLE), selectors)
+    assert not HttpFirstDownloadHandler._has_selectors(html('<article id="uamods-1"></article>'), selectors)
+    assert all(not chain.lookups for chain in CHAINS.values())
+
+
+class FakePage:
+    def __init__(self, url, body='', ready_state='complete'):
+        self.url = url
+        self.body = body
+        self.ready_state = ready_state
+        self.closed = False
+
+    def is_closed(self):
+        return self.closed
+
+    async def evaluate(self, expression):
+        return self.ready_state
+
+    async def content(self):
+        return self.body
+
+    async def close(self):
+        self.closed = True
+
+
+def fail(spider, page, page_type='article', retry_times=0):
+    request = spider._build_request('https://news.yahoo.co.jp/articles/1', page_type=page_type, article_number='1-1', retry_times=retry_times, selector_probe=True)
+    request.meta['playwright_page'] = page
+    return run_errback(spider, request)
+
+
+def test_probe_retries_when_the_page_did_not_load(spider):
+    outputs = fail(spider, FakePage('https://news.yahoo.co.jp/articles/1', ready_state='loading'))
+    assert [request.meta['selector_probe'] for request in outputs] == [True]
+    assert outputs[0].meta['retry_times'] == 1
+    assert spider.selector_probe_error is None
+    assert [request.meta['selector_probe'] for request in fail(spider, FakePage('about:blank'))] == [True]
+    assert fail(spider, None)[0].meta['selector_probe']
+
+
+def test_probe_stops_when_the_loaded_page_does_not_match(spider):
+    page = FakePage('https://news.yahoo.co.jp/articles/1', '<article id="uamods-1"><div>本文なし</div></article>')
+    with pytest.raises(CloseSpider):
+        fail(spider, page)
+    assert spider.selector_probe_error == 'article: article_content'
+    assert page.closed
+
+
+def test_probe_moves_to_the_next_held_article_when_retries_run_out(spider):
+    held = [spider._build_request(f'https://news.yahoo.co.jp/pickup/{number}', page_type='headline') for number in (2, 3)]
+    spider.probe_pending.discard('listing')
+    spider.probe_pending.discard('article')
+    spider.probe_held = list(held)
+    outputs = fail(spider, None, retry_times=1)
+    requests = [output for output in outputs if isinstance(output, Request)]
+    assert requests == [held[0]] and held[0].meta['selector_probe']
+    assert spider.probe_held == [held[1]]
+    assert 'article' in spider.probe_pending
+    assert spider.error_count == 1
@@ -0,0 +1,79 @@
+import threading
+
+from frontier import FrontierEntry, SQLiteFrontier
+
+
+def make_frontier(tmp_path):
+    frontier = SQLiteFrontier(str(tmp_path / 'frontier.db'))
+    frontier.push([
+        FrontierEntry('https://news.yahoo.co.jp/a', 'article', 10, {'title': 'a'}),
+        FrontierEntry('https://news.yahoo.co.jp/b', 'article', 0),
+    ])
+    return frontier
+
+
+def states(frontier):
+    return dict(frontier.connection.execute("SELECT url, state FROM frontier"))
+
+
+def test_push_ignores_registered_urls(tmp_path):
+    frontier = make_frontier(tmp_path)
+    assert frontier.push([FrontierEntry('https://news.yahoo.co.jp/a', 'article')]) == 0
+    frontier.close()
+
+
+def test_lease_by_priority_and_ack(tmp_path):
+    frontier = make_frontier(tmp_path)
+    entries = frontier.lease('w1', 1, 60)
+    assert [(entry.url, entry.meta) for entry in entries] == [('https://news.yahoo.co.jp/a', {'title': 'a'})]
+    frontier.ack(entries[0].id)
+    assert [entry.url for entry in frontier.lease('w1', 5, 60)] == ['https://news.yahoo.co.jp/b']
+    assert frontier.lease('w2', 5, 60) == []
+    assert frontier.has_pending()
+    frontier.close()
+
+
+def test_expired_lease_is_leased_again_until_max_attempts(tmp_path):
+    frontier = make_frontier(tmp_path)
+    for _ in range(3):
+        entries = frontier.lease('w1', 1, -1, max_attempts=3) # 貸し出し期限切れ(ワーカーの異常終了)を繰り返す
+        assert [entry.url for entry in entries] == ['https://news.yahoo.co.jp/a']
+    assert [entry.url for entry in frontier.lease('w1', 1, 60, max_attempts=3)] == ['https://news.yahoo.co.jp/b']
+    assert states(frontier)['https://news.yahoo.co.jp/a'] == 'dead'
+    frontier.ack(frontier.connection.execute("SELECT id FROM frontier WHERE url LIKE '%/b'").fetchone()[0])
+    assert not frontier.has_pending()
+    frontier.close()
+
+
+def test_unlimited_attempts_by_default(tmp_path):
+    frontier = make_frontier(tmp_path)
+    for _ in range(5):
+        assert frontier.lease('w1', 1, -1)[0].url == 'https://news.yahoo.co.jp/a'
+    frontier.close()
+
+
+def test_reserve_spaces_requests_from_other_threads(tmp_path):
+    frontier = make_frontier(tmp_path)
+    waits = []
+    threads = [threading.Thread(target=lambda: waits.append(frontier.reserve('news.yahoo.co.jp', 1.0))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(round(wait) for wait in waits) == [0, 1, 2, 3]
+    assert frontier.reserve('example.com', 1.0) == 0
+    frontier.close()
+
+
+def test_csv_pipelines_are_disabled_for_workers(tmp_path):
+    from types import SimpleNamespace
+    import pytest
+    from scrapy.exceptions import NotConfigured
+    from pipelines import CsvPipeline, PartitionedCsvPipeline
+
+    frontier = make_frontier(tmp_path)
+    for pipeline in (CsvPipeline, PartitionedCsvPipeline):
+        with pytest.raises(NotConfigured):
+            pipeline.from_crawler(SimpleNamespace(spider=SimpleNamespace(frontier=frontier)))
+        assert isinstance(pipeline.from_crawler(SimpleNamespace(spider=SimpleNamespace(frontier=None))), pipeline)
+    frontier.close()
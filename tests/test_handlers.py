@@ -0,0 +1,161 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from scrapy.http import HtmlResponse, Request, Response
+from scrapy.settings import Settings
+from scrapy.statscollectors import MemoryStatsCollector
+from twisted.internet import defer
+
+from handlers import HttpFirstDownloadHandler
+
+ARTICLE = '<article id="uamods-1"><div class="article_body"><p>本文<b>です</b></p></div></article>'.encode('utf-8')
+SELECTORS = ['article[id*=uamods]', 'div.article_body *::text']
+
+
+class FakePage:
+    def __init__(self):
+        self.closed = False
+
+    def is_closed(self):
+        return self.closed
+
+    async def goto(self, url):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    """
+    ブラウザを起動せずに、HTTPでの取得結果(http_responses)とレンダリングした回数(rendered)を差し替えたハンドラ。
+    """
+    handler = HttpFirstDownloadHandler.__new__(HttpFirstDownloadHandler)
+    handler.http_first = True
+    handler.stats = MemoryStatsCollector(SimpleNamespace(settings=Settings()))
+    handler.http_responses = []
+    handler.rendered = []
+
+    def download_http(self, request, spider):
+        result = handler.http_responses.pop(0)
+        return defer.fail(result) if isinstance(result, Exception) else defer.succeed(result)
+
+    async def render(request, spider):
+        handler.rendered.append(request)
+        return HtmlResponse(request.url, body=ARTICLE, encoding='utf-8', request=request)
+
+    monkeypatch.setattr(HTTP11DownloadHandler, 'download_request', download_http)
+    handler._download_request = render
+    return handler
+
+
+def fetch(handler, request, spider=None):
+    async def download():
+        return await handler.download_request(request, spider)
+    return asyncio.run(download())
+
+
+def article_request(**meta):
+    return Request('https://news.yahoo.co.jp/articles/1', meta={'playwright': True, 'http_first_selectors': SELECTORS, 'page_type': 'article', **meta})
+
+
+def test_http_response_returns_the_pooled_page(handler):
+    from browser import PagePool
+
+    pool = PagePool(size=2, contexts=['a'])
+    page = FakePage()
+    request = article_request(playwright_page=page, playwright_context='a')
+    handler.http_responses.append(HtmlResponse(request.url, body=ARTICLE, encoding='utf-8'))
+    fetch(handler, request, SimpleNamespace(page_pool=pool))
+    assert request.meta['rendered'] is False
+    assert 'playwright_page' not in request.meta
+    assert pool.idle_pages == [(page, 'a')] and not page.closed
+    assert handler.rendered == []
+
+
+def test_http_response_closes_the_page_without_a_pool(handler):
+    page = FakePage()
+    request = article_request(playwright_page=page)
+    handler.http_responses.append(HtmlResponse(request.url, body=ARTICLE, encoding='utf-8'))
+    fetch(handler, request)
+    assert page.closed and 'playwright_page' not in request.meta
+
+
+def test_rendered_response_keeps_the_page(handler):
+    page = FakePage()
+    request = article_request(playwright_page=page)
+    handler.http_responses.append(HtmlResponse(request.url, body=b'<div id="app"></div>'))
+    fetch(handler, request)
+    assert handler.rendered == [request] and request.meta['playwright_page'] is page and not page.closed
+
+
+@pytest.mark.parametrize('body, rendered', [(ARTICLE, False), (b'<div id="app"></div>', True)])
+def test_renders_only_when_selectors_are_missing(handler, body, rendered):
+    request = article_request()
+    handler.http_responses.append(HtmlResponse(request.url, body=body, encoding='utf-8'))
+    response = fetch(handler, request)
+    assert request.meta['rendered'] is rendered
+    assert (handler.rendered == [request]) is rendered
+    assert handler.stats.get_value('http_first/rendered' if rendered else 'http_first/plain') == 1
+    assert response.body == ARTICLE
+
+
+@pytest.mark.parametrize('status', [404, 410, 503])
+def test_other_statuses_are_passed_through(handler, status):
+    request = article_request()
+    handler.http_responses.append(HtmlResponse(request.url, status=status, body=b'<p>Not Found</p>'))
+    response = fetch(handler, request)
+    assert response.status == status and handler.rendered == []
+    assert handler.stats.get_value('http_first/passthrough') == 1
+
+
+def test_not_modified_uses_the_cache_and_failures_render(handler):
+    cached = article_request(cached_response=HtmlResponse('https://news.yahoo.co.jp/articles/1', body=ARTICLE))
+    handler.http_responses.append(Response(cached.url, status=304))
+    assert fetch(handler, cached).status == 304
+    assert handler.stats.get_value('http_first/not_modified') == 1
+    failed = article_request(playwright_page=FakePage())
+    failed.headers[b'If-None-Match'] = b'"v1"'
+    handler.http_responses.append(ConnectionRefusedError())
+    assert fetch(handler, failed).status == 200
+    assert handler.rendered == [failed] and b'If-None-Match' not in failed.headers
+
+
+def test_disabled_http_first_renders_without_conditional_headers(handler, monkeypatch):
+    from scrapy_playwright.handler import ScrapyPlaywrightDownloadHandler
+
+    rendered = []
+
+    def render(self, request, spider):
+        rendered.append(request)
+        return defer.succeed(HtmlResponse(request.url, body=ARTICLE))
+
+    monkeypatch.setattr(ScrapyPlaywrightDownloadHandler, 'download_request', render)
+    handler.http_first = False
+    request = article_request()
+    request.headers[b'If-Modified-Since'] = b'Mon, 10 Jun 2024 00:00:00 GMT'
+    fetch(handler, request)
+    assert rendered == [request] and handler.http_responses == []
+    assert b'If-Modified-Since' not in request.headers
+
+
+def test_scrapy_playwright_private_methods_still_match():
+    """
+    HttpFirstDownloadHandlerが上書き・呼び出すscrapy-playwrightの非公開メソッドのシグネチャを確認する(更新時の互換性の確認)。
+    """
+    import inspect
+    from scrapy_playwright.handler import ScrapyPlaywrightDownloadHandler
+
+    expected = {
+        '_download_request': ['self', 'request', 'spider'],
+        '_download_request_with_page': ['self', 'request', 'page', 'spider'],
+        '_apply_page_methods': ['self', 'page', 'request', 'spider'],
+        '_get_total_page_count': ['self'],
+    }
+    for (name, parameters) in expected.items():
+        method = getattr(ScrapyPlaywrightDownloadHandler, name)
+        assert list(inspect.signature(method).parameters) == parameters, name
+        assert name == '_get_total_page_count' or inspect.iscoroutinefunction(method), name
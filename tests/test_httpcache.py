@@ -0,0 +1,74 @@
+from email.utils import formatdate
+from time import time
+from types import SimpleNamespace
+
+import pytest
+from scrapy.http import HtmlResponse, Request
+from scrapy.settings import Settings
+from scrapy.utils.request import RequestFingerprinter
+
+from httpcache import BoundedFilesystemCacheStorage, PageTypeCachePolicy, response_age
+
+
+def cached(age, **headers):
+    return HtmlResponse('https://news.yahoo.co.jp/articles/1', body=b'<html></html>', headers={'Date': formatdate(time() - age, usegmt=True), **headers})
+
+
+def request(page_type='article', url='https://news.yahoo.co.jp/articles/1'):
+    return Request(url, meta={'page_type': page_type})
+
+
+@pytest.fixture
+def policy():
+    return PageTypeCachePolicy(Settings({'HTTPCACHE_IGNORE_SCHEMES': ['file']}))
+
+
+def test_only_page_types_with_a_ttl_are_cached(policy):
+    assert policy.should_cache_request(request('listing'))
+    assert policy.should_cache_request(request('article'))
+    assert not policy.should_cache_request(request(None))
+    assert not policy.should_cache_request(request('article', 'file:///tmp/page.html'))
+    assert policy.should_cache_response(cached(0), request())
+    assert not policy.should_cache_response(cached(0).replace(status=404), request())
+
+
+def test_freshness_follows_the_page_type_ttl(policy):
+    assert policy.is_cached_response_fresh(cached(60), request('listing'))
+    assert policy.is_cached_response_fresh(cached(600), request('article'))
+    assert not policy.is_cached_response_fresh(cached(600), request('listing'))
+
+
+def test_stale_responses_are_revalidated(policy):
+    stale = request('listing')
+    response = cached(600, ETag='"v1"', **{'Last-Modified': 'Mon, 10 Jun 2024 00:00:00 GMT'})
+    assert not policy.is_cached_response_fresh(response, stale)
+    assert stale.headers[b'If-None-Match'] == b'"v1"'
+    assert stale.headers[b'If-Modified-Since'] == b'Mon, 10 Jun 2024 00:00:00 GMT'
+    assert policy.is_cached_response_valid(response, response.replace(status=304), stale)
+    assert not policy.is_cached_response_valid(response, response, stale)
+
+
+def test_response_age_without_date_is_infinite():
+    assert response_age(HtmlResponse('https://news.yahoo.co.jp/', body=b'')) == float('inf')
+    assert response_age(HtmlResponse('https://news.yahoo.co.jp/', body=b'', headers={'Date': 'invalid'})) == float('inf')
+    assert 59 <= response_age(cached(60)) < 62
+
+
+def test_storage_evicts_the_oldest_entries(tmp_path):
+    storage = BoundedFilesystemCacheStorage(Settings({'HTTPCACHE_DIR': str(tmp_path), 'HTTPCACHE_GZIP': False}))
+    spider = SimpleNamespace(name='news', crawler=SimpleNamespace(request_fingerprinter=RequestFingerprinter()))
+    storage.open_spider(spider)
+    for number in range(3):
+        page = request(url=f'https://news.yahoo.co.jp/articles/{number}')
+        storage.store_response(spider, page, HtmlResponse(page.url, body=b'x' * 1000, headers={'Date': formatdate(usegmt=True)}))
+    assert len(storage.entries) == 3
+    assert storage.total_bytes == sum(size for (_, size) in storage.entries.values())
+    storage.max_bytes = storage.total_bytes * 2 // 3
+    storage.store_response(spider, page, HtmlResponse(page.url, body=b'x' * 1000, headers={'Date': formatdate(usegmt=True)}))
+    assert len(storage.entries) == 1
+    assert storage.retrieve_response(spider, request(url='https://news.yahoo.co.jp/articles/0')) is None
+    assert storage.retrieve_response(spider, page).body == b'x' * 1000
+
+    reopened = BoundedFilesystemCacheStorage(Settings({'HTTPCACHE_DIR': str(tmp_path), 'HTTPCACHE_GZIP': False}))
+    reopened.open_spider(spider)
+    assert reopened.total_bytes == storage.total_bytes
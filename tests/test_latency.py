@@ -0,0 +1,126 @@
+from types import SimpleNamespace
+
+import pytest
+from scrapy import Request
+from scrapy.exceptions import IgnoreRequest
+from scrapy.settings import Settings
+from scrapy_playwright.page import PageMethod
+
+from latency import LatencyTracker, RunBudget
+
+
+def test_percentile_uses_nearest_rank():
+    tracker = LatencyTracker()
+    assert tracker.percentile('article') is None
+    for seconds in range(1, 101):
+        tracker.record('article', seconds / 10)
+    assert tracker.percentile('article', 0.5) == 5.0
+    assert tracker.percentile('article', 0.99) == 9.9
+    assert tracker.percentile('article', 1.0) == 10.0
+    assert tracker.percentile('article', 0.0) == 0.1
+
+
+def test_timeout_uses_the_ceiling_until_min_samples():
+    tracker = LatencyTracker(min_samples=3, multiplier=2.0, floor=1000, ceiling=10000)
+    assert tracker.timeout('article') == 10000
+    tracker.record('article', 1.0)
+    tracker.record('article', 2.0)
+    assert tracker.timeout('article') == 10000
+    tracker.record('article', 1.5)
+    assert tracker.timeout('article') == 4000
+    assert tracker.timeout('listing') == 10000
+
+
+@pytest.mark.parametrize('seconds, expected', [(0.1, 1000), (2.0, 4000), (60.0, 10000)])
+def test_timeout_is_clamped(seconds, expected):
+    tracker = LatencyTracker(min_samples=1, multiplier=2.0, floor=1000, ceiling=10000)
+    tracker.record('article', seconds)
+    assert tracker.timeout('article') == expected
+
+
+def test_window_drops_old_samples():
+    tracker = LatencyTracker(window=2, min_samples=1, multiplier=1.0, floor=0, ceiling=100000)
+    for seconds in (30.0, 1.0, 2.0):
+        tracker.record('article', seconds)
+    assert list(tracker.samples['article']) == [1.0, 2.0]
+    assert tracker.timeout('article') == 2000
+    assert tracker.summary() == {'article': {'count': 2, 'p50': 1.0, 'p99': 2.0, 'timeout': 2000}}
+
+
+def test_run_budget_drops_listings_and_retries_after_the_budget():
+    now = [100.0]
+    budget = RunBudget(seconds=60, min_priority=0, clock=lambda: now[0])
+    listing = Request('https://news.yahoo.co.jp/topics/top-picks', meta={'page_type': 'listing'})
+    article = Request('https://news.yahoo.co.jp/articles/1', meta={'page_type': 'article'})
+    retry = Request('https://news.yahoo.co.jp/articles/2', priority=-10, meta={'page_type': 'article'})
+    assert all(budget.allows(request) for request in (listing, article, retry))
+    now[0] = 160.0
+    assert budget.exceeded()
+    assert not budget.allows(listing)
+    assert budget.allows(article)
+    assert not budget.allows(retry)
+    budget.start()
+    assert budget.elapsed == 0 and not budget.exceeded()
+    assert not RunBudget(seconds=0, clock=lambda: now[0]).exceeded()
+
+
+def make_middleware(**settings):
+    from middlewares import AdaptiveTimeoutMiddleware
+
+    defaults = {'PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT': 90000, 'ADAPTIVE_TIMEOUT_MIN_SAMPLES': 1, 'ADAPTIVE_TIMEOUT_MULTIPLIER': 2.0}
+    return AdaptiveTimeoutMiddleware(SimpleNamespace(settings=Settings({**defaults, **settings})))
+
+
+def playwright_request(page_type='article', **meta):
+    return Request('https://news.yahoo.co.jp/articles/1', meta={
+        'playwright': True,
+        'page_type': page_type,
+        'playwright_page_methods': [
+            PageMethod('evaluate', 'window.scrollTo(0, 0)'),
+            PageMethod('wait_for_selector', 'article', timeout=90000),
+        ],
+        **meta,
+    })
+
+
+def test_middleware_applies_the_timeout_to_navigation_and_page_methods():
+    middleware = make_middleware()
+    middleware.tracker.record('article', 10.0)
+    request = playwright_request()
+    assert middleware.process_request(request, None) is None
+    assert request.meta['adaptive_timeout'] == 20000
+    assert request.meta['playwright_page_goto_kwargs'] == {'timeout': 20000}
+    methods = request.meta['playwright_page_methods']
+    assert [(method.method, method.args, method.kwargs) for method in methods] == [
+        ('set_default_timeout', (20000,), {}),
+        ('evaluate', ('window.scrollTo(0, 0)',), {}),
+        ('wait_for_selector', ('article',), {'timeout': 20000}),
+    ]
+    middleware.tracker.record('article', 20.0)
+    middleware.process_request(request, None)
+    assert [method.method for method in request.meta['playwright_page_methods']].count('set_default_timeout') == 1
+    assert request.meta['playwright_page_methods'][0].args == (40000,)
+
+
+def test_middleware_leaves_other_requests_alone():
+    middleware = make_middleware(ADAPTIVE_TIMEOUT_ENABLED=False)
+    request = playwright_request()
+    middleware.process_request(request, None)
+    assert 'adaptive_timeout' not in request.meta
+    assert len(request.meta['playwright_page_methods']) == 2
+    plain = Request('https://news.yahoo.co.jp/articles/1', meta={'page_type': 'article'})
+    assert make_middleware().process_request(plain, None) is None
+    assert 'adaptive_timeout' not in plain.meta
+
+
+def test_middleware_records_timeouts_and_drops_requests_over_budget():
+    middleware = make_middleware(ADAPTIVE_TIMEOUT_MIN_SAMPLES=5, RUN_TIME_BUDGET=60)
+    request = playwright_request()
+    middleware.process_request(request, None)
+    middleware.process_exception(request, TimeoutError(), None)
+    assert list(middleware.tracker.samples['article']) == [90.0]
+    middleware.budget.started -= 61
+    listing = playwright_request('listing')
+    with pytest.raises(IgnoreRequest):
+        middleware.process_request(listing, None)
+    assert listing.meta['budget_exceeded'] and middleware.budget.dropped == 1
@@ -0,0 +1,107 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from scrapy.exceptions import NotConfigured
+from scrapy.settings import Settings
+
+import metrics
+from metrics import Histogram, MetricsExtension, MetricsRegistry
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(metrics, 'METRICS', registry)
+    return registry
+
+
+def test_histogram_counts_buckets_and_interpolates_quantiles():
+    histogram = Histogram(buckets=(1, 2, 4))
+    for value in (0.5, 1.5, 1.5, 3.0, 8.0):
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1, 1]
+    assert (histogram.count, histogram.total, histogram.maximum) == (5, 14.5, 8.0)
+    assert histogram.quantile(0.2) == 1.0
+    assert histogram.quantile(0.5) == 1.75
+    assert histogram.quantile(1.0) == 8.0
+    assert Histogram().quantile(0.5) is None
+    assert histogram.to_dict()['buckets'] == {'1': 1, '2': 2, '4': 1, '+Inf': 1}
+
+
+def test_prometheus_output_is_cumulative_and_labelled(registry):
+    registry.observe('navigation_seconds', 0.3, page_type='article')
+    registry.observe('navigation_seconds', 3.0, page_type='article')
+    registry.register_gauge('queue_depth', lambda: 7, queue='scheduler')
+    registry.register_gauge('open_pages', lambda: 1 / 0)
+    registry.sample()
+    text = registry.prometheus({'pass_count': 2, 'skip': None, 'flag': True}, {'worker': 'w"1'})
+    lines = text.splitlines()
+    assert '# TYPE yahoo_news_navigation_seconds histogram' in lines
+    assert 'yahoo_news_navigation_seconds_bucket{worker="w\\"1",page_type="article",le="0.25"} 0' in lines
+    assert 'yahoo_news_navigation_seconds_bucket{worker="w\\"1",page_type="article",le="0.5"} 1' in lines
+    assert 'yahoo_news_navigation_seconds_bucket{worker="w\\"1",page_type="article",le="+Inf"} 2' in lines
+    assert 'yahoo_news_navigation_seconds_count{worker="w\\"1",page_type="article"} 2' in lines
+    assert 'yahoo_news_queue_depth{worker="w\\"1",queue="scheduler"} 7' in lines
+    assert 'yahoo_news_queue_depth_max{worker="w\\"1",queue="scheduler"} 7' in lines
+    assert 'yahoo_news_pass_count{worker="w\\"1"} 2' in lines
+    assert 'open_pages' not in text and 'skip' not in text and 'flag' not in text
+    assert text.endswith('\n')
+
+
+def test_timer_and_timed_pipelines_record_durations(registry):
+    with registry.timer('extraction_seconds', page_type='listing'):
+        pass
+    assert registry.histograms[('extraction_seconds', (('page_type', 'listing'),))].count == 1
+
+    def process_item(item, spider):
+        return item
+
+    def broken(item, spider):
+        raise ValueError(item)
+
+    async def process_item_async(item, spider):
+        return item
+
+    assert metrics._timed(process_item, 'CsvPipeline')('item', None) == 'item'
+    with pytest.raises(ValueError):
+        metrics._timed(broken, 'CsvPipeline')('item', None)
+    assert asyncio.run(metrics._timed(process_item_async, 'SQLAlchemyPipeline')('item', None)) == 'item'
+    assert registry.histograms[('pipeline_seconds', (('pipeline', 'CsvPipeline'),))].count == 2
+    assert registry.histograms[('pipeline_seconds', (('pipeline', 'SQLAlchemyPipeline'),))].count == 1
+
+
+def make_extension(tmp_path, **settings):
+    return MetricsExtension(SimpleNamespace(settings=Settings({
+        'METRICS_PROMETHEUS_FILE': str(tmp_path / 'prom' / 'news.prom'),
+        'METRICS_REPORT_DIR': str(tmp_path / 'reports'),
+        **settings,
+    })))
+
+
+def test_extension_writes_prometheus_file_and_report(tmp_path, registry):
+    registry.observe('db_commit_seconds', 0.02)
+    spider = SimpleNamespace(pass_count=3, error_count=1, frontier=None)
+    make_extension(tmp_path).spider_closed(spider, 'finished')
+    prometheus = (tmp_path / 'prom' / 'news.prom').read_text(encoding='utf-8')
+    assert 'yahoo_news_db_commit_seconds_count 1' in prometheus
+    assert 'yahoo_news_pass_count 3' in prometheus
+    (report_file,) = (tmp_path / 'reports').iterdir()
+    report = json.loads(report_file.read_text(encoding='utf-8'))
+    assert report['reason'] == 'finished' and report['worker'] is None
+    assert report['counters']['error_count'] == 1
+    assert report['histograms']['db_commit_seconds']['count'] == 1
+    assert not list((tmp_path / 'prom').glob('*.tmp'))
+
+
+def test_extension_names_files_per_worker(tmp_path, registry):
+    spider = SimpleNamespace(frontier=object(), worker_id='host-1')
+    make_extension(tmp_path).spider_closed(spider, 'finished')
+    assert 'worker="host-1"' in (tmp_path / 'prom' / 'news_host-1.prom').read_text(encoding='utf-8')
+    assert next((tmp_path / 'reports').iterdir()).name.endswith('_host-1.json')
+
+
+def test_extension_can_be_disabled(tmp_path):
+    with pytest.raises(NotConfigured):
+        make_extension(tmp_path, METRICS_ENABLED=False)
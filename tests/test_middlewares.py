@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+import pytest
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import HtmlResponse, Request
+from scrapy.settings import Settings
+
+from middlewares import AdaptiveSchedulerMiddleware
+
+SLOT = 'news.yahoo.co.jp'
+
+
+def make_middleware(delay=1.0, **settings):
+    slot = SimpleNamespace(delay=delay)
+    crawler = SimpleNamespace(
+        settings=Settings({'MAX_ARTICLE_RENDERS': 1, 'DOWNLOAD_DELAY': 0.5, 'ADAPTIVE_DELAY_MAX': 8.0, 'ADAPTIVE_DELAY_BACKOFF': 2.0, **settings}),
+        engine=SimpleNamespace(downloader=SimpleNamespace(slots={SLOT: slot})),
+        spider=SimpleNamespace(logger=logging.getLogger('test')),
+    )
+    return AdaptiveSchedulerMiddleware(crawler), slot
+
+
+def article_request(page_type='article', latency=None):
+    meta = {'page_type': page_type, 'download_slot': SLOT}
+    if latency is not None:
+        meta['download_latency'] = latency
+    return Request(f'https://{SLOT}/articles/1', meta=meta)
+
+
+def response(request, status=200):
+    return HtmlResponse(request.url, status=status, body=b'', request=request)
+
+
+def acquire(middleware, request):
+    asyncio.run(middleware.process_request(request, None))
+
+
+@pytest.mark.parametrize('finish', [
+    lambda middleware, request: middleware.process_response(request, response(request), None),
+    lambda middleware, request: middleware.process_exception(request, TimeoutError(), None),
+    lambda middleware, request: middleware.process_exception(request, IgnoreRequest(), None),
+])
+def test_render_slot_is_released_exactly_once(finish):
+    (middleware, _) = make_middleware()
+    request = article_request()
+    acquire(middleware, request)
+    assert request.meta['render_slot'] and middleware.semaphore.locked()
+    finish(middleware, request)
+    assert not middleware.semaphore.locked()
+    middleware.process_response(request, response(request), None)
+    middleware.process_exception(request, TimeoutError(), None)
+    assert middleware.semaphore._value == 1
+
+
+def test_listing_pages_and_cached_responses_do_not_use_a_slot():
+    (middleware, _) = make_middleware()
+    listing = article_request('listing')
+    acquire(middleware, listing)
+    assert 'render_slot' not in listing.meta and not middleware.semaphore.locked()
+    # HttpCacheMiddleware(550)がキャッシュを返した場合は、process_requestを経由せずprocess_responseが呼ばれる
+    cached = article_request()
+    middleware.process_response(cached, response(cached), None)
+    assert middleware.semaphore._value == 1
+    retried = article_request()
+    acquire(middleware, retried)
+    acquire(middleware, retried) # 枠を保持したままのリクエストは再取得しない
+    middleware.process_response(retried, response(retried), None)
+    assert middleware.semaphore._value == 1
+
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_error_statuses_back_off_up_to_the_maximum(status):
+    (middleware, slot) = make_middleware(delay=3.0)
+    request = article_request(latency=0.1)
+    middleware.process_response(request, response(request, status), None)
+    assert slot.delay == 6.0
+    middleware.process_response(request, response(request, status), None)
+    assert slot.delay == 8.0
+    assert middleware.error_rates[SLOT] > 0.3
+
+
+def test_delay_follows_latency_and_is_clamped_to_the_minimum():
+    (middleware, slot) = make_middleware(delay=2.0, ADAPTIVE_DELAY_TARGET_CONCURRENCY=2.0)
+    middleware.process_response(article_request(latency=4.0), response(article_request()), None)
+    assert slot.delay == 2.0
+    for _ in range(10):
+        middleware.process_response(article_request(latency=0.01), response(article_request()), None)
+    assert slot.delay == 0.5
+    middleware.process_response(article_request(), response(article_request()), None)
+    assert slot.delay == 0.5
+
+
+def test_ignored_requests_and_disabled_delay_leave_the_slot_alone():
+    (middleware, slot) = make_middleware(delay=2.0)
+    middleware.process_exception(article_request(), IgnoreRequest(), None)
+    assert slot.delay == 2.0 and SLOT not in middleware.error_rates
+    (disabled, slot) = make_middleware(delay=2.0, ADAPTIVE_DELAY_ENABLED=False)
+    disabled.process_exception(article_request(), TimeoutError(), None)
+    assert slot.delay == 2.0
@@ -0,0 +1,29 @@
+import csv
+import os
+
+import pytest
+
+from partitions import CSV_HEADER, PartitionWriter, iter_partition_files, open_text, partition_path, resolve_compression
+
+
+def test_partition_path_by_post_date():
+    assert partition_path('out', '202401050903', 'gzip') == os.path.join('out', '2024', '01', '05.csv.gz')
+    assert partition_path('out', '', 'gzip') == os.path.join('out', 'unknown.csv.gz')
+    assert partition_path('out', 'Error', None) == os.path.join('out', 'unknown.csv')
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip', 'zstd'])
+def test_each_run_appends_a_readable_stream(tmp_path, compression):
+    compression = resolve_compression(compression)
+    path = partition_path(str(tmp_path), '202401050903', compression)
+    for run in range(2):
+        writer = PartitionWriter(path, compression, 1024)
+        writer.writerow(['タイトル', str(run), '202401050903', f"https://news.yahoo.co.jp/{run}", 'カンマ,と"引用符"'])
+        writer.flush()
+        writer.close()
+    with open_text(path) as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == CSV_HEADER
+    assert [row[3] for row in rows[1:]] == ['https://news.yahoo.co.jp/0', 'https://news.yahoo.co.jp/1']
+    assert rows[1][4] == 'カンマ,と"引用符"'
+    assert iter_partition_files(str(tmp_path)) == [path]
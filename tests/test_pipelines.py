@@ -0,0 +1,260 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from models import Article, upgrade_schema
+from pipelines import SQLAlchemyPipeline
+
+
+def make_item(url, article='本文', title='タイトル', post_date='202401050903'):
+    return {'title': title, 'article_number': url[-1], 'post_date': post_date, 'url': url, 'article': article}
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'yahoo.db'}")
+    upgrade_schema(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db_pipeline(engine):
+    pipeline = SQLAlchemyPipeline(search_index=False, compress=False)
+    pipeline.session = sessionmaker(bind=engine)()
+    pipeline.spider = SimpleNamespace(skip_DB_count=0, unchanged_count=0, revision_count=0)
+    yield pipeline
+    pipeline.session.close()
+
+
+def stored_urls(engine):
+    with engine.connect() as connection:
+        return set(connection.execute(select(Article.url)).scalars())
+
+
+def insert_concurrently(engine, pipeline, url):
+    """
+    保存済の確認の後、挿入の前に他のワーカーが記事を保存した状態を再現する。
+    """
+    insert = pipeline._insert
+
+    def wrapped(rows):
+        with sessionmaker(bind=engine)() as other:
+            other.add(Article(**{key: value for (key, value) in pipeline._row(make_item(url, '他のワーカー')).items()}))
+            other.commit()
+        return insert(rows)
+    pipeline._insert = wrapped
+
+
+def test_write_batch_inserts_and_skips_duplicates_in_batch(db_pipeline, engine):
+    items = [make_item('https://news.yahoo.co.jp/a'), make_item('https://news.yahoo.co.jp/a'), make_item('https://news.yahoo.co.jp/b')]
+    assert db_pipeline._write_batch(items) == ['inserted', 'skipped', 'inserted']
+    assert stored_urls(engine) == {'https://news.yahoo.co.jp/a', 'https://news.yahoo.co.jp/b'}
+
+
+@pytest.mark.parametrize('returning', [True, False])
+def test_write_batch_marks_the_row_another_worker_inserted(db_pipeline, engine, monkeypatch, returning):
+    monkeypatch.setattr(engine.dialect, 'insert_returning', returning)
+    insert_concurrently(engine, db_pipeline, 'https://news.yahoo.co.jp/b')
+    items = [make_item(f"https://news.yahoo.co.jp/{name}") for name in 'abc']
+    assert db_pipeline._write_batch(items) == ['inserted', 'skipped', 'inserted']
+    with engine.connect() as connection:
+        assert connection.execute(select(Article._article).where(Article.url == 'https://news.yahoo.co.jp/b')).scalar() == '他のワーカー'
+
+
+@pytest.mark.parametrize('returning', [True, False])
+def test_write_batch_marks_only_the_failing_row_as_error(db_pipeline, engine, monkeypatch, returning):
+    monkeypatch.setattr(engine.dialect, 'insert_returning', returning)
+    items = [make_item(f"https://news.yahoo.co.jp/{name}") for name in 'abc']
+    items[1]['title'] = None
+    assert db_pipeline._write_batch(items) == ['inserted', 'error', 'inserted']
+    assert stored_urls(engine) == {'https://news.yahoo.co.jp/a', 'https://news.yahoo.co.jp/c'}
+
+
+def test_counts_and_log_stay_per_item_after_a_partial_failure(db_pipeline, engine, caplog):
+    from twisted.internet import defer
+
+    db_pipeline._write_batch([make_item('https://news.yahoo.co.jp/a')])
+    items = [make_item(f"https://news.yahoo.co.jp/{name}") for name in 'abcd']
+    items[2]['title'] = None
+    caplog.clear()
+    with caplog.at_level('INFO', logger='news'):
+        results = db_pipeline._write_batch(items)
+    assert results == ['skipped', 'inserted', 'error', 'inserted']
+    saved = [record.getMessage() for record in caplog.records if '正常に保存されました' in record.getMessage()]
+    assert saved == [f"[DB]1件の記事が正常に保存されました。リンク: https://news.yahoo.co.jp/{name}" for name in 'bd']
+    deferreds = [defer.Deferred() for _ in items]
+    fired = []
+    for d in deferreds:
+        d.addCallback(fired.append)
+    db_pipeline._finish(list(zip(items, deferreds)), results)
+    assert db_pipeline.spider.skip_DB_count == 1
+    assert fired == items
+    assert stored_urls(engine) == {f"https://news.yahoo.co.jp/{name}" for name in 'abd'}
+
+
+def test_csv_pipeline_writes_each_row_before_close(tmp_path, monkeypatch):
+    from pipelines import CsvPipeline
+
+    monkeypatch.chdir(tmp_path)
+    spider = SimpleNamespace(skip_csv_count=0)
+    pipeline = CsvPipeline()
+    pipeline.open_spider(spider)
+    pipeline.process_item(make_item('https://news.yahoo.co.jp/a', '改行を含む\n本文'), spider)
+    with open(tmp_path / 'yahoo_news.csv', encoding='utf-8') as f:
+        assert 'https://news.yahoo.co.jp/a' in f.read()
+    pipeline.process_item(make_item('https://news.yahoo.co.jp/a'), spider)
+    assert spider.skip_csv_count == 1
+    pipeline.close_spider(spider)
+
+
+@pytest.mark.parametrize('count', [2, 3, 4, 6])
+def test_parquet_pipeline_writes_every_row_at_batch_boundaries(tmp_path, count):
+    pq = pytest.importorskip('pyarrow.parquet')
+    from pipelines import ParquetPipeline
+
+    pipeline = ParquetPipeline(root=str(tmp_path), batch_size=3, row_group_size=100)
+    pipeline.open_spider(None)
+    for number in range(count):
+        pipeline.process_item(make_item(f"https://news.yahoo.co.jp/{number}", post_date='202401050903'), None)
+    pipeline.process_item(make_item('https://news.yahoo.co.jp/other-day', post_date='202401060903'), None)
+    pipeline.close_spider(None)
+
+    table = pq.read_table(str(tmp_path))
+    assert table.num_rows == count + 1
+    assert sorted(table.column('url').to_pylist())[-1] == 'https://news.yahoo.co.jp/other-day'
+
+
+def test_near_duplicate_window_uses_japan_time_on_a_utc_host(engine, monkeypatch):
+    from datetime import datetime, timezone
+    import pipelines
+    from pipelines import NearDuplicatePipeline
+
+    class UtcHostDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            utc = datetime(2024, 1, 6, 0, 0, tzinfo=timezone.utc) # 日本時間 2024-01-06 09:00
+            return utc.astimezone(tz) if tz else utc.replace(tzinfo=None)
+
+    with sessionmaker(bind=engine)() as session:
+        for (url, posted_at) in (('https://news.yahoo.co.jp/old', datetime(2024, 1, 5, 5, 0)), ('https://news.yahoo.co.jp/new', datetime(2024, 1, 5, 10, 0))):
+            session.add(Article(title='t', article_number='1', post_date='202401050500', posted_at=posted_at, url=url, simhash=1))
+        session.commit()
+    monkeypatch.setattr(pipelines, 'datetime', UtcHostDatetime)
+    monkeypatch.setattr(pipelines, 'Session', sessionmaker(bind=engine))
+    pipeline = NearDuplicatePipeline(mode='mark', window_days=1)
+    pipeline.open_spider(None)
+    assert pipeline.index.nearest(1) == ('https://news.yahoo.co.jp/new', 0)
+    assert len(pipeline.index) == 1
+
+
+def stored_article(engine, url):
+    from models import ArticleRevision
+
+    with sessionmaker(bind=engine)() as session:
+        article = session.scalars(select(Article).where(Article.url == url)).one()
+        revisions = session.scalars(select(ArticleRevision).where(ArticleRevision.article_id == article.id)).all()
+        return article.article, len(revisions)
+
+
+def test_stored_urls_are_skipped_unless_marked_for_revisit(db_pipeline, engine):
+    url = 'https://news.yahoo.co.jp/a'
+    db_pipeline._write_batch([make_item(url, '更新前の本文。')])
+    assert db_pipeline._write_batch([make_item(url, '更新後の本文。')]) == ['skipped']
+    assert stored_article(engine, url) == ('更新前の本文。', 0)
+
+
+def test_revisit_records_a_revision_only_when_the_content_changed(db_pipeline, engine):
+    from revisions import apply_diff
+    from models import ArticleRevision
+
+    url = 'https://news.yahoo.co.jp/a'
+    db_pipeline._write_batch([make_item(url, '更新前の本文。')])
+    revisit = dict(make_item(url, '更新前の本文。'), revisit=True)
+    assert db_pipeline._write_batch([revisit]) == ['unchanged']
+    revisit['article'] = '更新後の本文。'
+    assert db_pipeline._write_batch([revisit]) == ['updated']
+    assert stored_article(engine, url) == ('更新後の本文。', 1)
+    with sessionmaker(bind=engine)() as session:
+        revision = session.scalars(select(ArticleRevision)).one()
+        assert apply_diff('更新後の本文。', revision.diff) == '更新前の本文。'
+
+
+class FakeReactor:
+    """
+    書き込みスレッドからのcallFromThreadを、テストのスレッドで順に実行する。
+    """
+
+    def __init__(self):
+        import queue
+
+        self.calls = queue.Queue()
+
+    def callFromThread(self, function, *args):
+        self.calls.put((function, args))
+
+    def run_until(self, condition, timeout=10):
+        import time
+
+        deadline = time.monotonic() + timeout
+        while not condition():
+            (function, args) = self.calls.get(timeout=max(deadline - time.monotonic(), 0.001))
+            function(*args)
+
+
+@pytest.fixture
+def threaded_pipeline(engine, monkeypatch):
+    import threading
+    import twisted.internet
+    from twisted.internet import defer
+    import pipelines
+
+    reactor = FakeReactor()
+
+    def defer_to_thread(function, *args):
+        d = defer.Deferred()
+        threading.Thread(target=lambda: reactor.callFromThread(d.callback, function(*args))).start()
+        return d
+
+    monkeypatch.setattr(twisted.internet, 'reactor', reactor, raising=False)
+    monkeypatch.setattr(pipelines, 'threads', SimpleNamespace(deferToThread=defer_to_thread))
+    monkeypatch.setattr(pipelines, 'Session', sessionmaker(bind=engine))
+    pipeline = SQLAlchemyPipeline(batch_size=2, flush_interval=0.05, queue_size=2, search_index=False, compress=False)
+    spider = SimpleNamespace(skip_DB_count=0, unchanged_count=0, revision_count=0)
+    pipeline.open_spider(spider)
+    yield pipeline, reactor
+    if pipeline.writer.is_alive():
+        pipeline.queue.put(None)
+        pipeline.writer.join()
+
+
+def test_writer_thread_applies_backpressure_and_fires_every_deferred(threaded_pipeline, engine):
+    (pipeline, reactor) = threaded_pipeline
+    items = [make_item(f"https://news.yahoo.co.jp/{number}") for number in range(10)] + [make_item('https://news.yahoo.co.jp/3')]
+    fired = []
+    deferreds = [pipeline.process_item(item, pipeline.spider).addCallback(fired.append) for item in items]
+    assert pipeline.queue.qsize() <= 2 and pipeline.backlog
+    assert not fired
+    reactor.run_until(lambda: len(fired) == len(items))
+    assert fired == items
+    assert all(d.called for d in deferreds)
+    assert not pipeline.backlog
+    assert pipeline.spider.skip_DB_count == 1
+    assert stored_urls(engine) == {f"https://news.yahoo.co.jp/{number}" for number in range(10)}
+
+
+def test_close_spider_drains_the_backlog_before_stopping(threaded_pipeline, engine):
+    (pipeline, reactor) = threaded_pipeline
+    items = [make_item(f"https://news.yahoo.co.jp/{number}") for number in range(7)]
+    items[4]['title'] = None
+    fired = []
+    for item in items:
+        pipeline.process_item(item, pipeline.spider).addCallback(fired.append)
+    assert pipeline.backlog
+    closed = pipeline.close_spider(pipeline.spider)
+    reactor.run_until(lambda: closed.called)
+    assert not pipeline.writer.is_alive()
+    assert len(fired) == len(items)
+    assert stored_urls(engine) == {f"https://news.yahoo.co.jp/{number}" for number in (0, 1, 2, 3, 5, 6)}
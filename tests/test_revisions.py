@@ -0,0 +1,62 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import seen_urls
+from revisions import apply_diff, content_hash, iter_history, make_diff
+from seen_urls import SeenUrlIndex
+
+OLD = '政府は5日、経済対策を決定した。\n給付金を支給する。電気料金の補助を延長する。'
+
+
+@pytest.mark.parametrize('new', [
+    OLD,
+    OLD.replace('延長', '継続'),
+    '速報: ' + OLD,
+    OLD + '\n追記: 詳細は後日発表する。',
+    '全く異なる本文。',
+    '',
+])
+def test_diff_restores_the_old_body(new):
+    assert apply_diff(new, make_diff(new, OLD)) == OLD
+
+
+def test_diff_stores_only_changed_sentences():
+    new = OLD.replace('延長', '継続')
+    operations = json.loads(make_diff(new, OLD))
+    assert operations == [3, -1, '電気料金の補助を延長する。']
+
+
+def test_content_hash_depends_on_title_and_body():
+    assert content_hash('タイトル', '本文') == content_hash('タイトル', '本文')
+    assert content_hash('タイトル', '本文') != content_hash('タイトル本文', '')
+    assert content_hash(None, None) == content_hash('', '')
+
+
+def test_history_is_restored_newest_first():
+    first, second, latest = 'A。B。', 'A。C。', 'A。C。D。'
+    revisions = [
+        SimpleNamespace(created_at=2, title='t2', diff=make_diff(latest, second)),
+        SimpleNamespace(created_at=1, title='t1', diff=make_diff(second, first)),
+    ]
+    history = list(iter_history(SimpleNamespace(article=latest), revisions))
+    assert history == [(2, 't2', second), (1, 't1', first)]
+
+
+def test_revisited_urls_are_not_treated_as_seen():
+    index = SeenUrlIndex({'https://a', 'https://b'}, {'https://b'})
+    assert 'https://a' in index
+    assert 'https://b' not in index and index.is_revisit('https://b')
+    assert 'https://c' not in index and not index.is_revisit('https://c')
+    assert len(index) == 2
+
+
+def test_load_marks_recent_database_urls_for_revisit(monkeypatch):
+    monkeypatch.setattr(seen_urls, 'load_csv_urls', lambda path: {'https://a', 'https://b'})
+    monkeypatch.setattr(seen_urls, 'load_db_urls', lambda: {'https://b', 'https://c'})
+    monkeypatch.setattr(seen_urls, 'load_recent_db_urls', lambda days: {'https://c'})
+    assert SeenUrlIndex.load(use_csv=True, use_DB=True, revisit_days=0).revisit == set()
+    db_only = SeenUrlIndex.load(use_csv=False, use_DB=True, revisit_days=3)
+    assert 'https://b' in db_only and 'https://c' not in db_only
+    assert SeenUrlIndex.load(use_csv=True, use_DB=False, revisit_days=3).revisit == set()
@@ -0,0 +1,123 @@
+import asyncio
+import os
+
+import pytest
+
+import screenshot
+from screenshot import ScreenshotManager
+
+
+class FakePage:
+    def __init__(self, image=b'jpeg', closed=False):
+        self.image = image
+        self.closed = closed
+        self.viewport_size = {'width': 800}
+        self.screenshots = []
+
+    def is_closed(self):
+        return self.closed
+
+    async def screenshot(self, **kwargs):
+        self.screenshots.append(kwargs)
+        return self.image
+
+
+class Releases:
+    def __init__(self):
+        self.names = []
+
+    def __call__(self, name):
+        async def release():
+            self.names.append(name)
+        return release
+
+
+def capture_all(manager, pages, error=False):
+    releases = Releases()
+
+    async def run():
+        for (name, page) in pages.items():
+            await manager.capture(page, name, releases(name), error=error)
+        await manager.close()
+
+    asyncio.run(run())
+    return releases.names
+
+
+@pytest.mark.parametrize('mode, error, random_value, expected', [
+    ('off', True, 0.0, False),
+    ('off', False, 0.0, False),
+    ('errors', True, 0.99, True),
+    ('errors', False, 0.0, False),
+    ('sampled', True, 0.99, True),
+    ('sampled', False, 0.05, True),
+    ('sampled', False, 0.5, False),
+    ('always', False, 0.99, True),
+])
+def test_should_capture_follows_the_mode(monkeypatch, tmp_path, mode, error, random_value, expected):
+    monkeypatch.setattr(screenshot, 'SCREENSHOT_SAMPLE_RATE', 0.1)
+    monkeypatch.setattr(screenshot.random, 'random', lambda: random_value)
+    assert ScreenshotManager(mode, str(tmp_path)).should_capture(error) is expected
+
+
+def test_unknown_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ScreenshotManager('sometimes', str(tmp_path))
+
+
+@pytest.mark.parametrize('mode, error, saved', [
+    ('off', True, []),
+    ('errors', False, []),
+    ('errors', True, ['listing_1.jpg']),
+    ('always', False, ['listing_1.jpg']),
+])
+def test_capture_saves_only_when_the_mode_allows_and_always_releases(tmp_path, mode, error, saved):
+    manager = ScreenshotManager(mode, str(tmp_path / 'SS'))
+    page = FakePage()
+    assert capture_all(manager, {'listing_1': page}, error=error) == ['listing_1']
+    assert manager.saved_count == len(saved)
+    if saved:
+        assert os.listdir(tmp_path / 'SS') == saved
+        assert (tmp_path / 'SS' / 'listing_1.jpg').read_bytes() == b'jpeg'
+        assert page.screenshots[0]['clip'] == {'x': 0, 'y': 0, 'width': 800, 'height': screenshot.SCREENSHOT_MAX_HEIGHT}
+    else:
+        assert not (tmp_path / 'SS').exists() and page.screenshots == []
+
+
+def test_full_queue_drops_the_screenshot_and_releases_the_page(monkeypatch, tmp_path):
+    monkeypatch.setattr(screenshot, 'SCREENSHOT_QUEUE_SIZE', 2)
+    manager = ScreenshotManager('always', str(tmp_path))
+    pages = {f'listing_{number}': FakePage() for number in range(1, 5)}
+    released = capture_all(manager, pages)
+    # キューに入らなかった3件目以降は即座に解放され、キューの2件は保存後に解放される
+    assert released == ['listing_3', 'listing_4', 'listing_1', 'listing_2']
+    assert (manager.saved_count, manager.dropped_count) == (2, 2)
+    assert sorted(os.listdir(tmp_path)) == ['listing_1.jpg', 'listing_2.jpg']
+    assert pages['listing_3'].screenshots == [] and pages['listing_4'].screenshots == []
+
+
+def test_closed_page_is_released_without_saving(tmp_path):
+    manager = ScreenshotManager('errors', str(tmp_path))
+    assert capture_all(manager, {'article_1': FakePage(closed=True)}, error=True) == ['article_1']
+    assert manager.saved_count == 0
+    assert os.listdir(tmp_path) == []
+
+
+def test_retention_removes_the_oldest_files_over_the_size_limit(tmp_path):
+    old = tmp_path / 'old.jpg'
+    old.write_bytes(b'x' * 40)
+    os.utime(old, (0, 0))
+    manager = ScreenshotManager('always', str(tmp_path))
+    manager.max_total_bytes = 100
+    pages = {f'listing_{number}': FakePage(b'y' * 40) for number in range(1, 4)}
+    capture_all(manager, pages)
+    # 既存ファイルを含めて古い順に削除し、合計100バイト以内に収める
+    assert sorted(os.listdir(tmp_path)) == ['listing_2.jpg', 'listing_3.jpg']
+    assert [os.path.basename(path) for (path, _) in manager._files] == ['listing_2.jpg', 'listing_3.jpg']
+
+
+def test_retention_keeps_the_newest_file_even_if_it_is_too_large(tmp_path):
+    manager = ScreenshotManager('always', str(tmp_path))
+    manager.max_total_bytes = 10
+    capture_all(manager, {'listing_1': FakePage(b'z' * 40)})
+    assert os.listdir(tmp_path) == ['listing_1.jpg']
@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+import search
+from models import upgrade_schema
+
+ARTICLES = [
+    (1, '日銀が金利を据え置き', '日本銀行は金融政策決定会合で金利の据え置きを決めた。政府は歓迎した。'),
+    (2, '政府が経済対策', '政府は物価高に対応する経済対策を閣議決定した。日本銀行も注視している。'),
+    (3, '東京で初雪', '東京都心で初雪を観測した。平年より早い。'),
+]
+
+
+@pytest.fixture
+def connection(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'yahoo.db'}")
+    upgrade_schema(engine)
+    with engine.begin() as connection:
+        if not search.create_index(connection):
+            pytest.skip('FTS5のtrigramトークナイザーが使用できません')
+        for (article_id, title, body) in ARTICLES:
+            connection.execute(
+                text("INSERT INTO articles (id, title, article_number, post_date, url, article) VALUES (:id, :title, '1-1', '202406100903', :url, :body)"),
+                {'id': article_id, 'title': title, 'url': f'https://news.yahoo.co.jp/articles/{article_id}', 'body': body},
+            )
+        search.index_articles(connection, ARTICLES)
+        yield connection
+    engine.dispose()
+
+
+def test_search_matches_all_terms(connection):
+    hits = search.search(connection, '日本銀行 政府')
+    assert sorted(hit.id for hit in hits) == [1, 2]
+    assert all('【日本銀行】' in hit.snippet for hit in hits)
+    assert [hit.id for hit in search.search(connection, '日本銀行', newest=True)] == [2, 1]
+    assert search.search(connection, '経済対策 初雪') == []
+
+
+def test_short_terms_fall_back_to_substring_match(connection):
+    hits = search.search(connection, '初雪')
+    assert [hit.id for hit in hits] == [3]
+    assert hits[0].snippet.startswith('東京都心で【初雪】')
+    assert [hit.id for hit in search.search(connection, '閣議決定 政府')] == [2]
+
+
+def test_reindexing_replaces_the_entry(connection):
+    search.index_articles(connection, [(3, '東京で初雪', '東京都心で雪が積もった。')])
+    assert search.search(connection, '初雪を観測') == []
+    assert [hit.id for hit in search.search(connection, '雪が積もった')] == [3]
+
+
+@pytest.mark.parametrize('query', ['', '   ', '"', '100%', 'a_b'])
+def test_queries_are_escaped(connection, query):
+    assert search.search(connection, query) == []
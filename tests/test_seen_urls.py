@@ -0,0 +1,18 @@
+import seen_urls
+from seen_urls import SeenUrlIndex
+
+
+def test_contains_checks_the_loaded_urls():
+    index = SeenUrlIndex({'https://a', 'https://b'})
+    assert 'https://a' in index and 'https://b' in index
+    assert 'https://c' not in index
+    assert len(index) == 2
+    assert 'https://a' not in SeenUrlIndex()
+
+
+def test_load_uses_urls_saved_to_both_csv_and_database(monkeypatch):
+    monkeypatch.setattr(seen_urls, 'load_csv_urls', lambda path: {'https://a', 'https://b'})
+    monkeypatch.setattr(seen_urls, 'load_db_urls', lambda: {'https://b', 'https://c'})
+    assert SeenUrlIndex.load(use_csv=True, use_DB=True, revisit_days=0).urls == {'https://b'}
+    assert SeenUrlIndex.load(use_csv=True, use_DB=False, revisit_days=0).urls == {'https://a', 'https://b'}
+    assert SeenUrlIndex.load(use_csv=False, use_DB=True, revisit_days=0).urls == {'https://b', 'https://c'}
@@ -0,0 +1,37 @@
+import random
+
+from simhash import SimHashIndex, distance, simhash, to_signed, to_unsigned
+
+ARTICLE = '政府は5日、新たな経済対策を閣議決定した。物価高への対応として、低所得世帯への給付金の支給や電気・ガス料金の補助の延長を盛り込んだ。' * 3
+
+
+def test_similar_texts_are_close_and_different_texts_are_far():
+    updated = ARTICLE.replace('延長', '継続')
+    other = '大相撲初場所は14日、東京・両国国技館で初日を迎えた。横綱は白星発進した。' * 3
+    assert distance(simhash(ARTICLE), simhash(updated)) <= 6
+    assert distance(simhash(ARTICLE), simhash(other)) > 12
+
+
+def test_whitespace_and_width_do_not_change_the_hash():
+    assert simhash(ARTICLE) == simhash(ARTICLE.replace('5日', '５日').replace('。', '。\n '))
+
+
+def test_signed_round_trip():
+    for value in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1):
+        assert -(1 << 63) <= to_signed(value) < 1 << 63
+        assert to_unsigned(to_signed(value)) == value
+
+
+def test_index_finds_every_neighbour_within_max_distance():
+    rng = random.Random(0)
+    index = SimHashIndex(3)
+    base = rng.getrandbits(64)
+    index.add(base, 'base')
+    for _ in range(50):
+        index.add(rng.getrandbits(64), 'noise')
+    for bits in ([], [0], [5, 40], [1, 30, 63]):
+        value = base
+        for bit in bits:
+            value ^= 1 << bit
+        assert index.nearest(value) == ('base', len(bits))
+    assert len(index) == 51
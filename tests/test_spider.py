@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+from scrapy.http import Request
+
+from conftest import run_errback
+from const import LISTING_LOOKAHEAD
+
+
+def article(spider, number, page_number=1, **meta):
+    return spider._build_request(f'https://news.yahoo.co.jp/pickup/{number}', page_type='headline', page_number=page_number, article_number=f'{page_number}-{number}', **meta)
+
+
+def test_deferred_listing_is_released_when_the_page_articles_finish(spider):
+    listing = spider._build_request('https://news.yahoo.co.jp/topics/top-picks?page=2', page_type='listing', page_number=2)
+    spider.pending_articles = {page_number: 2 for page_number in range(1, LISTING_LOOKAHEAD + 1)}
+    spider.deferred_listing_request = listing
+    assert spider._finish_article({'page_number': 1}) == []
+    assert spider.pending_articles[1] == 1
+    assert spider._finish_article({'page_number': 1}, failed=True) == [listing]
+    assert 1 not in spider.pending_articles and spider.deferred_listing_request is None
+
+
+def test_budget_dropped_article_still_finishes_the_page(spider):
+    listing = spider._build_request('https://news.yahoo.co.jp/topics/top-picks?page=2', page_type='listing', page_number=2)
+    spider.pending_articles = {page_number: 1 for page_number in range(1, LISTING_LOOKAHEAD + 1)}
+    spider.deferred_listing_request = listing
+    dropped = article(spider, 1)
+    dropped.meta['budget_exceeded'] = True
+    assert run_errback(spider, dropped) == [listing]
+    assert 1 not in spider.pending_articles
+    assert spider.budget_skip_count == 1 and spider.error_count == 0
+
+
+def test_budget_dropped_requests_are_acked_in_the_frontier(spider):
+    acked = []
+    spider.frontier = SimpleNamespace(ack=lambda frontier_id, failed: acked.append((frontier_id, failed)))
+    spider._lease_requests = lambda limit: []
+    for (page_type, frontier_id) in (('headline', 1), ('listing', 2)):
+        request = spider._build_request(f'https://news.yahoo.co.jp/{frontier_id}', page_type=page_type, frontier_id=frontier_id)
+        request.meta['budget_exceeded'] = True
+        assert run_errback(spider, request) == []
+    assert acked == [(1, True), (2, True)]
+
+
+def test_budget_dropped_probe_releases_the_held_requests(spider):
+    held = [article(spider, number) for number in (2, 3)]
+    spider.probe_held = list(held)
+    probe = article(spider, 1, selector_probe=True)
+    probe.meta['budget_exceeded'] = True
+    outputs = run_errback(spider, probe)
+    assert outputs == held and all(isinstance(output, Request) for output in outputs)
+    assert spider.probe_held == [] and 'article' not in spider.probe_pending
+
+
+def test_retry_rebuilds_the_request_from_its_own_meta(spider):
+    from scrapy.settings import Settings
+    from const import PRIORITY_RETRY
+
+    spider.settings = Settings({'RETRY_TIMES': 3})
+    first = spider._build_request('https://news.yahoo.co.jp/articles/1', page_type='article', page_number=2, title='見出し1', article_number='2-5', post_date='202406100903', url='https://news.yahoo.co.jp/pickup/1', frontier_id=7, selector_probe=True)
+    second = article(spider, 9, page_number=4, retry_times=1)
+    (retry_second,) = run_errback(spider, second)
+    spider.fetch_count = 99
+    (retry_first,) = run_errback(spider, first)
+    expected = {'page_type': 'article', 'page_number': 2, 'title': '見出し1', 'article_number': '2-5', 'post_date': '202406100903',
+                'url': 'https://news.yahoo.co.jp/pickup/1', 'frontier_id': 7, 'selector_probe': True, 'retry_times': 1}
+    assert {key: retry_first.meta[key] for key in expected} == expected
+    assert retry_first.url == first.url and retry_first.callback == spider.parse_article
+    assert (retry_second.meta['page_number'], retry_second.meta['article_number'], retry_second.meta['retry_times']) == (4, '4-9', 2)
+    assert retry_second.callback == spider.parse_headline
+    assert retry_first.priority == retry_second.priority == PRIORITY_RETRY
+
+
+def test_exhausted_retries_store_an_error_item(spider):
+    outputs = run_errback(spider, article(spider, 1, retry_times=1))
+    assert [dict(output) for output in outputs] == [{'title': 'Error', 'article_number': 'Error', 'post_date': 'Error', 'url': 'https://news.yahoo.co.jp/pickup/1', 'article': 'Error'}]
+    assert spider.error_count == 1
+
+
+def test_retry_backoff_is_exponential_capped_and_jittered(monkeypatch):
+    import random
+    from const import RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX
+    from spiders.news import retry_backoff
+
+    monkeypatch.setattr(random, 'uniform', lambda low, high: high)
+    assert [retry_backoff(retry_times) for retry_times in range(3)] == [RETRY_BACKOFF_BASE * 2 ** n for n in range(3)]
+    assert retry_backoff(30) == RETRY_BACKOFF_MAX
+    monkeypatch.setattr(random, 'uniform', lambda low, high: low)
+    assert retry_backoff(1) == RETRY_BACKOFF_BASE
+    assert retry_backoff(30) == RETRY_BACKOFF_MAX / 2
+    monkeypatch.undo()
+    delays = {retry_backoff(2) for _ in range(20)}
+    assert len(delays) > 1 and all(RETRY_BACKOFF_BASE * 2 <= delay <= RETRY_BACKOFF_BASE * 4 for delay in delays)
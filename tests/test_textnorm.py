@@ -0,0 +1,50 @@
+import pytest
+
+from textnorm import legacy_list2str, normalize_text
+
+
+def test_drops_whitespace_between_japanese_text_nodes():
+    nodes = ['　東京都は18日、感染者を発表した。\n', '\n', '　専門家は「警戒が必要だ」と話している。\n']
+    assert normalize_text(nodes, keep_paragraphs=False, nfkc=False) == '東京都は18日、感染者を発表した。専門家は「警戒が必要だ」と話している。'
+
+
+@pytest.mark.parametrize('space', [' ', '　', '\n', '\t', '\r\n', '\xa0', '  \n　'])
+def test_inner_whitespace_is_removed_unless_between_ascii_words(space):
+    nodes = [f'日銀は{space}金利を据え置いた。The Bank{space}of Japan{space}kept rates.{space}市場は{space}1{space}2']
+    assert normalize_text(nodes, keep_paragraphs=False, nfkc=False) == '日銀は金利を据え置いた。The Bank of Japan kept rates.市場は1 2'
+
+
+def test_english_only_text_keeps_spaces_between_nodes():
+    nodes = ['The ', 'Bank', '\n of  Japan\n']
+    assert normalize_text(nodes, keep_paragraphs=False, nfkc=False) == 'The Bank of Japan'
+
+
+def test_invisible_characters_are_removed_and_joiners_kept():
+    assert normalize_text(['東京​都﻿', '👨‍👩'], keep_paragraphs=False, nfkc=False) == '東京都👨‍👩'
+
+
+def test_keep_paragraphs_collapses_blank_lines():
+    nodes = ['　第1段落です。\n', '\n\n', '　The Bank  of Japan\r\n', '\t第3段落です。 ']
+    assert normalize_text(nodes, keep_paragraphs=True, nfkc=False) == '第1段落です。\nThe Bank of Japan\n第3段落です。'
+
+
+def test_nfkc_is_opt_in():
+    nodes = ['ＡＢＣ銀行は１８日、 発表した。']
+    assert normalize_text(nodes, keep_paragraphs=False, nfkc=False) == 'ＡＢＣ銀行は１８日、 発表した。'
+    assert normalize_text(nodes, keep_paragraphs=False, nfkc=True) == 'ABC銀行は18日、発表した。'
+    assert normalize_text(['ｶﾞｲﾄﾞ'], keep_paragraphs=False, nfkc=True) == 'ガイド'
+
+
+def test_default_does_not_change_full_width_characters():
+    assert normalize_text(['ＡＢＣ１２３　ｶﾅ']) == 'ＡＢＣ１２３ｶﾅ'
+
+
+def test_matches_legacy_list2str_for_japanese_text():
+    nodes = ['東京都は18日、\n', '感染者を発表した。\n', '専門家は話している。']
+    assert normalize_text(nodes, keep_paragraphs=False, nfkc=False) == legacy_list2str(nodes)
+
+
+@pytest.mark.parametrize('nodes', [[], [''], ['\n', '　', ' ']])
+def test_empty_input(nodes):
+    assert normalize_text(nodes, keep_paragraphs=False, nfkc=False) == ''
+    assert normalize_text(nodes, keep_paragraphs=True, nfkc=False) == ''
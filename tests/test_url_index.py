@@ -0,0 +1,80 @@
+import csv
+import os
+
+from partitions import CSV_HEADER
+from url_index import UrlIndex
+
+
+def write_rows(path, urls, header=True):
+    with open(path, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if header:
+            writer.writerow(CSV_HEADER)
+        for url in urls:
+            writer.writerow(['タイトル', '1', '202401050903', url, '本文'])
+
+
+def crash(index):
+    """
+    追記ログを索引ファイルに統合せずに終了した状態(異常終了)にする。
+    """
+    index._log.close()
+    index._close_mmap()
+
+
+def test_index_finds_stored_urls_and_merges_added_urls_on_close(tmp_path):
+    path = str(tmp_path / 'news.csv')
+    write_rows(path, ['https://news.yahoo.co.jp/a'])
+    index = UrlIndex(path)
+    assert 'https://news.yahoo.co.jp/a' in index
+    assert 'https://news.yahoo.co.jp/b' not in index
+    write_rows(path, ['https://news.yahoo.co.jp/b'], header=False)
+    index.add('https://news.yahoo.co.jp/b')
+    assert 'https://news.yahoo.co.jp/b' in index
+    index.close()
+
+    assert os.path.getsize(f"{path}.idx.log") == 0
+    reopened = UrlIndex(path, readonly=True)
+    assert 'https://news.yahoo.co.jp/a' in reopened
+    assert 'https://news.yahoo.co.jp/b' in reopened
+    assert len(reopened) == 2
+    reopened.close()
+
+
+def test_urls_whose_rows_were_lost_in_a_crash_are_not_treated_as_stored(tmp_path):
+    path = str(tmp_path / 'news.csv')
+    write_rows(path, ['https://news.yahoo.co.jp/a'])
+    UrlIndex(path).close()
+
+    index = UrlIndex(path)
+    index.add('https://news.yahoo.co.jp/lost') # CSVファイルの行は書き込みバッファに残ったまま失われた
+    crash(index)
+
+    reopened = UrlIndex(path)
+    assert 'https://news.yahoo.co.jp/lost' not in reopened
+    assert 'https://news.yahoo.co.jp/a' in reopened
+    assert os.path.getsize(f"{path}.idx.log") == 0
+    reopened.close()
+
+
+def test_rows_written_before_a_crash_are_kept(tmp_path):
+    path = str(tmp_path / 'news.csv')
+    write_rows(path, ['https://news.yahoo.co.jp/a'])
+    index = UrlIndex(path)
+    write_rows(path, ['https://news.yahoo.co.jp/b'], header=False)
+    index.add('https://news.yahoo.co.jp/b')
+    crash(index)
+
+    reopened = UrlIndex(path, readonly=True)
+    assert 'https://news.yahoo.co.jp/b' in reopened
+    reopened.close()
+
+
+def test_index_is_rebuilt_when_the_csv_changed(tmp_path):
+    path = str(tmp_path / 'news.csv')
+    write_rows(path, ['https://news.yahoo.co.jp/a'])
+    UrlIndex(path).close()
+    write_rows(path, ['https://news.yahoo.co.jp/edited'], header=False) # 手動での編集
+    index = UrlIndex(path, readonly=True)
+    assert 'https://news.yahoo.co.jp/edited' in index
+    index.close()
@@ -0,0 +1,94 @@
+"""
+Playwrightのページ(タブ)の再利用と不要なリソースの読み込み抑制を行うモジュール。
+
+- PagePool: コールバックで使い終わったページを閉じずに保持し、次のリクエストで再利用するプール
+- should_abort_request: 画像・動画・フォント・広告・解析タグ等のリクエストを中断するかどうかを判定する関数
+  (settings.pyのPLAYWRIGHT_ABORT_REQUESTに指定して使用します)
+"""
+from common_func import setup_logger
+from const import BLOCKED_RESOURCE_TYPES, BLOCKED_URL_KEYWORDS, LOG_LEVEL, LOG_FILE
+
+# ロガーの設定
+logger = setup_logger('news', LOG_FILE, LOG_LEVEL)
+
+
+def should_abort_request(request):
+    """
+    Playwrightのリクエストを中断するかどうかを判定する。
+    記事の本文取得に不要な画像・動画・フォントと、広告・解析タグのリクエストを中断する。
+
+    :param request: Playwrightのリクエスト
+    :return: bool: 中断する場合はTrue
+    """
+    if request.resource_type in BLOCKED_RESOURCE_TYPES:
+        return True
+    return any(keyword in request.url for keyword in BLOCKED_URL_KEYWORDS)
+
+
+class PagePool:
+    """
+    使い終わったPlaywrightのページを保持し、次のリクエストで再利用するプール。
+
+    ページを新規作成するとタブの生成やスクリプトの初期化が毎回発生するため、
+    コールバックの処理が終わったページは閉じずにプールへ戻し、次のリクエストに割り当てる。
+    プールが上限に達している場合や、ページが既に閉じられている場合はページを閉じる。
+
+    Attributes:
+        size (int): プールに保持するページ数の上限
+        contexts (list): 新規ページを作成するブラウザコンテキスト名のリスト
+        idle_pages (list): 再利用可能なページと、そのページのコンテキスト名のタプルのリスト
+        reuse_count (int): ページを再利用した回数
+    """
+
+    def __init__(self, size, contexts):
+        self.size = size
+        self.contexts = contexts
+        self.idle_pages = []
+        self.reuse_count = 0
+        self._next_context = 0
+
+    def acquire(self):
+        """
+        再利用可能なページを取り出す。
+
+        :return: tuple: (ページ, コンテキスト名)。再利用可能なページが無い場合は(None, 新規作成に使うコンテキスト名)
+        """
+        while self.idle_pages:
+            page, context_name = self.idle_pages.pop()
+            if not page.is_closed():
+                self.reuse_count += 1
+                return page, context_name
+        # 新規作成するページはコンテキストに均等に割り振る
+        context_name = self.contexts[self._next_context % len(self.contexts)]
+        self._next_context += 1
+        return None, context_name
+
+    async def release(self, page, context_name):
+        """
+        使い終わったページをプールに戻す。プールが上限に達している場合はページを閉じる。
+
+        :param page: 使い終わったページ
+        :param context_name: ページのブラウザコンテキスト名
+        """
+        if page.is_closed():
+            return
+        if len(self.idle_pages) >= self.size:
+            await page.close()
+            return
+        try:
+            # 前のページのスクリプトやタイマーを止めるため空白ページに移動しておく
+            await page.goto('about:blank')
+        except Exception as e:
+            logger.warning(f"[page_pool]ページを再利用できないため閉じます。エラー内容: {e}")
+            await page.close()
+            return
+        self.idle_pages.append((page, context_name))
+
+    async def close(self):
+        """
+        プールに保持している全てのページを閉じる。
+        """
+        while self.idle_pages:
+            page, _ = self.idle_pages.pop()
+            if not page.is_closed():
+                await page.close()
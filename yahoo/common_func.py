@@ -2,7 +2,7 @@
 common_func.py
 共通の関数をまとめたモジュール。
 このモジュールは以下の関数を含みます:
-- list2str(list): リストを文字列に変換します。
+- list2str(list): リストを正規化した文字列に変換します。
 - str2int(text): 文字列を整数に変換します。
 - search_word(text, word): 文字列から指定した単語があればtrueを返します。
 - convert_date(refDate): 指定された日時文字列をMMDDhhmm形式に変換します。
@@ -14,18 +14,19 @@ common_func.py
 import requests
 import json
 from datetime import datetime
-import pytz
 import logging
 import logging.handlers
 from const import SLACK_WEBHOOK_URL
+import dates
+from textnorm import normalize_text
 
 def list2str(list):
     """
-      リストを文字列に変換する。リストの各要素を連結し、先頭と末尾の空白を削除する。
+      リストを文字列に変換する。リストの各要素を連結し、空白を正規化する(textnorm.py参照)。
     :param list: リスト
     :return: 文字列
     """
-    return ''.join(list).strip().replace('\n', '').replace(' ', '')
+    return normalize_text(list)
 
 def str2int(text):
     """
@@ -71,7 +72,7 @@ def get_today():
 
     :return str: 現在の日付をMMDD形式で表した文字列
     """
-    today = datetime.now(pytz.timezone('Asia/Tokyo'))
+    today = datetime.now(dates.TIMEZONE)
     return today.strftime('%m%d')
 
 def get_this_year():
@@ -80,7 +81,7 @@ def get_this_year():
 
     :return str: 現在の年4桁
     """
-    today = datetime.now(pytz.timezone('Asia/Tokyo'))
+    today = datetime.now(dates.TIMEZONE)
     return today.strftime('%Y')
 
 def post_slack(text="test投稿"):
@@ -0,0 +1,71 @@
+"""
+記事の本文をzstdで圧縮・展開するモジュール(zstandardパッケージが必要)。
+
+ニュース記事は配信元のフッター等の定型文が多いため、保存済の記事から学習した辞書を使用して圧縮する。
+辞書はデータベースのcompression_dictsテーブルにバージョン(ID)付きで保存し(models.pyのCompressionDict参照)、
+圧縮した本文には使用した辞書のIDを記録する。辞書のIDが無い本文は辞書を使用せずに圧縮したものとして展開する。
+"""
+from const import ZSTD_LEVEL
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 辞書のID毎の圧縮器・展開器
+_compressors = {}
+_decompressors = {}
+
+
+def available():
+    """
+    zstdでの圧縮が使用できるかどうかを返す。
+
+    :return: bool
+    """
+    return zstandard is not None
+
+
+def train_dictionary(samples, size):
+    """
+    記事の本文から圧縮用の辞書を学習する。
+
+    :param samples: 記事の本文のリスト
+    :param size: 辞書のサイズ(バイト)
+    :return: bytes: 辞書
+    """
+    return zstandard.train_dictionary(size, [sample.encode('utf-8') for sample in samples]).as_bytes()
+
+
+def compress(text, dict_id=None, dict_data=None):
+    """
+    記事の本文を圧縮する。
+
+    :param text: 記事の本文
+    :param dict_id: 辞書のID。辞書を使用しない場合はNone
+    :param dict_data: 辞書(dict_idに対応するもの)
+    :return: bytes
+    """
+    compressor = _compressors.get(dict_id)
+    if compressor is None:
+        dictionary = zstandard.ZstdCompressionDict(dict_data) if dict_data else None
+        compressor = _compressors[dict_id] = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dictionary)
+    return compressor.compress(text.encode('utf-8'))
+
+
+def decompress(data, dict_id=None, load_dictionary=None):
+    """
+    圧縮した記事の本文を展開する。
+
+    :param data: 圧縮した本文
+    :param dict_id: 圧縮に使用した辞書のID
+    :param load_dictionary: 辞書のIDから辞書を読み込む関数(初回のみ呼び出す)
+    :return: str
+    """
+    if zstandard is None:
+        raise RuntimeError("圧縮された記事の本文の展開にはzstandardが必要です")
+    decompressor = _decompressors.get(dict_id)
+    if decompressor is None:
+        dictionary = zstandard.ZstdCompressionDict(load_dictionary(dict_id)) if dict_id is not None else None
+        decompressor = _decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=dictionary)
+    return decompressor.decompress(data).decode('utf-8')
@@ -6,13 +6,34 @@
 - TOP_PICS_URL: トップニュースのピックアップされた記事のURLです。
 - item selector: スクレイピングした記事のタイトル、投稿日、URLを取得するためのCSSセレクタです。
 - other selector: スクレイピング中に使用するCSSセレクタです。
+- HTTP_FIRST_SELECTORS: HTTPで取得したページをそのまま使用できるか判定するためのセレクタです。
+- SELECTOR_CHAINS: 項目毎のセレクターの候補です。先頭のセレクターが一致しない場合は次の候補を使用します。
+- SELECTOR_PROBE, SELECTOR_PROBE_REQUIRED: 最初の一覧ページ・記事ページでセレクターを確認し、一致しない場合に取得を中止する設定値です。
+- IN_PAGE_EXTRACTION: 記事の本文をブラウザのページ内で取得するかどうかを指定します。
 - TIMEOUT: リクエストのタイムアウト時間（ミリ秒）です。
+- PRIORITY_*, LISTING_LOOKAHEAD: リクエストの優先度と、一覧ページを先行して取得するページ数です。
+- RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX: リトライまでの待機秒数(指数バックオフ)の基準値と上限です。
+- PAGE_POOL_SIZE, PAGE_POOL_CONTEXTS: Playwrightのページを再利用する際の設定値です。
+- BLOCKED_RESOURCE_TYPES, BLOCKED_URL_KEYWORDS: 読み込みを中断するリソースの種類と広告・解析タグのURLです。
 - SLACK_WEBHOOK_URL: SlackのWebhook URLです。slack通知用に使用します。
+- FRONTIER_*: 複数ワーカーで共有するフロンティアの貸し出し件数・期限・回数の上限と、ドメイン毎のリクエスト間隔です。
+- CACHE_TTL, CACHE_MAX_MB: ページキャッシュの有効期限と合計サイズの上限です。
+- SCREENSHOT_*: スクリーンショットの取得方針と保存形式です。
+- NEAR_DUPLICATE_*: 本文が類似する記事(重複記事)の検出の設定値です。
 - TARGET_TODAY: 当日の記事のみを対象とするかどうかを指定します。
+- SKIP_SEEN_ARTICLES: 保存済の記事へのリクエストを省略するかどうかを指定します。
+- REVISIT_DAYS: 保存済の記事のうち、更新の有無を確認するために再取得する記事の投稿日からの日数です。
+- TEXT_KEEP_PARAGRAPHS, TEXT_NFKC: 記事の本文の正規化の設定値です。
 - LOG_LEVEL: ログの出力レベルです。
 - LOG_FILE: ログファイルのパスです。
 - CSV_FILE: CSVファイルのパスです。
+- CSV_PARTITION_DIR, CSV_COMPRESSION, CSV_BUFFER_SIZE, CSV_FLUSH_INTERVAL, CSV_MAX_OPEN_PARTITIONS: 投稿日毎に分割・圧縮したCSVファイルの設定値です。
+- PARQUET_*: 投稿日毎に分割したParquetファイルの設定値です。
 - DB_TYPE: データベースの種類を指定します。SQLiteまたはMySQLを選択できます。
+- DB_BATCH_SIZE, DB_FLUSH_INTERVAL, DB_QUEUE_SIZE: データベースにまとめて保存する件数と間隔(秒)、書き込みスレッドのキューの上限です。
+- DB_COMPRESS_ARTICLES, ZSTD_*: データベースに保存する記事の本文をzstdで圧縮する際の設定値です。
+- SEARCH_INDEX_ENABLED: データベースに保存した記事を全文検索の索引に登録するかどうかを指定します。
+- SQLITE_PERFORMANCE_PROFILE, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE: SQLiteの接続時に適用する高速化の設定値です。
 - SQLITE_PATH: SQLiteデータベースファイルのパスです。
 - MYSQL_DB_USER, MYSQL_PASSWORD, MYSQL_HOST, MYSQL_DATABASE: MySQLデータベース接続情報です。
 - MYSQL_PATH: MySQLデータベース接続用のURLです。
@@ -45,18 +66,133 @@ ARTICLE_CONTENT_SELECTOR = 'div.article_body *::text'
 HEADLINE_CONTENT_SELECTOR = 'section.cOJYgv *::text'
 NEXT_PAGE_SELECTOR = 'ul.jOUhIY > li:last-of-type > a::attr(href)'
 
+#項目毎のセレクターの候補(先頭から順に試し、最初に一致したものを使用する:extraction.py参照)。
+#先頭はサイトの更新で変わるハッシュ化されたクラス名を含むセレクター、以降は構造・属性に基づく予備のセレクター。
+#listing_root、article_rootはwait_for_selectorで待機するセレクター(候補のいずれかが表示されるまで待機する)。
+SELECTOR_CHAINS = {
+    'listing_root': [TOP_PICS_SELECTOR, 'main ul a[href*="/pickup/"]'],
+    'articles': [ARTICLES_SELECTOR, 'li[class*=newsFeed_item]', 'main ul > li:has(a[href*="/pickup/"])'],
+    'title': [TITLE, 'div[class*=newsFeed_item_title]::text', 'a[href*="/pickup/"] div:first-child::text'],
+    'post_date': [POST_DATE, 'time.newsFeed_item_date::text', 'time::text'],
+    'article_link': [ARTICLE_LINK, 'a[href*="/pickup/"]::attr(href)'],
+    'total_articles': [TOTAL_ARTICLES_SELECTOR, 'div#uamods-topics span:contains("件")::text'],
+    'next_page': [NEXT_PAGE_SELECTOR, 'a:contains("次へ")::attr(href)'],
+    'article_root': [ARTICLE_SELECTOR, 'article'],
+    'link_to_article': [LINK_TO_ARTICLE_SELECTOR, 'article a[href*="/articles/"]', 'a[data-cl-params*="_cl_link:more"]'],
+    'article_content': [ARTICLE_CONTENT_SELECTOR, 'div[class*=article_body] *::text', 'article p *::text'],
+    'headline_content': [HEADLINE_CONTENT_SELECTOR, 'article[id*=uamods] p *::text'],
+}
+
+#Trueの場合、最初の一覧ページと最初の記事でセレクターを確認してから残りの記事を取得する。
+#先頭のセレクターが一致しない場合は一致した予備のセレクターに切り替え、必須の項目がいずれも一致しない場合は取得を中止する。
+SELECTOR_PROBE = True
+#ページの種類毎の必須の項目(タプルの場合はいずれか1つが一致すれば良い)
+SELECTOR_PROBE_REQUIRED = {
+    'listing': ['articles', 'title', 'post_date', 'article_link'],
+    'headline': [('link_to_article', 'headline_content')],
+    'article': ['article_content'],
+}
+
+#HTTP優先取得で確認するセレクター(ページの種類毎)。全て存在する場合はブラウザでのレンダリングを省略する。
+#タプルの場合はいずれか1つが存在すれば良い。
+HTTP_FIRST_SELECTORS = {
+    'listing': [TOP_PICS_SELECTOR, ARTICLES_SELECTOR, TOTAL_ARTICLES_SELECTOR],
+    'headline': [ARTICLE_SELECTOR, (LINK_TO_ARTICLE_SELECTOR, HEADLINE_CONTENT_SELECTOR)],
+    'article': [ARTICLE_SELECTOR, ARTICLE_CONTENT_SELECTOR],
+}
+
+#Trueの場合、Playwrightで取得した記事の本文は1回のpage.evaluateでテキストノードのみを取得する(extraction.py参照)。
+#Falseの場合はレスポンスのHTMLから取得する。
+IN_PAGE_EXTRACTION = False
+
 TIMEOUT = 90000
+
+#リクエストの優先度(数値が大きいほど先に処理される)。一覧ページ、記事ページ、リトライの順に処理する。
+PRIORITY_LISTING = 20
+PRIORITY_ARTICLE = 10
+PRIORITY_RETRY = -10
+#リトライまでの待機秒数(指数バックオフ)の基準値と上限
+RETRY_BACKOFF_BASE = 2
+RETRY_BACKOFF_MAX = 60
+#記事の取得が完了していない一覧ページがこの数に達した場合、次の一覧ページの取得を保留する
+LISTING_LOOKAHEAD = 3
+
+#ページの再利用とリソースの読み込み抑制(browser.py参照)
+PAGE_POOL_SIZE = 4 # 再利用のために保持するページ数の上限
+PAGE_POOL_CONTEXTS = ['pool-1', 'pool-2'] # ページを作成するブラウザコンテキスト名
+#読み込みを中断するリソースの種類とURLに含まれるキーワード(広告・解析タグ)
+BLOCKED_RESOURCE_TYPES = ('image', 'media', 'font')
+BLOCKED_URL_KEYWORDS = (
+    'doubleclick.net', 'googlesyndication.com', 'googletagmanager.com', 'google-analytics.com',
+    'amazon-adsystem.com', 'criteo.', 'scorecardresearch.com', 'yjtag.jp', 'yads.yahoo.co.jp',
+    'ads.yahoo.co.jp', 'ybx.yahoo.co.jp', 'clorder.yahoo.co.jp',
+)
 SLACK_WEBHOOK_URL = os.getenv('SLACK_WEBHOOK_URL')
 
+#複数ワーカーで共有するフロンティアの設定(frontier.py参照)
+FRONTIER_URI = 'sqlite:///frontier.db' # run_scrapy.pyで--workersを指定した場合の既定のフロンティア
+FRONTIER_LEASE_BATCH = 4 # 1回に貸し出しを受けるURLの件数
+FRONTIER_LEASE_SECONDS = 10 * 60 # 貸し出し期限(秒)。期限切れのURLは他のワーカーに貸し出される
+FRONTIER_MAX_ATTEMPTS = 3 # URL毎の貸し出し回数の上限。上限に達しても完了しなかったURLは取得不能(dead)とする。0の場合は無制限
+FRONTIER_POLITENESS_INTERVAL = 0.5 # 全ワーカー合計でのドメイン毎のリクエスト間隔(秒)
+
+#ページキャッシュの設定(httpcache.py参照)
+#ページの種類毎のキャッシュの有効期限(秒)。一覧ページは短く、記事ページは長く設定する。
+CACHE_TTL = {
+    'listing': 5 * 60,
+    'headline': 7 * 24 * 60 * 60,
+    'article': 7 * 24 * 60 * 60,
+}
+CACHE_MAX_MB = 1024 # キャッシュの合計サイズの上限(MB)
+
+#スクリーンショットの設定(screenshot.py参照)
+SCREENSHOT_MODE = 'errors' # 'off', 'errors', 'sampled', 'always'のいずれか
+SCREENSHOT_SAMPLE_RATE = 0.1 # sampledの場合に一覧ページのスクリーンショットを取得する割合
+SCREENSHOT_DIR = 'SS'
+SCREENSHOT_FORMAT = 'jpeg' # 'jpeg'または'webp'(webpはPillowが必要)
+SCREENSHOT_QUALITY = 60
+SCREENSHOT_MAX_HEIGHT = 3000 # 保存する画像の高さの上限(px)
+SCREENSHOT_QUEUE_SIZE = 8 # 取得待ちにできるスクリーンショットの上限
+SCREENSHOT_MAX_TOTAL_MB = 200 # 保存先フォルダの合計サイズの上限(MB)
+
 #TARGET_TODAYがTrueの場合、当日の記事のみを対象とする。Falseの場合は全件取得する。
 TARGET_TODAY = False
 
+#Trueの場合、保存済の記事はリクエストを送信せずにスキップする(seen_urls.py参照)
+SKIP_SEEN_ARTICLES = True
+#1以上の場合、直近REVISIT_DAYS日に投稿された保存済の記事はスキップせずに再取得し、更新された記事は更新履歴を保存する(DB使用時のみ。revisions.py参照)
+#再取得する記事はページキャッシュを使用しない
+REVISIT_DAYS = 0
+
+#本文が類似する記事(重複記事)の検出(pipelines.pyのNearDuplicatePipeline参照)
+NEAR_DUPLICATE_MODE = 'mark' # 'mark'(duplicate_ofに元の記事を記録して保存)、'skip'(保存しない)、'off'のいずれか
+NEAR_DUPLICATE_THRESHOLD = 0.9 # 重複とみなす類似度(1 - SimHashのハミング距離 / 64)。0.9の場合は距離6以下
+NEAR_DUPLICATE_MIN_LENGTH = 50 # 判定対象とする本文の最小文字数
+NEAR_DUPLICATE_WINDOW_DAYS = 30 # 判定に使用する保存済の記事の期間(日)。0の場合は全件
+
+#記事の本文の正規化(textnorm.py参照)
+TEXT_KEEP_PARAGRAPHS = False # Trueの場合は段落の区切りを改行として残す
+TEXT_NFKC = False # Trueの場合はNFKC正規化(全角英数字の半角化等)を行う。保存する本文と、本文から計算するハッシュ・SimHash・更新履歴の差分が変わるため既定では行わない
+
 # ログの設定
 LOG_LEVEL = 'INFO'
 LOG_FILE = 'scrapy.log'
 
 #csvのファイル名
 CSV_FILE = 'yahoo_news.csv'
+#投稿日毎に分割・圧縮したCSVファイルの設定(pipelines.pyのPartitionedCsvPipeline参照)
+CSV_PARTITION_DIR = 'yahoo_news' # yahoo_news/YYYY/MM/DD.csv.gzの形式で保存する
+CSV_COMPRESSION = 'gzip' # 'gzip', 'zstd'(zstandardが必要)またはNone(無圧縮)
+CSV_BUFFER_SIZE = 1024 * 1024 # 書き込みバッファのサイズ(バイト)
+CSV_FLUSH_INTERVAL = 30 # バッファの内容をファイルに書き込む間隔(秒)
+CSV_MAX_OPEN_PARTITIONS = 8 # 同時に開いておくファイル数の上限
+
+#Parquetファイルの設定(pipelines.pyのParquetPipeline参照。pyarrowが必要)
+PARQUET_DIR = 'yahoo_news_parquet' # yahoo_news_parquet/year=YYYY/month=MM/day=DD/に保存する
+PARQUET_BATCH_SIZE = 1000 # RecordBatchに変換する件数
+PARQUET_ROW_GROUP_SIZE = 10000 # 1つの行グループの件数
+PARQUET_COMPRESSION = 'zstd'
+PARQUET_DICTIONARY_COLUMNS = ['post_date', 'posted_at'] # 辞書エンコーディングで保存する列
 
 #SQLiteかMYSQLかを選択
 # DB_TYPE="MYSQL"
@@ -65,6 +201,22 @@ DB_TYPE="SQLITE"
 #SQLiteのパス
 DB_FILE = 'yahoo.db'
 SQLITE_PATH = f"sqlite:///{DB_FILE}"
+#SQLiteの接続時にWAL、synchronous=NORMAL等の高速化の設定を適用する場合はTrue(models.pyのapply_sqlite_profile参照)
+SQLITE_PERFORMANCE_PROFILE = False
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024 # メモリマップするサイズ(バイト)
+SQLITE_CACHE_SIZE = 64 * 1024 # ページキャッシュのサイズ(KB)
+#データベースへの保存はDB_BATCH_SIZE件ごと、またはDB_FLUSH_INTERVAL秒ごとにまとめて行う(pipelines.pyのSQLAlchemyPipeline参照)
+DB_BATCH_SIZE = 100
+DB_FLUSH_INTERVAL = 5
+DB_QUEUE_SIZE = 1000 # 書き込みスレッドに渡すキューの上限(超えた分はScrapyのアイテム処理を待たせる)
+#記事の本文をzstdで圧縮して保存する場合はTrue(compression.py参照。zstandardが必要)
+#既存の記事の圧縮や辞書の学習はmanage.pyで行う
+DB_COMPRESS_ARTICLES = False
+ZSTD_LEVEL = 10 # 圧縮レベル
+ZSTD_DICT_SIZE = 110 * 1024 # 学習する辞書のサイズ(バイト)
+ZSTD_DICT_SAMPLES = 5000 # 辞書の学習に使用する記事数の上限
+#Trueの場合、保存した記事を全文検索の索引に登録する(SQLiteのみ。search.py参照)
+SEARCH_INDEX_ENABLED = True
 #MYSQLの接続情報
 MYSQL_DB_USER = os.getenv('MYSQL_DB_USER')
 MYSQL_PASSWORD = os.getenv('MYSQL_PASSWORD')
@@ -0,0 +1,108 @@
+"""
+一覧ページの投稿日時の解析を行うモジュール。
+
+一覧ページの投稿日時は「月/日(曜日) 時:分」の形式で年を含まないため、実行時の日付(基準日)から年を補う。
+基準日はRunClockの作成時に1度だけ取得し、記事毎に現在時刻やタイムゾーンを取得し直さない。
+タイムゾーンはAsia/Tokyo(1951年以降は夏時間が無くUTC+9固定)のため、pytzのlocalizeではなく固定オフセットのtzinfoを使用する。
+年跨ぎは、今年の日付とした場合に基準日時より後(未来)になる記事を昨年の記事として扱う
+(1月の実行時に取得した12月の記事は昨年、12月31日の実行時に取得した1月の記事は今年)。
+"""
+import re
+from datetime import datetime, timedelta, timezone
+
+TIMEZONE = timezone(timedelta(hours=9), 'JST')
+# 一覧ページの投稿日時(例: "1/5(金) 9:03")
+LISTING_DATE_PATTERN = re.compile(r'(\d{1,2})/(\d{1,2})\([^)]*\)\s*(\d{1,2}):(\d{2})')
+# 投稿日時が基準日時より後でも今年の記事として扱う許容時間(サーバーとの時刻のずれ)
+FUTURE_TOLERANCE = timedelta(hours=1)
+# Article.post_date等に使用する投稿日時の文字列の形式
+POST_DATE_FORMAT = '%Y%m%d%H%M'
+
+
+class RunClock:
+    """
+    実行時の基準日時と、一覧ページの投稿日時の解析。
+
+    Attributes:
+        now (datetime): 基準日時(タイムゾーン付き)
+        today (date): 基準日
+    """
+
+    def __init__(self, now=None):
+        self.now = now if now is not None else datetime.now(TIMEZONE)
+        self.today = self.now.date()
+
+    def parse(self, text):
+        """
+        一覧ページの投稿日時を、年を補ったタイムゾーン付きの日時に変換する。
+
+        :param text: 一覧ページの投稿日時("月/日(曜日) 時:分")
+        :return: datetime: 投稿日時。形式が不正な場合はNone
+        """
+        match = LISTING_DATE_PATTERN.search(text) if text else None
+        if not match:
+            return None
+        month, day, hour, minute = map(int, match.groups())
+        for year in (self.now.year, self.now.year - 1):
+            try:
+                posted_at = datetime(year, month, day, hour, minute, tzinfo=TIMEZONE)
+            except ValueError: # 今年に存在しない日付(2月29日)の場合は昨年とする
+                continue
+            if posted_at <= self.now + FUTURE_TOLERANCE or year != self.now.year:
+                return posted_at
+        return None
+
+    def parse_many(self, texts):
+        """
+        一覧ページの投稿日時をまとめて変換する。
+
+        :param texts: 一覧ページの投稿日時のリスト
+        :return: list: 投稿日時(形式が不正な場合はNone)のリスト
+        """
+        return [self.parse(text) for text in texts]
+
+    def is_today(self, posted_at):
+        """
+        投稿日時が基準日かどうかを返す。
+
+        :param posted_at: 投稿日時
+        :return: bool
+        """
+        return posted_at is not None and posted_at.astimezone(TIMEZONE).date() == self.today
+
+
+def format_post_date(posted_at):
+    """
+    投稿日時をYYYYMMDDhhmm形式の文字列に変換する。
+
+    :param posted_at: 投稿日時
+    :return: str: 投稿日時が無い場合は空文字
+    """
+    return posted_at.strftime(POST_DATE_FORMAT) if posted_at is not None else ''
+
+
+def parse_post_date(post_date):
+    """
+    YYYYMMDDhhmm形式の投稿日時をタイムゾーン付きの日時に変換する。
+
+    :param post_date: 投稿日時の文字列
+    :return: datetime: 不正な形式(エラー記事等)の場合はNone
+    """
+    try:
+        return datetime.strptime(post_date, POST_DATE_FORMAT).replace(tzinfo=TIMEZONE)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_naive(posted_at):
+    """
+    データベース等に保存するため、タイムゾーン付きの日時をAsia/Tokyoの日時に変換してタイムゾーン情報を外す。
+
+    :param posted_at: 投稿日時
+    :return: datetime: 投稿日時が無い場合はNone
+    """
+    if posted_at is None:
+        return None
+    if posted_at.tzinfo is not None:
+        posted_at = posted_at.astimezone(TIMEZONE).replace(tzinfo=None)
+    return posted_at
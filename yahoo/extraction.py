@@ -0,0 +1,343 @@
+"""
+ページから記事の情報を抽出するモジュール。
+
+const.pyのCSSセレクターは、モジュールの読み込み時(起動時)に1度だけXPathに変換し、lxmlでコンパイルしておく。
+抽出はScrapyがレスポンスから作成したDOM(response.selector)に対して行い、ページのHTMLをシリアライズ・解析し直さない。
+scrapy-playwrightのレスポンスは、playwright_page_methods(wait_for_selector)の実行後のHTMLのため、記事の本文を含む。
+
+IN_PAGE_EXTRACTION(const.py)がTrueでPlaywrightのページがある場合は、1回のpage.evaluateでブラウザのDOMから
+本文のテキストノードのみを取得し、レスポンスのHTMLを解析しない。ページ内で取得できるのは「<セレクター> *::text」の形式のみ。
+
+サイトの更新でハッシュ化されたクラス名が変わってもすぐに取得できなくならないように、項目毎にセレクターの候補
+(const.pyのSELECTOR_CHAINS)を順に試す(SelectorChain)。最初の一覧ページ・記事ページではprobeで候補を確認し、
+先頭の候補が一致しない場合は一致した候補を以降の先頭にする。セレクター毎の一致率はselector_reportで集計する。
+"""
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from lxml import etree
+from parsel.csstranslator import css2xpath
+from common_func import setup_logger
+from const import LOG_LEVEL, LOG_FILE, IN_PAGE_EXTRACTION, SELECTOR_CHAINS, SELECTOR_PROBE_REQUIRED
+
+logger = setup_logger('news', LOG_FILE, LOG_LEVEL)
+
+# 要素以下の全てのテキストノードを取得するセレクター(ページ内で取得できる形式)
+DESCENDANT_TEXT = re.compile(r'^(?P<root>.+?)\s+\*::text$')
+# 対象の要素以下のテキストノードを文書順に返すスクリプト(入れ子の要素は重複して取得しない)
+IN_PAGE_TEXT_SCRIPT = """
+(selector) => {
+    const roots = Array.from(document.querySelectorAll(selector));
+    const texts = [];
+    for (const root of roots) {
+        if (roots.some((other) => other !== root && other.contains(root))) continue;
+        const walker = document.createTreeWalker(root, NodeFilter.SHOW_TEXT);
+        while (walker.nextNode()) texts.push(walker.currentNode.nodeValue);
+    }
+    return texts;
+}
+"""
+# 事前確認でページの種類毎に確認する項目(必須の項目はconst.pyのSELECTOR_PROBE_REQUIRED)
+PROBE_FIELDS = {
+    'listing': ['listing_root', 'articles', 'title', 'post_date', 'article_link', 'total_articles', 'next_page'],
+    'headline': ['article_root', 'link_to_article', 'headline_content'],
+    'article': ['article_root', 'article_content'],
+}
+# 一覧ページの記事毎の項目(最初の記事の要素内で確認する)
+ITEM_FIELDS = ('title', 'post_date', 'article_link')
+
+
+class CompiledSelector:
+    """
+    XPathに変換・コンパイルしたCSSセレクター。
+
+    Attributes:
+        css (str): CSSセレクター
+        xpath (str): 変換したXPath
+        in_page_root (str): ページ内で取得する場合の対象の要素のセレクター。ページ内で取得できない形式の場合はNone
+    """
+
+    def __init__(self, css):
+        self.css = css
+        self.xpath = css2xpath(css)
+        self._evaluate = etree.XPath(self.xpath, smart_strings=False)
+        match = DESCENDANT_TEXT.match(css)
+        self.in_page_root = match.group('root') if match else None
+
+    def getall(self, node):
+        """
+        一致した全てのテキスト・属性値・要素を返す。
+
+        :param node: レスポンス、Selectorまたはlxmlの要素
+        :return: list: テキスト・属性値の場合は文字列、要素の場合はlxmlの要素のリスト
+        """
+        return self._evaluate(_root(node))
+
+    def get(self, node, default=None):
+        """
+        最初に一致したテキスト・属性値・要素を返す。
+
+        :param node: レスポンス、Selectorまたはlxmlの要素
+        :param default: 一致しない場合に返す値
+        """
+        result = self._evaluate(_root(node))
+        return result[0] if result else default
+
+    def exists(self, node):
+        """
+        一致するものが存在するかどうかを返す。
+
+        :param node: レスポンス、Selectorまたはlxmlの要素
+        :return: bool
+        """
+        return bool(self._evaluate(_root(node)))
+
+
+class SelectorChain:
+    """
+    項目毎のセレクターの候補。先頭の候補から順に試し、最初に一致した候補の結果を返す。
+
+    Attributes:
+        field (str): 項目名(const.pyのSELECTOR_CHAINSのキー)
+        candidates (list): const.pyの定義順の候補(CompiledSelector)のリスト
+        order (list): 試す順の候補のリスト。probeで一致した候補を先頭にする
+        hits (Counter): 候補(CSSセレクター)毎の一致した回数
+        lookups (int): 評価した回数
+    """
+
+    def __init__(self, field, candidates):
+        self.field = field
+        self.candidates = [compile_selector(css) for css in candidates]
+        self.order = list(self.candidates)
+        self.hits = Counter()
+        self.lookups = 0
+
+    @property
+    def active(self):
+        """
+        最初に試す候補。
+        """
+        return self.order[0]
+
+    @property
+    def wait_selector(self):
+        """
+        wait_for_selectorで待機するセレクター(疑似要素を含まない候補をカンマで連結し、いずれかが表示されるまで待機する)。
+        """
+        return ', '.join(selector.css for selector in self.candidates if '::' not in selector.css)
+
+    def getall(self, node):
+        """
+        最初に一致した候補の全てのテキスト・属性値・要素を返す。
+
+        :param node: レスポンス、Selectorまたはlxmlの要素
+        :return: list: いずれの候補も一致しない場合は空のリスト
+        """
+        self.lookups += 1
+        root = _root(node)
+        for selector in self.order:
+            result = selector.getall(root)
+            if result:
+                self.hits[selector.css] += 1
+                return result
+        return []
+
+    def get(self, node, default=None):
+        """
+        最初に一致した候補の最初のテキスト・属性値・要素を返す。
+
+        :param node: レスポンス、Selectorまたはlxmlの要素
+        :param default: いずれの候補も一致しない場合に返す値
+        """
+        result = self.getall(node)
+        return result[0] if result else default
+
+    def exists(self, node):
+        """
+        いずれかの候補が一致するかどうかを返す。
+
+        :param node: レスポンス、Selectorまたはlxmlの要素
+        :return: bool
+        """
+        return bool(self.getall(node))
+
+    def record(self, selector):
+        """
+        評価した結果を集計する(ページ内で取得した場合等、getallを使用しない場合)。
+
+        :param selector: 一致した候補
+        """
+        self.lookups += 1
+        self.hits[selector.css] += 1
+
+    def probe(self, node):
+        """
+        候補を定義順に試し、最初に一致した候補を以降の先頭にする。一致した回数には含めない。
+
+        :param node: レスポンス、Selectorまたはlxmlの要素
+        :return: CompiledSelector: 一致した候補。いずれも一致しない場合はNone(試す順は変更しない)
+        """
+        root = _root(node)
+        for selector in self.candidates:
+            if selector.exists(root):
+                self.order = [selector] + [other for other in self.candidates if other is not selector]
+                return selector
+        return None
+
+
+@dataclass
+class ProbeResult:
+    """
+    セレクターの事前確認の結果。
+
+    Attributes:
+        matched (dict): 項目毎の一致した候補のCSSセレクター(一致しない場合はNone)
+        switched (dict): 先頭以外の候補に切り替えた項目と、切り替えた候補のCSSセレクター
+        failed (list): 一致しなかった必須の項目(いずれか1つで良い項目は"/"で連結)
+    """
+    matched: dict = field(default_factory=dict)
+    switched: dict = field(default_factory=dict)
+    failed: list = field(default_factory=list)
+
+
+def compile_selector(css):
+    """
+    CSSセレクターのコンパイル済のセレクターを返す。const.pyのセレクターは起動時にコンパイルしたものを返す。
+
+    :param css: CSSセレクター
+    :return: CompiledSelector
+    """
+    selector = COMPILED.get(css)
+    if selector is None:
+        selector = COMPILED[css] = CompiledSelector(css)
+    return selector
+
+
+def selector_for(css):
+    """
+    CSSセレクターを先頭の候補とするSelectorChainを返す。該当するものが無い場合はコンパイル済のセレクターを返す。
+
+    :param css: CSSセレクター(const.pyのHTTP_FIRST_SELECTORS等)
+    :return: SelectorChainまたはCompiledSelector
+    """
+    for chain in CHAINS.values():
+        if chain.candidates[0].css == css:
+            return chain
+    return compile_selector(css)
+
+
+def selector_exists(css, node):
+    """
+    CSSセレクター(SelectorChainの場合はいずれかの候補)が一致するかどうかを返す。一致率の集計には含めない。
+    HTTPで取得したページの確認等、抽出に使用しないレスポンスの確認に使用する。
+
+    :param css: CSSセレクター(const.pyのHTTP_FIRST_SELECTORS等)
+    :param node: レスポンス、Selectorまたはlxmlの要素
+    :return: bool
+    """
+    selector = selector_for(css)
+    candidates = selector.order if isinstance(selector, SelectorChain) else (selector,)
+    root = _root(node)
+    return any(candidate.exists(root) for candidate in candidates)
+
+
+async def extract_text(response, chain, page=None, in_page=IN_PAGE_EXTRACTION):
+    """
+    テキストノードを1回だけ取得する。
+
+    :param response: ページのレスポンス
+    :param chain: テキストノードを取得するSelectorChain
+    :param page: Playwrightのページ(HTTPで取得した場合はNone)
+    :param in_page: Trueの場合は、ページがあればブラウザのDOMから取得する
+    :return: list: テキストノード(文字列)のリスト
+    """
+    selector = chain.active
+    if in_page and page is not None and selector.in_page_root:
+        try:
+            texts = await page.evaluate(IN_PAGE_TEXT_SCRIPT, selector.in_page_root)
+        except Exception as e:
+            logger.warning(f"[extraction]ページ内でテキストを取得できなかったため、レスポンスから取得します: {e}")
+        else:
+            if texts:
+                chain.record(selector)
+                return texts
+    return chain.getall(response)
+
+
+def probe(page_type, response, required=None):
+    """
+    ページの種類毎の項目の候補を確認し、先頭の候補が一致しない項目は一致した候補に切り替える。
+    一覧ページの記事毎の項目(ITEM_FIELDS)は、最初の記事の要素内で確認する。
+
+    :param page_type: ページの種類('listing', 'headline', 'article')
+    :param response: 確認するページのレスポンス
+    :param required: 必須の項目のリスト。省略時はconst.pyのSELECTOR_PROBE_REQUIRED
+    :return: ProbeResult
+    """
+    if required is None:
+        required = SELECTOR_PROBE_REQUIRED.get(page_type, [])
+    result = ProbeResult()
+    item = None
+    for name in PROBE_FIELDS[page_type]:
+        chain = CHAINS[name]
+        node = item if name in ITEM_FIELDS else response
+        selector = chain.probe(node) if node is not None else None
+        result.matched[name] = selector.css if selector else None
+        if selector is None:
+            continue
+        if selector is not chain.candidates[0]:
+            result.switched[name] = selector.css
+        if name == 'articles':
+            item = selector.get(response)
+    for names in required:
+        names = names if isinstance(names, tuple) else (names,)
+        if not any(result.matched.get(name) for name in names):
+            result.failed.append('/'.join(names))
+    return result
+
+
+def selector_report(degraded_only=False):
+    """
+    項目毎に、候補のセレクター毎の一致率を返す。
+
+    :param degraded_only: Trueの場合は、予備の候補(先頭以外の候補)が一致したことがある項目のみ返す
+    :return: list: 「項目名: セレクター 一致率(一致回数/評価回数), ...」の文字列のリスト(評価した項目のみ)
+    """
+    lines = []
+    for chain in CHAINS.values():
+        if not chain.lookups:
+            continue
+        if degraded_only and not any(chain.hits[selector.css] for selector in chain.candidates[1:]):
+            continue
+        rates = [
+            f"{selector.css} {chain.hits[selector.css] / chain.lookups:.0%}({chain.hits[selector.css]}/{chain.lookups})"
+            for selector in chain.candidates if chain.hits[selector.css]
+        ]
+        misses = chain.lookups - sum(chain.hits.values())
+        if misses:
+            rates.append(f"不一致 {misses / chain.lookups:.0%}({misses}/{chain.lookups})")
+        lines.append(f"{chain.field}: {', '.join(rates)}")
+    return lines
+
+
+def _root(node):
+    """
+    レスポンス・Selectorの場合は、解析済のDOMのルート要素を返す。
+    """
+    node = getattr(node, 'selector', node)
+    return getattr(node, 'root', node)
+
+
+COMPILED = {}
+CHAINS = {name: SelectorChain(name, candidates) for (name, candidates) in SELECTOR_CHAINS.items()}
+LISTING_ROOT = CHAINS['listing_root']
+ARTICLES = CHAINS['articles']
+TITLE_TEXT = CHAINS['title']
+POST_DATE_TEXT = CHAINS['post_date']
+ARTICLE_LINK_HREF = CHAINS['article_link']
+TOTAL_ARTICLES = CHAINS['total_articles']
+NEXT_PAGE = CHAINS['next_page']
+ARTICLE_ROOT = CHAINS['article_root']
+LINK_TO_ARTICLE = CHAINS['link_to_article']
+ARTICLE_CONTENT = CHAINS['article_content']
+HEADLINE_CONTENT = CHAINS['headline_content']
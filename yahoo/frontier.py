@@ -0,0 +1,259 @@
+"""
+複数のワーカープロセスで共有するクロールフロンティア(取得待ちURLのキュー)を定義するモジュール。
+
+ワーカーはフロンティアから一覧ページ・記事ページのURLを貸し出し(lease)で受け取り、処理が完了したら完了(ack)を記録する。
+貸し出し期限までに完了しなかったURL(ワーカーの異常終了等)は、他のワーカーに再度貸し出される。
+URLは一意のため、同じURLが複数のワーカーで重複して取得されることはない。
+貸し出し回数が上限に達しても完了しなかったURL(取得の度にワーカーが異常終了する等)は、取得不能(dead)として以降は貸し出さない。
+また、ドメイン毎の次回リクエスト可能時刻を共有し、全ワーカー合計のリクエスト間隔(politeness)を守る。
+
+バックエンドはURIのスキームで選択する(FRONTIER_BACKENDS参照)。
+- sqlite:///frontier.db: SQLite(WALモード)のファイルを共有するバックエンド。同一ホスト内の複数プロセスで使用できる。
+  複数ホストで使用する場合は、ネットワークファイルシステム上のSQLiteではなく、FrontierBackendを継承したバックエンドを追加してください。
+"""
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlparse
+from scrapy.utils.misc import load_object
+
+
+@dataclass
+class FrontierEntry:
+    """
+    フロンティアに登録されたURL。
+
+    Attributes:
+        url (str): 取得するURL
+        page_type (str): ページの種類('listing', 'headline', 'article')
+        priority (int): 優先度(数値が大きいほど先に貸し出される)
+        meta (dict): リクエストに引き継ぐ記事情報
+        id (int): フロンティア内のID(登録後に設定される)
+    """
+    url: str
+    page_type: str
+    priority: int = 0
+    meta: dict = field(default_factory=dict)
+    id: int = None
+
+
+class FrontierBackend:
+    """
+    フロンティアのバックエンドの基底クラス。バックエンドを追加する場合はこのクラスを継承してください。
+    """
+
+    def push(self, entries):
+        """
+        URLを登録する。登録済のURLは無視する。
+
+        :param entries: FrontierEntryのリスト
+        :return: int: 新たに登録した件数
+        """
+        raise NotImplementedError
+
+    def lease(self, worker_id, limit, lease_seconds, max_attempts=0):
+        """
+        取得待ちのURLを優先度順に貸し出す。貸し出し期限切れのURLも対象とする。
+        貸し出し期限切れのURLのうち、貸し出し回数がmax_attemptsに達したものは取得不能(dead)とし、貸し出さない。
+
+        :param worker_id: ワーカーのID
+        :param limit: 貸し出す最大件数
+        :param lease_seconds: 貸し出し期限(秒)
+        :param max_attempts: URL毎の貸し出し回数の上限。0の場合は無制限
+        :return: list: FrontierEntryのリスト
+        """
+        raise NotImplementedError
+
+    def ack(self, entry_id, failed=False):
+        """
+        URLの処理完了を記録する。
+
+        :param entry_id: FrontierEntryのID
+        :param failed: 取得に失敗した場合はTrue
+        """
+        raise NotImplementedError
+
+    def reserve(self, domain, interval):
+        """
+        ドメインへの次のリクエスト枠を予約し、リクエストまでに待機する秒数を返す。
+        全ワーカーで予約を共有するため、ドメインへのリクエストは合計でinterval秒に1回になる。
+        FrontierPolitenessMiddlewareからはreactorのスレッド以外(スレッドプール)から呼び出される。
+
+        :param domain: ドメイン
+        :param interval: リクエスト間隔(秒)
+        :return: float: 待機する秒数
+        """
+        raise NotImplementedError
+
+    def has_pending(self):
+        """
+        未完了(取得待ちまたは貸し出し中)のURLがあるかどうかを返す。
+
+        :return: bool
+        """
+        raise NotImplementedError
+
+    def reset(self):
+        """
+        登録済のURLとリクエスト枠の予約を全て削除する。新しいクロールを開始する前に使用する。
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteFrontier(FrontierBackend):
+    """
+    SQLite(WALモード)のファイルを共有するフロンティア。
+    reserveはスレッドプールから呼び出されるため、接続は複数のスレッドで共有し、ロックで1スレッドずつ使用する。
+
+    Attributes:
+        path (str): SQLiteファイルのパス
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # 複数プロセスからの書き込みが競合した場合は最大30秒待つ
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS frontier (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT UNIQUE NOT NULL,
+                page_type TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                meta TEXT NOT NULL DEFAULT '{}',
+                state TEXT NOT NULL DEFAULT 'pending',
+                lease_owner TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS ix_frontier_state_priority ON frontier (state, priority DESC, id);
+            CREATE TABLE IF NOT EXISTS politeness (
+                domain TEXT PRIMARY KEY,
+                next_allowed REAL NOT NULL
+            );
+        """)
+
+    def push(self, entries):
+        with self._transaction() as cursor:
+            cursor.executemany(
+                "INSERT OR IGNORE INTO frontier (url, page_type, priority, meta) VALUES (?, ?, ?, ?)",
+                [(entry.url, entry.page_type, entry.priority, json.dumps(entry.meta, ensure_ascii=False)) for entry in entries],
+            )
+            return cursor.rowcount
+
+    def lease(self, worker_id, limit, lease_seconds, max_attempts=0):
+        now = time.time()
+        with self._transaction() as cursor:
+            if max_attempts > 0:
+                cursor.execute(
+                    "UPDATE frontier SET state = 'dead', lease_owner = NULL, lease_expires = NULL WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                    (now, max_attempts),
+                )
+            rows = cursor.execute(
+                """
+                SELECT id, url, page_type, priority, meta FROM frontier
+                WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?)
+                ORDER BY priority DESC, id LIMIT ?
+                """,
+                (now, limit),
+            ).fetchall()
+            cursor.executemany(
+                "UPDATE frontier SET state = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                [(worker_id, now + lease_seconds, row[0]) for row in rows],
+            )
+        return [FrontierEntry(url, page_type, priority, json.loads(meta), id) for (id, url, page_type, priority, meta) in rows]
+
+    def ack(self, entry_id, failed=False):
+        with self._transaction() as cursor:
+            cursor.execute(
+                "UPDATE frontier SET state = ?, lease_owner = NULL, lease_expires = NULL WHERE id = ?",
+                ('failed' if failed else 'done', entry_id),
+            )
+
+    def reserve(self, domain, interval):
+        now = time.time()
+        with self._transaction() as cursor:
+            row = cursor.execute("SELECT next_allowed FROM politeness WHERE domain = ?", (domain,)).fetchone()
+            slot = max(now, row[0]) if row else now
+            cursor.execute(
+                "INSERT OR REPLACE INTO politeness (domain, next_allowed) VALUES (?, ?)",
+                (domain, slot + interval),
+            )
+        return slot - now
+
+    def has_pending(self):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM frontier WHERE state IN ('pending', 'leased') LIMIT 1"
+            ).fetchone()
+        return row is not None
+
+    def reset(self):
+        with self._transaction() as cursor:
+            cursor.execute("DELETE FROM frontier")
+            cursor.execute("DELETE FROM politeness")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def _transaction(self):
+        return _Transaction(self.connection, self.lock)
+
+
+class _Transaction:
+    """
+    スレッド間のロックとBEGIN IMMEDIATEで書き込みロックを取得し、正常終了時にCOMMIT、例外発生時にROLLBACKするコンテキストマネージャ。
+    """
+
+    def __init__(self, connection, lock):
+        self.connection = connection
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.connection.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self.lock.release()
+            raise
+        return self.connection.cursor()
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
+        return False
+
+
+# URIのスキームとバックエンドのクラスの対応
+FRONTIER_BACKENDS = {
+    'sqlite': SQLiteFrontier,
+}
+
+
+def open_frontier(uri):
+    """
+    URIに対応するフロンティアを開く。
+    スキームがFRONTIER_BACKENDSに無い場合は、スキームを除いた部分をクラスのパスとして読み込む
+    (例: 'custom:mypackage.frontier.RedisFrontier?redis://localhost')。
+
+    :param uri: フロンティアのURI(例: 'sqlite:///frontier.db')
+    :return: FrontierBackend
+    """
+    parsed = urlparse(uri)
+    if parsed.scheme == 'sqlite':
+        # sqlite:///frontier.db は相対パス、sqlite:////tmp/frontier.db は絶対パス
+        return SQLiteFrontier(uri[len('sqlite:///'):])
+    if parsed.scheme in FRONTIER_BACKENDS:
+        return FRONTIER_BACKENDS[parsed.scheme](uri)
+    path, _, argument = uri.split(':', 1)[1].partition('?')
+    return load_object(path)(argument)
@@ -0,0 +1,163 @@
+"""
+HTTPでの取得を優先し、必要な場合のみPlaywrightでレンダリングするダウンロードハンドラを定義するモジュール。
+
+Yahooニュースの記事ページの多くはサーバー側でレンダリングされており、
+HTTPで取得したHTMLに必要な要素が含まれている。ブラウザでのレンダリングは数秒と数百MBのメモリを要するため、
+まずHTTPで取得し、リクエストのmeta['http_first_selectors']に指定されたセレクターが
+HTML内に存在しない場合のみPlaywrightでレンダリングする。
+
+取得件数はScrapyの統計情報に記録されます。
+- http_first/plain: HTTPのみで取得したページ数
+- http_first/rendered: Playwrightでレンダリングしたページ数
+- http_first/not_modified: キャッシュの再検証で変更が無かったページ数
+- http_first/passthrough: ステータスが200以外のため、レンダリングせずにそのまま返したページ数
+"""
+from scrapy.http import TextResponse
+from scrapy.utils.defer import deferred_from_coro, maybe_deferred_to_future
+from scrapy_playwright.handler import ScrapyPlaywrightDownloadHandler
+import time
+from common_func import setup_logger
+from extraction import selector_exists
+from const import LOG_LEVEL, LOG_FILE
+from httpcache import CONDITIONAL_HEADERS
+from metrics import METRICS
+
+# ロガーの設定
+logger = setup_logger('news', LOG_FILE, LOG_LEVEL)
+
+
+class HttpFirstDownloadHandler(ScrapyPlaywrightDownloadHandler):
+    """
+    HTTPでの取得を優先し、必要なセレクターが無い場合のみPlaywrightでレンダリングするダウンロードハンドラ。
+
+    meta['playwright']がTrueかつmeta['http_first_selectors']が指定されたリクエストが対象です。
+    それ以外のリクエスト(robots.txt等)はScrapyPlaywrightDownloadHandlerと同じ動作になります。
+    HTTPで取得したページを使用した場合、meta['rendered']はFalseになり、レスポンスにPlaywrightのページは含まれません
+    (PagePoolMiddlewareが割り当てたページはプールに戻します)。
+
+    Attributes:
+        http_first (bool): HTTP優先取得を行うかどうか(settings.pyのHTTP_FIRST_ENABLED参照)
+    """
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        self.http_first = crawler.settings.getbool('HTTP_FIRST_ENABLED', True)
+        METRICS.register_gauge('open_pages', self._get_total_page_count)
+
+    def download_request(self, request, spider):
+        if self.http_first and request.meta.get('playwright') and request.meta.get('http_first_selectors'):
+            return deferred_from_coro(self._download_http_first(request, spider))
+        if request.meta.get('playwright'):
+            self._strip_conditional_headers(request)
+        return super().download_request(request, spider)
+
+    async def _download_http_first(self, request, spider):
+        """
+        HTTPでページを取得し、必要なセレクターが全て存在すればそのレスポンスを返す。
+        ステータスが200で存在しない場合や、HTTPでの取得に失敗した場合はPlaywrightでレンダリングする。
+        200以外のステータス(キャッシュの再検証の304、404等)はレンダリングせずにそのまま返す。
+
+        :param request: 取得するリクエスト
+        :param spider: 実行中のスパイダー
+        :return: Response
+        """
+        started = time.perf_counter()
+        try:
+            # ScrapyPlaywrightDownloadHandlerの親クラス(HTTP11DownloadHandler)で取得する
+            response = await maybe_deferred_to_future(
+                super(ScrapyPlaywrightDownloadHandler, self).download_request(request, spider)
+            )
+        except Exception as e:
+            METRICS.observe('http_fetch_seconds', time.perf_counter() - started, page_type=request.meta.get('page_type'))
+            logger.info(f"[http_first]HTTPでの取得に失敗したためレンダリングします。URL: {request.url} エラー内容: {e}")
+        else:
+            METRICS.observe('http_fetch_seconds', time.perf_counter() - started, page_type=request.meta.get('page_type'))
+            # キャッシュの再検証で変更が無かった場合はそのまま返す(HttpCacheMiddlewareがキャッシュを使用する)
+            if response.status == 304 and request.meta.get('cached_response') is not None:
+                self.stats.inc_value('http_first/not_modified')
+                await self._release_unused_page(request, spider)
+                return response
+            if response.status != 200:
+                # 404等のページはレンダリングしても必要な要素が無いため、そのまま返す(5xx等はリトライで扱う)
+                self.stats.inc_value('http_first/passthrough')
+                request.meta['rendered'] = False
+                await self._release_unused_page(request, spider)
+                return response
+            if self._has_selectors(response, request.meta['http_first_selectors']):
+                self.stats.inc_value('http_first/plain')
+                request.meta['rendered'] = False
+                await self._release_unused_page(request, spider)
+                return response
+            logger.debug(f"[http_first]必要なセレクターが無いためレンダリングします。URL: {request.url}")
+
+        self.stats.inc_value('http_first/rendered')
+        request.meta['rendered'] = True
+        self._strip_conditional_headers(request)
+        return await self._download_request(request, spider)
+
+    async def _download_request_with_page(self, request, page, spider):
+        """
+        Playwrightでページを取得し、ナビゲーション時間(page.gotoとHTMLの取得、PageMethodの実行時間を除く)を記録する。
+        """
+        response = await super()._download_request_with_page(request, page, spider)
+        page_methods = request.meta.pop('page_methods_seconds', 0.0)
+        METRICS.observe('navigation_seconds', max(request.meta['download_latency'] - page_methods, 0.0), page_type=request.meta.get('page_type'))
+        return response
+
+    async def _apply_page_methods(self, page, request, spider):
+        """
+        PageMethod(wait_for_selector等)を実行し、実行時間(タイムアウトした場合はタイムアウトまでの時間)を記録する。
+        """
+        started = time.perf_counter()
+        try:
+            await super()._apply_page_methods(page, request, spider)
+        finally:
+            elapsed = time.perf_counter() - started
+            request.meta['page_methods_seconds'] = elapsed
+            METRICS.observe('selector_wait_seconds', elapsed, page_type=request.meta.get('page_type'))
+
+    @staticmethod
+    async def _release_unused_page(request, spider):
+        """
+        HTTPで取得したページを使用する場合に、PagePoolMiddlewareが割り当てたPlaywrightのページをプールに戻す。
+        レンダリングしていない空白ページをスクリーンショットやページ内での抽出に使用しないよう、metaから削除する。
+
+        :param request: HTTPで取得したリクエスト
+        :param spider: 実行中のスパイダー
+        """
+        page = request.meta.pop('playwright_page', None)
+        if page is None:
+            return
+        page_pool = getattr(spider, 'page_pool', None)
+        if page_pool:
+            await page_pool.release(page, request.meta.get('playwright_context'))
+        else:
+            await page.close()
+
+    @staticmethod
+    def _strip_conditional_headers(request):
+        """
+        キャッシュの再検証用の条件付きヘッダーを削除する。
+        ブラウザが304を受け取ると空のページになるため、レンダリングする場合は条件付きヘッダーを送信しない。
+
+        :param request: レンダリングするリクエスト
+        """
+        for header in CONDITIONAL_HEADERS:
+            request.headers.pop(header, None)
+
+    @staticmethod
+    def _has_selectors(response, selectors):
+        """
+        レスポンスに必要なセレクターが全て存在するか確認する。
+
+        :param response: HTTPで取得したレスポンス
+        :param selectors: セレクターのリスト。タプルの要素はいずれか1つが存在すれば良い。
+        :return: bool
+        """
+        if response.status != 200 or not isinstance(response, TextResponse):
+            return False
+        for selector in selectors:
+            candidates = selector if isinstance(selector, tuple) else (selector,)
+            if not any(selector_exists(candidate, response) for candidate in candidates):
+                return False
+        return True
@@ -0,0 +1,128 @@
+"""
+記事ページ・一覧ページのキャッシュを定義するモジュール。
+
+ScrapyのHttpCacheMiddlewareと組み合わせて使用し、Playwrightでレンダリングした後のHTMLとレスポンスヘッダーを
+URL毎にディスクへ保存する。クラッシュ後の再実行やparse_articleの修正時に、取得済のページを再取得せずに処理できる。
+
+- PageTypeCachePolicy: ページの種類(一覧ページ・記事ページ)毎の有効期限でキャッシュの鮮度を判定するポリシー。
+  有効期限切れの場合はETag/Last-Modifiedで条件付きリクエストを行い、304の場合はキャッシュを使用する。
+- BoundedFilesystemCacheStorage: 合計サイズがCACHE_MAX_MBを超えた場合に古いものから削除するストレージ。
+"""
+import shutil
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from time import time
+from scrapy.extensions.httpcache import FilesystemCacheStorage
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.python import to_unicode
+from common_func import setup_logger
+from const import CACHE_MAX_MB, CACHE_TTL, LOG_LEVEL, LOG_FILE
+
+# ロガーの設定
+logger = setup_logger('news', LOG_FILE, LOG_LEVEL)
+
+# 条件付きリクエストに使用するヘッダー
+CONDITIONAL_HEADERS = (b'If-None-Match', b'If-Modified-Since')
+
+
+class PageTypeCachePolicy:
+    """
+    ページの種類(meta['page_type'])毎の有効期限でキャッシュの鮮度を判定するポリシー。
+
+    サーバーのCache-Controlヘッダーは無視し、CACHE_TTLに定義されたページの種類のみキャッシュする。
+    有効期限はレスポンスのDateヘッダーからの経過時間で判定する。
+    有効期限切れの場合は、キャッシュのETag/Last-Modifiedを条件付きヘッダーとしてリクエストに設定する。
+    条件付きリクエストはHTTPで取得する場合のみ送信され、304が返った場合はキャッシュを使用する
+    (yahoo.handlers.HttpFirstDownloadHandler参照)。
+    """
+
+    def __init__(self, settings):
+        self.ignore_schemes = settings.getlist('HTTPCACHE_IGNORE_SCHEMES')
+
+    def should_cache_request(self, request):
+        if urlparse_cached(request).scheme in self.ignore_schemes:
+            return False
+        return request.meta.get('page_type') in CACHE_TTL
+
+    def should_cache_response(self, response, request):
+        return response.status == 200
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        ttl = CACHE_TTL[request.meta['page_type']]
+        if response_age(cachedresponse) < ttl:
+            return True
+        # 有効期限切れの場合は条件付きリクエストで再検証する
+        if b'Last-Modified' in cachedresponse.headers:
+            request.headers[b'If-Modified-Since'] = cachedresponse.headers[b'Last-Modified']
+        if b'ETag' in cachedresponse.headers:
+            request.headers[b'If-None-Match'] = cachedresponse.headers[b'ETag']
+        return False
+
+    def is_cached_response_valid(self, cachedresponse, response, request):
+        return response.status == 304
+
+
+def response_age(response):
+    """
+    レスポンスのDateヘッダーからの経過秒数を返す。Dateヘッダーが無い場合は無限大を返す。
+
+    :param response: キャッシュしたレスポンス
+    :return: float: 経過秒数
+    """
+    date = response.headers.get(b'Date')
+    try:
+        return time() - parsedate_to_datetime(to_unicode(date)).timestamp()
+    except (TypeError, ValueError):
+        return float('inf')
+
+
+class BoundedFilesystemCacheStorage(FilesystemCacheStorage):
+    """
+    合計サイズの上限付きのファイルシステムキャッシュ。
+
+    スパイダーの開始時にキャッシュフォルダのサイズを集計し、保存により合計サイズがCACHE_MAX_MBを超えた場合は
+    保存日時の古いキャッシュから削除する。
+
+    Attributes:
+        max_bytes (int): キャッシュの合計サイズの上限(バイト)
+        entries (dict): キャッシュのパスをキーとした(保存日時, サイズ)の辞書
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.max_bytes = CACHE_MAX_MB * 1024 * 1024
+        self.entries = {}
+        self.total_bytes = 0
+
+    def open_spider(self, spider):
+        super().open_spider(spider)
+        spider_dir = Path(self.cachedir, spider.name)
+        if spider_dir.exists():
+            for metapath in spider_dir.glob('*/*/pickled_meta'):
+                rpath = metapath.parent
+                size = sum(f.stat().st_size for f in rpath.iterdir())
+                self.entries[str(rpath)] = (metapath.stat().st_mtime, size)
+        self.total_bytes = sum(size for _, size in self.entries.values())
+        logger.info(f"[httpcache]キャッシュ件数: {len(self.entries)}件 合計サイズ: {self.total_bytes / 1024 / 1024:.1f}MB")
+
+    def store_response(self, spider, request, response):
+        super().store_response(spider, request, response)
+        rpath = Path(self._get_request_path(spider, request))
+        size = sum(f.stat().st_size for f in rpath.iterdir())
+        _, old_size = self.entries.pop(str(rpath), (0, 0))
+        self.entries[str(rpath)] = (time(), size)
+        self.total_bytes += size - old_size
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """
+        合計サイズが上限の9割以下になるまで、保存日時の古いキャッシュから削除する。
+        """
+        target = self.max_bytes * 0.9
+        for path, (_, size) in sorted(self.entries.items(), key=lambda entry: entry[1][0]):
+            if self.total_bytes <= target:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            del self.entries[path]
+            self.total_bytes -= size
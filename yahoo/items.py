@@ -13,12 +13,20 @@ class YahooItem(scrapy.Item):
     Attributes:
         title (scrapy.Field): ニュースのタイトル
         article_number (scrapy.Field): 記事の番号
-        post_date (scrapy.Field): 投稿日
+        post_date (scrapy.Field): 投稿日(YYYYMMDDhhmm形式)
+        posted_at (scrapy.Field): 投稿日時(Asia/Tokyoのタイムゾーン付きのdatetime)
         url (scrapy.Field): 記事のURL
         article (scrapy.Field): 記事の本文
+        simhash (scrapy.Field): 本文のSimHash(NearDuplicatePipelineで設定)
+        duplicate_of (scrapy.Field): 本文が類似する記事のURL(NearDuplicatePipelineで設定)
+        revisit (scrapy.Field): 保存済の記事を更新の確認のために再取得した場合はTrue(const.pyのREVISIT_DAYS参照)
     """
     title = scrapy.Field(output_processor=TakeFirst())
     article_number = scrapy.Field(output_processor=TakeFirst())
     post_date = scrapy.Field(output_processor=TakeFirst())
+    posted_at = scrapy.Field(output_processor=TakeFirst())
     url = scrapy.Field(output_processor=TakeFirst())
-    article = scrapy.Field(output_processor=TakeFirst())
\ No newline at end of file
+    article = scrapy.Field(output_processor=TakeFirst())
+    simhash = scrapy.Field()
+    duplicate_of = scrapy.Field()
+    revisit = scrapy.Field(output_processor=TakeFirst())
\ No newline at end of file
@@ -0,0 +1,153 @@
+"""
+ページの種類毎の取得時間(レイテンシ)の分布からのタイムアウトの決定と、実行全体の時間の予算の管理を行うモジュール。
+
+- LatencyTracker: ページの種類(listing, headline, article)毎に直近の取得時間を保持し、
+  タイムアウトを「指定したパーセンタイル(既定はp99) × 倍率」を下限〜上限の範囲に収めた値とする。
+  取得時間の件数が少ない間は分布が安定しないため、上限(従来の固定のタイムアウト)を使用する。
+- RunBudget: 実行開始からの経過時間が予算を超えた後は、一覧ページ(新しい記事の発見)と優先度の低いリクエスト(リトライ)を送信しない。
+
+いずれもAdaptiveTimeoutMiddleware(middlewares.py)から使用する。
+"""
+import math
+import time
+from collections import deque
+
+
+class LatencyTracker:
+    """
+    ページの種類毎の取得時間の分布とタイムアウト。
+
+    Attributes:
+        window (int): 分布の計算に使用する直近の取得時間の件数
+        quantile (float): タイムアウトの基準にするパーセンタイル(0〜1)
+        multiplier (float): パーセンタイルに掛ける倍率
+        floor (int): タイムアウトの下限(ミリ秒)
+        ceiling (int): タイムアウトの上限(ミリ秒)
+        min_samples (int): 分布からタイムアウトを計算するのに必要な取得時間の件数
+        samples (dict): ページの種類毎の直近の取得時間(秒)
+    """
+
+    def __init__(self, window=200, quantile=0.99, multiplier=3.0, floor=15000, ceiling=90000, min_samples=20):
+        self.window = window
+        self.quantile = quantile
+        self.multiplier = multiplier
+        self.floor = floor
+        self.ceiling = ceiling
+        self.min_samples = min_samples
+        self.samples = {}
+        self._timeouts = {} # ページの種類毎の計算済のタイムアウト(取得時間の追加時に破棄する)
+
+    def record(self, page_type, seconds):
+        """
+        取得時間を追加する。
+
+        :param page_type: ページの種類
+        :param seconds: 取得時間(秒)
+        """
+        samples = self.samples.get(page_type)
+        if samples is None:
+            samples = self.samples[page_type] = deque(maxlen=self.window)
+        samples.append(seconds)
+        self._timeouts.pop(page_type, None)
+
+    def percentile(self, page_type, quantile=None):
+        """
+        取得時間のパーセンタイル(最近順位法)を返す。
+
+        :param page_type: ページの種類
+        :param quantile: パーセンタイル(0〜1)。省略時はquantile
+        :return: float: 取得時間(秒)。取得時間が無い場合はNone
+        """
+        samples = self.samples.get(page_type)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        rank = math.ceil((self.quantile if quantile is None else quantile) * len(ordered))
+        return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+    def timeout(self, page_type):
+        """
+        ページの種類のタイムアウトを返す。
+
+        :param page_type: ページの種類
+        :return: int: タイムアウト(ミリ秒)
+        """
+        timeout = self._timeouts.get(page_type)
+        if timeout is None:
+            samples = self.samples.get(page_type)
+            if samples is None or len(samples) < self.min_samples:
+                timeout = self.ceiling
+            else:
+                timeout = int(min(max(self.percentile(page_type) * self.multiplier * 1000, self.floor), self.ceiling))
+            self._timeouts[page_type] = timeout
+        return timeout
+
+    def summary(self):
+        """
+        ページの種類毎の取得時間の分布とタイムアウトを返す。
+
+        :return: dict: ページの種類毎の{'count': 件数, 'p50': 秒, 'p99': 秒, 'timeout': ミリ秒}
+        """
+        return {
+            page_type: {
+                'count': len(samples),
+                'p50': self.percentile(page_type, 0.5),
+                'p99': self.percentile(page_type, 0.99),
+                'timeout': self.timeout(page_type),
+            }
+            for (page_type, samples) in self.samples.items()
+        }
+
+
+class RunBudget:
+    """
+    実行全体の時間の予算。
+
+    Attributes:
+        seconds (float): 予算(秒)。0の場合は無制限
+        min_priority (int): 予算を超えた後も送信するリクエストの優先度の下限
+        stop_page_types (tuple): 予算を超えた後は送信しないページの種類
+        started (float): 実行を開始した時刻(time.monotonic)
+        dropped (int): 予算を超えたため送信しなかったリクエスト数
+    """
+
+    def __init__(self, seconds=0, min_priority=0, stop_page_types=('listing',), clock=time.monotonic):
+        self.seconds = seconds
+        self.min_priority = min_priority
+        self.stop_page_types = stop_page_types
+        self.clock = clock
+        self.started = clock()
+        self.dropped = 0
+
+    def start(self):
+        """
+        実行の開始時刻を記録する。
+        """
+        self.started = self.clock()
+        self.dropped = 0
+
+    @property
+    def elapsed(self):
+        """
+        実行開始からの経過時間(秒)。
+        """
+        return self.clock() - self.started
+
+    def exceeded(self):
+        """
+        予算を超えたかどうかを返す。
+
+        :return: bool
+        """
+        return self.seconds > 0 and self.elapsed >= self.seconds
+
+    def allows(self, request):
+        """
+        リクエストを送信して良いかどうかを返す。
+
+        :param request: 送信するリクエスト
+        :return: bool: 予算を超えた後は、一覧ページと優先度がmin_priority未満のリクエストはFalse
+        """
+        if not self.exceeded():
+            return True
+        return request.priority >= self.min_priority and request.meta.get('page_type') not in self.stop_page_types
@@ -0,0 +1,330 @@
+"""
+データベースの保守を行うコマンドラインツールです。
+
+使用できるコマンド:
+- train-dict: 保存済の記事の本文から圧縮用の辞書を学習し、新しいバージョンとして保存します。
+- compress: 保存済の記事の本文を最新の辞書でzstd圧縮します(既存データの一括移行)。
+- decompress: 圧縮した記事の本文を展開し、圧縮前の形式に戻します。
+- migrate: 列とインデックスを追加し、既存の記事の投稿日時(posted_at)を投稿日(post_date)から設定します。
+- search-index: 既存の記事を全文検索の索引に登録します(索引を作り直します)。
+- search: 保存済の記事を全文検索し、関連度の高い順に抜粋を表示します。
+- history: 記事の更新履歴を、差分から各時点の本文を復元して表示します。
+- bench: SQLiteの高速化の設定(SQLITE_PERFORMANCE_PROFILE)とposted_atのインデックスの有無で、挿入と期間検索の速度を比較します。
+
+使い方:
+  python yahoo/manage.py train-dict
+  python yahoo/manage.py compress
+  python yahoo/manage.py migrate
+  python yahoo/manage.py bench --rows 50000
+  python yahoo/manage.py search-index
+  python yahoo/manage.py search 新型 感染者数 --limit 10
+  python yahoo/manage.py history https://news.yahoo.co.jp/articles/...
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, func, or_, select, text, update
+from sqlalchemy.dialects import sqlite
+from models import Article, ArticleRevision, CompressionDict, Session, apply_sqlite_profile, upgrade_schema
+from revisions import iter_history
+import compression
+import search
+from common_func import setup_logger
+from dates import parse_post_date, to_naive
+from const import LOG_LEVEL, LOG_FILE, ZSTD_DICT_SAMPLES, ZSTD_DICT_SIZE, DB_BATCH_SIZE
+
+# ロガーの設定
+logger = setup_logger('news', LOG_FILE, LOG_LEVEL)
+
+
+def train_dict(session, samples=ZSTD_DICT_SAMPLES, size=ZSTD_DICT_SIZE):
+    """
+    最近保存した記事の本文から圧縮用の辞書を学習し、新しいバージョンとして保存する。
+
+    :param session: データベースセッション
+    :param samples: 学習に使用する記事数の上限
+    :param size: 辞書のサイズ(バイト)
+    :return: CompressionDict: 保存した辞書
+    """
+    articles = session.scalars(select(Article).order_by(Article.id.desc()).limit(samples))
+    bodies = [article.article for article in articles if article.article and article.article not in ('-', 'Error')]
+    if not bodies:
+        raise ValueError("辞書の学習に使用できる記事がありません")
+    dictionary = CompressionDict(data=compression.train_dictionary(bodies, size), sample_count=len(bodies))
+    session.add(dictionary)
+    session.commit()
+    logger.info(f"[manage]圧縮用の辞書を作成しました。ID: {dictionary.id} 学習した記事数: {len(bodies)}件 サイズ: {len(dictionary.data)}バイト")
+    return dictionary
+
+
+def compress_articles(session, batch_size=500):
+    """
+    最新の辞書で圧縮されていない記事の本文を圧縮する。古い辞書で圧縮した記事は最新の辞書で圧縮し直す。
+
+    :param session: データベースセッション
+    :param batch_size: 1回のコミットで処理する記事数
+    :return: int: 圧縮した記事数
+    """
+    latest = session.scalars(select(CompressionDict).order_by(CompressionDict.id.desc()).limit(1)).first()
+    dict_id, dict_data = (latest.id, latest.data) if latest else (None, None)
+    if dict_id is None:
+        condition = Article.article_zstd.is_(None)
+    else:
+        condition = or_(Article.article_zstd.is_(None), Article.dict_id.is_(None), Article.dict_id != dict_id)
+    return _rewrite_articles(
+        session,
+        condition,
+        lambda body: {'_article': None, 'article_zstd': compression.compress(body, dict_id, dict_data), 'dict_id': dict_id},
+        batch_size,
+    )
+
+
+def decompress_articles(session, batch_size=500):
+    """
+    圧縮した記事の本文を展開し、圧縮前の形式に戻す。
+
+    :param session: データベースセッション
+    :param batch_size: 1回のコミットで処理する記事数
+    :return: int: 展開した記事数
+    """
+    return _rewrite_articles(
+        session,
+        Article.article_zstd.is_not(None),
+        lambda body: {'_article': body, 'article_zstd': None, 'dict_id': None},
+        batch_size,
+    )
+
+
+def _rewrite_articles(session, condition, convert, batch_size):
+    """
+    条件に一致する記事の本文を、IDの順にbatch_size件ずつ変換して更新する。
+
+    :param session: データベースセッション
+    :param condition: 対象の記事の条件
+    :param convert: 本文から更新する列の値の辞書を返す関数
+    :param batch_size: 1回のコミットで処理する記事数
+    :return: int: 更新した記事数
+    """
+    count = 0
+    last_id = 0
+    while True:
+        articles = session.scalars(
+            select(Article).where(condition, Article._article.is_not(None) | Article.article_zstd.is_not(None), Article.id > last_id)
+            .order_by(Article.id).limit(batch_size)
+        ).all()
+        if not articles:
+            break
+        values = [{'id': article.id, **convert(article.article)} for article in articles]
+        last_id = articles[-1].id
+        session.expunge_all()
+        session.execute(update(Article), values)
+        session.commit()
+        count += len(values)
+        logger.info(f"[manage]{count}件の記事を更新しました")
+    return count
+
+
+def migrate(session, batch_size=500):
+    """
+    投稿日時(posted_at)が未設定の記事に、投稿日(post_date)から変換した日時を設定する。
+
+    :param session: データベースセッション
+    :param batch_size: 1回のコミットで処理する記事数
+    :return: int: 設定した記事数
+    """
+    count = 0
+    last_id = 0
+    while True:
+        rows = session.execute(
+            select(Article.id, Article.post_date)
+            .where(Article.posted_at.is_(None), Article.id > last_id)
+            .order_by(Article.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        values = [{'id': row.id, 'posted_at': to_naive(parse_post_date(row.post_date))} for row in rows]
+        values = [value for value in values if value['posted_at'] is not None] # エラー記事はNULLのまま
+        if values:
+            session.execute(update(Article), values)
+            session.commit()
+        count += len(values)
+    logger.info(f"[manage]{count}件の記事の投稿日時を設定しました")
+    return count
+
+
+def build_search_index(session, batch_size=500):
+    """
+    全ての記事を全文検索の索引に登録し直す。圧縮した本文は展開して登録する。
+
+    :param session: データベースセッション
+    :param batch_size: 1回のコミットで処理する記事数
+    :return: int: 登録した記事数
+    """
+    search.create_index(session)
+    session.execute(text(f"DELETE FROM {search.FTS_TABLE}"))
+    count = 0
+    last_id = 0
+    while True:
+        articles = session.scalars(select(Article).where(Article.id > last_id).order_by(Article.id).limit(batch_size)).all()
+        if not articles:
+            break
+        last_id = articles[-1].id
+        search.index_articles(session, [(article.id, article.title, article.article) for article in articles])
+        session.commit()
+        session.expunge_all()
+        count += len(articles)
+        logger.info(f"[manage]{count}件の記事を全文検索の索引に登録しました")
+    session.commit()
+    return count
+
+
+def print_history(session, url):
+    """
+    記事の現在の内容と、更新前の各時点の内容を新しい順に表示する。
+
+    :param session: データベースセッション
+    :param url: 記事のURL
+    :return: int: 更新履歴の件数。記事が無い場合はNone
+    """
+    article = session.scalars(select(Article).where(Article.url == url)).first()
+    if article is None:
+        return None
+    revisions = session.scalars(select(ArticleRevision).where(ArticleRevision.article_id == article.id).order_by(ArticleRevision.id.desc())).all()
+    print(f"[現在] {article.updated_at or article.posted_at} {article.title}\n{article.article}\n")
+    for (number, (created_at, title, body)) in enumerate(iter_history(article, revisions), start=1):
+        print(f"[{number}世代前] {created_at}に更新を検出 {title}\n{body}\n")
+    return len(revisions)
+
+
+def bench(rows=20000, queries=200, batch_size=DB_BATCH_SIZE):
+    """
+    一時的なSQLiteのデータベースで、既定の設定と高速化の設定(apply_sqlite_profile)の
+    挿入速度と、投稿日(文字列、インデックス無し)と投稿日時(インデックス有り)での期間検索の速度を計測する。
+
+    :param rows: 挿入する記事数
+    :param queries: 期間検索の回数
+    :param batch_size: 1回のコミットで挿入する記事数
+    :return: list: 計測結果(設定名、挿入件数/秒、post_dateでの検索回数/秒、posted_atでの検索回数/秒)のリスト
+    """
+    start = datetime(2024, 1, 1)
+    articles = []
+    for i in range(rows):
+        posted_at = start + timedelta(minutes=random.randrange(365 * 24 * 60))
+        articles.append({
+            'title': f"タイトル{i}",
+            'article_number': f"{i // 20 + 1}-{i % 20 + 1}",
+            'post_date': posted_at.strftime('%Y%m%d%H%M'),
+            'posted_at': posted_at,
+            'url': f"https://news.yahoo.co.jp/articles/{i:016x}",
+            'article': "本文" * 200,
+        })
+    ranges = [start + timedelta(days=random.randrange(358)) for _ in range(queries)]
+
+    results = []
+    for (name, profile) in (('default', False), ('performance', True)):
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+            if profile:
+                apply_sqlite_profile(engine)
+            upgrade_schema(engine)
+
+            began = time.perf_counter()
+            for offset in range(0, rows, batch_size):
+                with engine.begin() as connection:
+                    connection.execute(sqlite.insert(Article.__table__).values(articles[offset:offset + batch_size]).on_conflict_do_nothing(index_elements=['url']))
+            insert_rate = rows / (time.perf_counter() - began)
+
+            query_rates = []
+            for column in (Article.post_date, Article.posted_at):
+                began = time.perf_counter()
+                with engine.connect() as connection:
+                    for day in ranges:
+                        # 1週間分の記事数を数える
+                        end = day + timedelta(days=7)
+                        low, high = (day.strftime('%Y%m%d%H%M'), end.strftime('%Y%m%d%H%M')) if column is Article.post_date else (day, end)
+                        connection.execute(select(func.count()).where(column >= low, column < high)).scalar()
+                query_rates.append(queries / (time.perf_counter() - began))
+            engine.dispose()
+        results.append((name, insert_rate, *query_rates))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="データベースの保守を行います。")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train_parser = subparsers.add_parser('train-dict', help="保存済の記事から圧縮用の辞書を学習します。")
+    train_parser.add_argument('--samples', type=int, default=ZSTD_DICT_SAMPLES, help="学習に使用する記事数の上限")
+    train_parser.add_argument('--size', type=int, default=ZSTD_DICT_SIZE, help="辞書のサイズ(バイト)")
+    compress_parser = subparsers.add_parser('compress', help="保存済の記事の本文を最新の辞書で圧縮します。")
+    compress_parser.add_argument('--batch-size', type=int, default=500, help="1回のコミットで処理する記事数")
+    decompress_parser = subparsers.add_parser('decompress', help="圧縮した記事の本文を展開します。")
+    decompress_parser.add_argument('--batch-size', type=int, default=500, help="1回のコミットで処理する記事数")
+    migrate_parser = subparsers.add_parser('migrate', help="列とインデックスを追加し、既存の記事の投稿日時を設定します。")
+    migrate_parser.add_argument('--batch-size', type=int, default=500, help="1回のコミットで処理する記事数")
+    index_parser = subparsers.add_parser('search-index', help="既存の記事を全文検索の索引に登録します。")
+    index_parser.add_argument('--batch-size', type=int, default=500, help="1回のコミットで処理する記事数")
+    search_parser = subparsers.add_parser('search', help="保存済の記事を全文検索します。")
+    search_parser.add_argument('terms', nargs='+', help="検索する語句(複数指定した場合は全てを含む記事)")
+    search_parser.add_argument('--limit', type=int, default=20, help="表示する記事数の上限")
+    search_parser.add_argument('--newest', action='store_true', help="関連度ではなく新しい順に表示します(多くの記事に含まれる語句の場合に高速)")
+    history_parser = subparsers.add_parser('history', help="記事の更新履歴を表示します。")
+    history_parser.add_argument('url', help="記事のURL")
+    bench_parser = subparsers.add_parser('bench', help="SQLiteの挿入と期間検索の速度を計測します。")
+    bench_parser.add_argument('--rows', type=int, default=20000, help="挿入する記事数")
+    bench_parser.add_argument('--queries', type=int, default=200, help="期間検索の回数")
+    bench_parser.add_argument('--batch-size', type=int, default=DB_BATCH_SIZE, help="1回のコミットで挿入する記事数")
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        print(f"{'profile':<12}{'insert rows/s':>16}{'post_date q/s':>16}{'posted_at q/s':>16}")
+        for (name, insert_rate, string_rate, indexed_rate) in bench(args.rows, args.queries, args.batch_size):
+            print(f"{name:<12}{insert_rate:>16.0f}{string_rate:>16.1f}{indexed_rate:>16.1f}")
+        return 0
+
+    if args.command in ('train-dict', 'compress') and not compression.available():
+        print("zstandardがインストールされていません(pip install zstandard)", file=sys.stderr)
+        return 1
+
+    session = Session()
+    try:
+        upgrade_schema(session.get_bind())
+        if args.command in ('search-index', 'search') and not search.available(session):
+            print("全文検索にはSQLite 3.34以降(FTS5のtrigramトークナイザー)が必要です", file=sys.stderr)
+            return 1
+        if args.command == 'train-dict':
+            dictionary = train_dict(session, args.samples, args.size)
+            print(f"辞書を作成しました。ID: {dictionary.id} 学習した記事数: {dictionary.sample_count}件")
+        elif args.command == 'compress':
+            print(f"{compress_articles(session, args.batch_size)}件の記事を圧縮しました")
+        elif args.command == 'decompress':
+            print(f"{decompress_articles(session, args.batch_size)}件の記事を展開しました")
+        elif args.command == 'migrate':
+            print(f"{migrate(session, args.batch_size)}件の記事の投稿日時を設定しました")
+        elif args.command == 'history':
+            count = print_history(session, args.url)
+            if count is None:
+                print(f"記事が見つかりません: {args.url}", file=sys.stderr)
+                return 1
+            print(f"更新履歴: {count}件")
+        elif args.command == 'search-index':
+            print(f"{build_search_index(session, args.batch_size)}件の記事を全文検索の索引に登録しました")
+        elif args.command == 'search':
+            search.create_index(session)
+            began = time.perf_counter()
+            hits = search.search(session, ' '.join(args.terms), args.limit, args.newest)
+            elapsed = (time.perf_counter() - began) * 1000
+            for hit in hits:
+                print(f"{hit.post_date} {hit.title}\n  {hit.url}\n  {hit.snippet}")
+            print(f"{len(hits)}件 ({elapsed:.1f}ms)")
+    finally:
+        session.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
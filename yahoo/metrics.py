@@ -0,0 +1,425 @@
+"""
+実行中の処理時間とキューの長さ等を計測し、スパイダーの終了時に出力するモジュール。
+
+- 処理時間はヒストグラム(Histogram)で集計する。ナビゲーション、セレクターの待機、DOMからの抽出、
+  パイプライン毎のアイテムの処理時間、データベースのコミット時間を、各処理からobserveで記録する。
+- キューの長さ(スケジューラー、ダウンロード中、データベースの書き込み待ち)と開いているPlaywrightのページ数は、
+  register_gaugeで登録した関数をMetricsExtensionが一定間隔(METRICS_INTERVAL秒)で呼び出して記録する。
+- スパイダーの終了時に、Prometheus(node_exporterのtextfile collector)形式のファイルとJSON形式の実行レポートを出力する。
+
+計測値はモジュール全体で共有するMETRICSに記録する(書き込みスレッドからも記録できるようにロックで保護する)。
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from inspect import isawaitable
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.pipelines import ItemPipelineManager
+from scrapy.utils.defer import deferred_f_from_coro_f
+from twisted.internet import task
+from twisted.internet.defer import Deferred
+from common_func import setup_logger
+from const import LOG_LEVEL, LOG_FILE
+
+logger = setup_logger('news', LOG_FILE, LOG_LEVEL)
+
+PREFIX = 'yahoo_news'
+# 処理時間のヒストグラムの区切り(秒)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# 記録する処理時間の説明(Prometheusの# HELP)
+HISTOGRAMS = {
+    'http_fetch_seconds': "HTTP優先取得でのHTTPの取得時間",
+    'navigation_seconds': "Playwrightのナビゲーション時間(page.gotoとHTMLの取得)",
+    'selector_wait_seconds': "wait_for_selector等のPageMethodの実行時間",
+    'extraction_seconds': "DOMからの記事の情報の抽出時間",
+    'pipeline_seconds': "パイプライン毎のアイテムの処理時間",
+    'db_commit_seconds': "データベースへの書き込み(コミットまで)の時間",
+}
+# 記録する値の説明
+GAUGES = {
+    'queue_depth': "キューの長さ",
+    'open_pages': "開いているPlaywrightのページ数",
+}
+
+
+class Histogram:
+    """
+    処理時間のヒストグラム。
+
+    Attributes:
+        buckets (tuple): 区切り(秒)
+        counts (list): 区切り毎の件数(最後は区切りを超えた件数)
+        total (float): 合計
+        count (int): 件数
+        maximum (float): 最大値
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.maximum = 0.0
+
+    def observe(self, value):
+        """
+        値を追加する。
+
+        :param value: 処理時間(秒)
+        """
+        index = len(self.buckets)
+        for (position, bound) in enumerate(self.buckets):
+            if value <= bound:
+                index = position
+                break
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+        self.maximum = max(self.maximum, value)
+
+    def quantile(self, q):
+        """
+        パーセンタイルを区切りの中で線形補間して推定する。
+
+        :param q: パーセンタイル(0〜1)
+        :return: float: 件数が0の場合はNone
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for (position, count) in enumerate(self.counts):
+            upper = self.buckets[position] if position < len(self.buckets) else self.maximum
+            if count and cumulative + count >= rank:
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = upper
+        return self.maximum
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'max': self.maximum,
+            'buckets': dict(zip([*map(str, self.buckets), '+Inf'], self.counts)),
+        }
+
+
+class Gauge:
+    """
+    一定間隔で記録した値の推移。
+
+    Attributes:
+        samples (list): (実行開始からの秒数, 値)のリスト
+    """
+
+    def __init__(self):
+        self.samples = []
+
+    def set(self, elapsed, value):
+        self.samples.append((round(elapsed, 3), value))
+
+    @property
+    def last(self):
+        return self.samples[-1][1] if self.samples else None
+
+    def to_dict(self):
+        values = [value for (_, value) in self.samples]
+        return {
+            'last': self.last,
+            'max': max(values) if values else None,
+            'mean': sum(values) / len(values) if values else None,
+            'samples': self.samples,
+        }
+
+
+class MetricsRegistry:
+    """
+    計測値の記録先。
+
+    Attributes:
+        histograms (dict): (名前, ラベル)毎のHistogram
+        gauges (dict): (名前, ラベル)毎のGauge
+        providers (dict): (名前, ラベル)毎の、値を返す関数(register_gaugeで登録)
+        started (float): 計測を開始した時刻(time.monotonic)
+        started_at (datetime): 計測を開始した日時
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.gauges = {}
+        self.providers = {}
+        self.start()
+
+    def start(self):
+        """
+        計測の開始時刻を記録する。
+        """
+        self.started = time.monotonic()
+        self.started_at = datetime.now()
+
+    def observe(self, name, seconds, **labels):
+        """
+        処理時間を記録する。
+
+        :param name: ヒストグラムの名前(HISTOGRAMSのキー)
+        :param seconds: 処理時間(秒)
+        :param labels: ラベル(page_type、pipeline等)
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def timer(self, name, **labels):
+        """
+        withブロックの処理時間を記録するコンテキストマネージャを返す。
+
+        :param name: ヒストグラムの名前
+        :param labels: ラベル
+        """
+        return _Timer(self, name, labels)
+
+    def register_gauge(self, name, provider, **labels):
+        """
+        一定間隔で記録する値を返す関数を登録する。
+
+        :param name: 値の名前(GAUGESのキー)
+        :param provider: 値を返す関数
+        :param labels: ラベル(queue等)
+        """
+        with self.lock:
+            self.providers[(name, tuple(sorted(labels.items())))] = provider
+
+    def sample(self):
+        """
+        登録した関数を呼び出して値を記録する。
+        """
+        elapsed = time.monotonic() - self.started
+        with self.lock:
+            providers = list(self.providers.items())
+        for (key, provider) in providers:
+            try:
+                value = provider()
+            except Exception as e:
+                logger.debug(f"[metrics]{key[0]}を取得できませんでした: {e}")
+                continue
+            with self.lock:
+                gauge = self.gauges.get(key)
+                if gauge is None:
+                    gauge = self.gauges[key] = Gauge()
+                gauge.set(elapsed, value)
+
+    def prometheus(self, counters=None, labels=None):
+        """
+        Prometheusのテキスト形式で返す。
+
+        :param counters: 併せて出力する件数等の値({名前: 値})
+        :param labels: 全ての値に付けるラベル(worker等)
+        :return: str
+        """
+        base = tuple(sorted((labels or {}).items()))
+        lines = []
+        with self.lock:
+            for (name, description) in HISTOGRAMS.items():
+                series = sorted((key[1], histogram) for (key, histogram) in self.histograms.items() if key[0] == name)
+                if not series:
+                    continue
+                lines += [f"# HELP {PREFIX}_{name} {description}", f"# TYPE {PREFIX}_{name} histogram"]
+                for (series_labels, histogram) in series:
+                    cumulative = 0
+                    for (bound, count) in zip([*map(str, histogram.buckets), '+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append(f"{PREFIX}_{name}_bucket{_labels(base + series_labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{PREFIX}_{name}_sum{_labels(base + series_labels)} {histogram.total}")
+                    lines.append(f"{PREFIX}_{name}_count{_labels(base + series_labels)} {histogram.count}")
+            for (name, description) in GAUGES.items():
+                series = sorted((key[1], gauge) for (key, gauge) in self.gauges.items() if key[0] == name and gauge.samples)
+                if not series:
+                    continue
+                lines += [f"# HELP {PREFIX}_{name} {description}(終了時)", f"# TYPE {PREFIX}_{name} gauge"]
+                lines += [f"{PREFIX}_{name}{_labels(base + series_labels)} {gauge.last}" for (series_labels, gauge) in series]
+                lines += [f"# HELP {PREFIX}_{name}_max {description}(実行中の最大)", f"# TYPE {PREFIX}_{name}_max gauge"]
+                lines += [f"{PREFIX}_{name}_max{_labels(base + series_labels)} {gauge.to_dict()['max']}" for (series_labels, gauge) in series]
+        for (name, value) in (counters or {}).items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines += [f"# TYPE {PREFIX}_{name} gauge", f"{PREFIX}_{name}{_labels(base)} {value}"]
+        return '\n'.join(lines) + '\n'
+
+    def report(self):
+        """
+        JSON形式の実行レポート用の辞書を返す。
+
+        :return: dict
+        """
+        with self.lock:
+            return {
+                'histograms': {
+                    f"{name}{_labels(labels)}": histogram.to_dict() for ((name, labels), histogram) in sorted(self.histograms.items())
+                },
+                'gauges': {
+                    f"{name}{_labels(labels)}": gauge.to_dict() for ((name, labels), gauge) in sorted(self.gauges.items())
+                },
+            }
+
+
+class _Timer:
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class TimedItemPipelineManager(ItemPipelineManager):
+    """
+    パイプライン毎のprocess_itemの処理時間を記録するItemPipelineManager(settings.pyのITEM_PROCESSORに指定して使用する)。
+    Deferredやコルーチンを返すパイプライン(SQLAlchemyPipeline等)は、結果が確定するまでの時間を記録する。
+    """
+
+    def _add_middleware(self, pipe):
+        super()._add_middleware(pipe)
+        if hasattr(pipe, 'process_item'):
+            self.methods['process_item'][-1] = deferred_f_from_coro_f(_timed(pipe.process_item, type(pipe).__name__))
+
+
+def _timed(process_item, name):
+    def wrapper(item, spider):
+        started = time.perf_counter()
+        observe = lambda: METRICS.observe('pipeline_seconds', time.perf_counter() - started, pipeline=name)
+        try:
+            result = process_item(item, spider)
+        except Exception:
+            observe()
+            raise
+        if isinstance(result, Deferred):
+            return result.addBoth(lambda value: (observe(), value)[1])
+        if isawaitable(result):
+            return _observe_awaitable(result, observe)
+        observe()
+        return result
+    return wrapper
+
+
+async def _observe_awaitable(awaitable, observe):
+    try:
+        return await awaitable
+    finally:
+        observe()
+
+
+class MetricsExtension:
+    """
+    キューの長さ等を一定間隔で記録し、スパイダーの終了時に計測値を出力する拡張機能。
+
+    - METRICS_PROMETHEUS_FILE: Prometheus形式のファイル(フロンティアを使用する場合はファイル名にワーカーIDを付ける)
+    - METRICS_REPORT_DIR: JSON形式の実行レポートの保存先(run_YYYYMMDD_hhmmss.json)
+
+    Attributes:
+        interval (float): 値を記録する間隔(秒)
+        prometheus_file (str): Prometheus形式のファイルのパス(Noneの場合は出力しない)
+        report_dir (str): 実行レポートの保存先(Noneの場合は出力しない)
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('METRICS_ENABLED', True):
+            raise NotConfigured
+        self.crawler = crawler
+        self.interval = settings.getfloat('METRICS_INTERVAL', 5.0)
+        self.prometheus_file = settings.get('METRICS_PROMETHEUS_FILE')
+        self.report_dir = settings.get('METRICS_REPORT_DIR')
+        self.loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def spider_opened(self, spider):
+        METRICS.start()
+        engine = self.crawler.engine
+        METRICS.register_gauge('queue_depth', lambda: len(engine.slot.scheduler), queue='scheduler')
+        METRICS.register_gauge('queue_depth', lambda: len(engine.downloader.active), queue='downloader')
+        METRICS.register_gauge('queue_depth', lambda: len(engine.scraper.slot.queue) + len(engine.scraper.slot.active), queue='scraper')
+        self.loop = task.LoopingCall(METRICS.sample)
+        self.loop.start(self.interval, now=True)
+
+    def spider_closed(self, spider, reason):
+        if self.loop and self.loop.running:
+            self.loop.stop()
+        METRICS.sample()
+        counters = {
+            name: getattr(spider, name, None)
+            for name in ('fetch_count', 'pass_count', 'skip_count', 'error_count', 'skip_seen_count', 'near_duplicate_count', 'budget_skip_count')
+        }
+        counters['run_duration_seconds'] = round(time.monotonic() - METRICS.started, 3)
+        counters['last_run_timestamp_seconds'] = int(time.time())
+        frontier = getattr(spider, 'frontier', None)
+        worker = getattr(spider, 'worker_id', None) if frontier else None
+        try:
+            if self.prometheus_file:
+                path = self.prometheus_file
+                if worker:
+                    root, extension = os.path.splitext(path)
+                    path = f"{root}_{worker}{extension}"
+                _write_atomic(path, METRICS.prometheus(counters, {'worker': worker} if worker else None))
+            if self.report_dir:
+                report = {
+                    'started_at': METRICS.started_at.isoformat(timespec='seconds'),
+                    'finished_at': datetime.now().isoformat(timespec='seconds'),
+                    'reason': reason,
+                    'worker': worker,
+                    'counters': counters,
+                    **METRICS.report(),
+                }
+                name = f"run_{METRICS.started_at:%Y%m%d_%H%M%S}{'_' + worker if worker else ''}.json"
+                _write_atomic(os.path.join(self.report_dir, name), json.dumps(report, ensure_ascii=False, indent=2))
+        except OSError as e:
+            logger.error(f"[metrics]計測値を出力できませんでした: {e}")
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for (key, value) in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _write_atomic(path, text):
+    """
+    一時ファイルに書き込んでから置き換える(textfile collectorが書き込み途中のファイルを読まないようにする)。
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temporary, path)
+
+
+METRICS = MetricsRegistry()
@@ -3,16 +3,21 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import asyncio
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest
+from scrapy.utils.defer import deferred_to_future
+from scrapy_playwright.page import PageMethod
+from twisted.internet import threads
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
-import scrapy
-from scrapy_playwright.page import PageMethod
 
+from browser import PagePool
+from latency import LatencyTracker, RunBudget
+from scrapy.utils.httpobj import urlparse_cached
 from common_func import post_slack
-from yahoo.const import ARTICLE_SELECTOR, TIMEOUT, TOP_PICS_SELECTOR, TOP_PICS_URL
-from spiders.news import NewsSpider
+from yahoo.const import FRONTIER_POLITENESS_INTERVAL, PAGE_POOL_CONTEXTS, PAGE_POOL_SIZE
 
 class YahooSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -113,8 +118,9 @@ class ScrapyRetryMiddleware:
 
     このミドルウェアは、スクレイピングプロセス中に発生したエラーを捕捉し、
     設定されたSlackチャンネルにエラー情報を送信します。エラー情報には、
-    エラーの内容、現在のリトライ回数、設定された最大リトライ回数、
+    エラーの内容、ページの種類、エラーが発生したリクエストのリトライ回数、設定された最大リトライ回数、
     およびエラーが発生したURLが含まれます。
+    リトライ回数はリクエストのmetaから取得するため、並列に処理している他のリクエストの影響を受けません。
 
     Attributes:
         crawler (Crawler): ScrapyのCrawlerインスタンス。シグナルの接続に使用されます。
@@ -123,7 +129,6 @@ class ScrapyRetryMiddleware:
         from_crawler(cls, crawler): クラスメソッド。Crawlerインスタンスを受け取り、インスタンスを初期化してシグナルを接続します。
         spider_error(self, failure, response, spider): エラーが発生した際に呼び出されるメソッド。エラー情報をSlackに通知します。
     """
-    retry_times = 0
     @classmethod
     def from_crawler(cls, crawler):
         s = cls()
@@ -132,53 +137,267 @@ class ScrapyRetryMiddleware:
 
     def spider_error(self, failure, response, spider):
         print("spider_error")
-        max_retry_times = spider.settings.get('RETRY_TIMES')
-        #現在のリトライ回数を取得
-        # retry_times = response.meta.get('retry_times')
+        max_retry_times = spider.settings.getint('RETRY_TIMES')
+        #エラーが発生したリクエストのリトライ回数とページの種類を取得
+        retry_times = response.meta.get('retry_times', 0)
+        page_type = response.meta.get('page_type')
         
-        if self.retry_times < max_retry_times:
-            self.retry_times += 1
-            post_slack(f"スクレイピング中にエラーが発生した為リトライします。エラー内容: {failure.getErrorMessage()}\nリトライ回数: {self.retry_times}/{max_retry_times}\nURL: {response.url}")
-            spider.logger.info(f"Retrying ({self.retry_times}/{max_retry_times}) for {response.url}")
-            
-            #statusによってscrapy.Requestのselectorとcallbackメソッドを変更
-            if spider.status == "start_requests":
-                selector = TOP_PICS_SELECTOR
-                callback = spider.start_parse
-            elif spider.status == "start_parse":
-                selector = ARTICLE_SELECTOR
-                callback = spider.parse_headline
-            elif spider.status == "start_parse_next_page":
-                selector = TOP_PICS_SELECTOR
-                callback = spider.start_parse
-            elif spider.status == "parse_headline":
-                selector = ARTICLE_SELECTOR
-                callback = spider.parse_article
-            elif spider.status == "parse_article":
-                selector = ARTICLE_SELECTOR
-                callback = spider.parse_article
-            
-            #リトライするためのリクエストを作成
-            return scrapy.Request(
-                TOP_PICS_URL,
-                meta={
-                    'playwright': True,
-                    'playwright_include_page': True,
-                    'playwright_page_methods': [
-                        PageMethod('wait_for_selector', TOP_PICS_SELECTOR, timeout=TIMEOUT),
-                    ],
-                    # 'title': response.meta['title'],
-                    # 'article_number': response.meta['article_number'],
-                    # 'post_date': response.meta['post_date'],
-                    # 'url': response.url,
-                    'retry_times': self.retry_times,
-                },
-                callback=NewsSpider.start_parse,
-                errback=NewsSpider.errback,
-                dont_filter=True,
+        if retry_times < max_retry_times:
+            post_slack(f"スクレイピング中にエラーが発生しました。エラー内容: {failure.getErrorMessage()}\nページの種類: {page_type}\nリトライ回数: {retry_times}/{max_retry_times}\nURL: {response.url}")
+            spider.logger.info(f"Error in callback ({page_type}, {retry_times}/{max_retry_times}) for {response.url}")
+        else:
+            post_slack(f"スクレイピング中にエラーが発生しました。リトライ回数が上限に達しています。エラー内容: {failure.getErrorMessage()}\nページの種類: {page_type}\nリトライ回数: {retry_times}/{max_retry_times}\nURL: {response.url}")
+            spider.logger.error(f"Error in callback for {response.url} after {retry_times} retries")
+
+
+class AdaptiveSchedulerMiddleware:
+    """
+    記事ページの同時レンダリング数を制限し、ドメイン毎の待機時間をレイテンシとエラー率に応じて調整するミドルウェア。
+
+    記事ページ(page_typeが'headline'または'article'のリクエスト)は、同時にMAX_ARTICLE_RENDERS件までしか
+    ダウンローダーに渡さない。一覧ページはこの制限を受けない。
+    レスポンス受信毎にダウンロードスロット(ドメイン)の待機時間を
+    「レイテンシ / ADAPTIVE_DELAY_TARGET_CONCURRENCY」に近づけ、エラー率が高い場合は待機時間を延ばす。
+    エラー(例外、429、5xx)発生時は待機時間をADAPTIVE_DELAY_BACKOFF倍にする。
+
+    Attributes:
+        crawler (Crawler): ScrapyのCrawlerインスタンス。ダウンロードスロットの参照に使用します。
+        semaphore (asyncio.Semaphore): 記事ページの同時レンダリング数を制限するセマフォ
+        error_rates (dict): ダウンロードスロット毎のエラー率(指数移動平均)
+    """
+    RENDER_PAGE_TYPES = ('headline', 'article')
+    ERROR_STATUSES = (403, 429, 500, 502, 503, 504)
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.semaphore = asyncio.Semaphore(settings.getint('MAX_ARTICLE_RENDERS', 4))
+        self.adaptive_delay = settings.getbool('ADAPTIVE_DELAY_ENABLED', True)
+        self.start_delay = settings.getfloat('ADAPTIVE_DELAY_START', 1.0)
+        self.min_delay = settings.getfloat('DOWNLOAD_DELAY', 0.5)
+        self.max_delay = settings.getfloat('ADAPTIVE_DELAY_MAX', 30.0)
+        self.target_concurrency = settings.getfloat('ADAPTIVE_DELAY_TARGET_CONCURRENCY', 2.0)
+        self.backoff = settings.getfloat('ADAPTIVE_DELAY_BACKOFF', 2.0)
+        self.error_rates = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        return s
+
+    def spider_opened(self, spider):
+        if self.adaptive_delay:
+            spider.download_delay = max(self.start_delay, self.min_delay)
+
+    async def process_request(self, request, spider):
+        # 記事ページはセマフォを取得できるまでダウンローダーに渡さない
+        if request.meta.get('page_type') in self.RENDER_PAGE_TYPES and not request.meta.get('render_slot'):
+            await self.semaphore.acquire()
+            request.meta['render_slot'] = True
+        return None
+
+    def process_response(self, request, response, spider):
+        self._release(request)
+        self._adjust_delay(request, request.meta.get('download_latency'), response.status in self.ERROR_STATUSES)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        self._release(request)
+        if isinstance(exception, IgnoreRequest): # 送信しなかったリクエストはエラーとして扱わない
+            return
+        self._adjust_delay(request, request.meta.get('download_latency'), True)
+
+    def _release(self, request):
+        """
+        リクエストが保持しているレンダリング枠を解放する。複数回呼ばれても1度だけ解放する。
+        """
+        if request.meta.pop('render_slot', False):
+            self.semaphore.release()
+
+    def _adjust_delay(self, request, latency, error):
+        """
+        ダウンロードスロットの待機時間をレイテンシとエラー率から再計算する。
+
+        :param request: 完了したリクエスト
+        :param latency: ダウンロードにかかった秒数(不明な場合はNone)
+        :param error: エラーとして扱うかどうか
+        """
+        if not self.adaptive_delay:
+            return
+        key = request.meta.get('download_slot')
+        slot = self.crawler.engine.downloader.slots.get(key) if self.crawler.engine else None
+        if slot is None:
+            return
+        # エラー率は直近の結果を重視した指数移動平均で管理する
+        error_rate = self.error_rates.get(key, 0.0) * 0.8 + (0.2 if error else 0.0)
+        self.error_rates[key] = error_rate
+
+        if error:
+            new_delay = max(slot.delay, self.min_delay) * self.backoff
+        elif latency is not None:
+            target_delay = latency / self.target_concurrency * (1.0 + error_rate)
+            new_delay = (slot.delay + target_delay) / 2.0
+        else:
+            return
+        new_delay = min(max(self.min_delay, new_delay), self.max_delay)
+        if new_delay != slot.delay:
+            self.crawler.spider.logger.debug(
+                f"[adaptive_delay]{key}: {slot.delay:.2f}s -> {new_delay:.2f}s (latency: {latency}, error_rate: {error_rate:.2f})"
             )
+            slot.delay = new_delay
+
+
+class AdaptiveTimeoutMiddleware:
+    """
+    ページの種類毎の取得時間の分布から、Playwrightのナビゲーションとページの操作(PageMethod)のタイムアウトを設定するミドルウェア。
 
+    レンダリングしたリクエストの取得時間(download_latency)をページの種類(page_type)毎に記録し(latency.LatencyTracker)、
+    送信するリクエストのタイムアウトを「p99 × ADAPTIVE_TIMEOUT_MULTIPLIER」にする。タイムアウトの範囲は
+    ADAPTIVE_TIMEOUT_FLOOR〜PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT(ミリ秒)。タイムアウトしたリクエストは
+    タイムアウトまでの時間を取得時間として記録するため、短すぎるタイムアウトは次第に延びる。
+    page.gotoはplaywright_page_goto_kwargs、PageMethodはpage.set_default_timeout(最初に実行するPageMethod)と
+    各PageMethodのtimeoutの指定でタイムアウトを設定する。PageMethodの実行毎のwait_for_load_stateは、scrapy-playwrightが
+    PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUTを指定するため上限のままだが、page.gotoで読み込みが完了しているため待機しない。
+    タイムアウトはリクエストをダウンローダーに渡す時点の分布で決めるため、AdaptiveSchedulerMiddlewareより後に配置する。
+
+    RUN_TIME_BUDGET(秒)を超えた後は、一覧ページと優先度がRUN_BUDGET_MIN_PRIORITY未満のリクエスト(リトライ)を
+    IgnoreRequestで破棄する(latency.RunBudget)。破棄したリクエストはmeta['budget_exceeded']がTrueになり、スパイダーのerrbackはリトライしない。
+
+    Attributes:
+        enabled (bool): タイムアウトを調整するかどうか(ADAPTIVE_TIMEOUT_ENABLED)
+        tracker (LatencyTracker): ページの種類毎の取得時間の分布
+        budget (RunBudget): 実行全体の時間の予算
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.enabled = settings.getbool('ADAPTIVE_TIMEOUT_ENABLED', True)
+        self.tracker = LatencyTracker(
+            window=settings.getint('ADAPTIVE_TIMEOUT_WINDOW', 200),
+            quantile=settings.getfloat('ADAPTIVE_TIMEOUT_QUANTILE', 0.99),
+            multiplier=settings.getfloat('ADAPTIVE_TIMEOUT_MULTIPLIER', 3.0),
+            floor=settings.getint('ADAPTIVE_TIMEOUT_FLOOR', 15000),
+            ceiling=settings.getint('PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT', 90000),
+            min_samples=settings.getint('ADAPTIVE_TIMEOUT_MIN_SAMPLES', 20),
+        )
+        self.budget = RunBudget(settings.getfloat('RUN_TIME_BUDGET', 0), settings.getint('RUN_BUDGET_MIN_PRIORITY', 0))
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def spider_opened(self, spider):
+        self.budget.start()
+        spider.latency = self.tracker
+        spider.run_budget = self.budget
+
+    def spider_closed(self, spider):
+        for (page_type, summary) in self.tracker.summary().items():
+            spider.logger.info(
+                f"[adaptive_timeout]{page_type}: {summary['count']}件 p50: {summary['p50']:.2f}s p99: {summary['p99']:.2f}s タイムアウト: {summary['timeout']}ms"
+            )
+        if self.budget.dropped:
+            spider.logger.info(f"[run_budget]実行時間の予算を超えたため{self.budget.dropped}件のリクエストを送信しませんでした")
+
+    def process_request(self, request, spider):
+        if not self.budget.allows(request):
+            self.budget.dropped += 1
+            request.meta['budget_exceeded'] = True
+            raise IgnoreRequest(f"実行時間の予算({self.budget.seconds}秒)を超えたため送信しません: {request.url}")
+        page_type = request.meta.get('page_type')
+        if not self.enabled or not request.meta.get('playwright') or page_type is None:
+            return None
+        timeout = self.tracker.timeout(page_type)
+        request.meta['adaptive_timeout'] = timeout
+        request.meta['playwright_page_goto_kwargs'] = {**(request.meta.get('playwright_page_goto_kwargs') or {}), 'timeout': timeout}
+        # ページの既定のタイムアウトを最初に設定し、タイムアウトを指定したPageMethodは指定を置き換える
+        methods = [method for method in request.meta.get('playwright_page_methods') or () if method.method != 'set_default_timeout']
+        for method in methods:
+            if 'timeout' in method.kwargs and method.method != 'wait_for_timeout':
+                method.kwargs['timeout'] = timeout
+        request.meta['playwright_page_methods'] = [PageMethod('set_default_timeout', timeout), *methods]
+        return None
+
+    def process_response(self, request, response, spider):
+        latency = request.meta.get('download_latency')
+        # HTTPで取得できたページ(meta['rendered']がFalse)はレンダリングより速いため記録しない
+        if latency is not None and response.status == 200 and request.meta.get('rendered', request.meta.get('playwright')):
+            self._record(request, latency)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if 'Timeout' in type(exception).__name__ and 'adaptive_timeout' in request.meta:
+            self._record(request, request.meta['adaptive_timeout'] / 1000)
+
+    def _record(self, request, seconds):
+        page_type = request.meta.get('page_type')
+        if self.enabled and page_type is not None:
+            self.tracker.record(page_type, seconds)
+
+
+class PagePoolMiddleware:
+    """
+    Playwrightのリクエストに再利用可能なページを割り当てるミドルウェア。
+
+    スパイダーのコールバックで使い終わったページはspider.page_pool(browser.PagePool)に戻され、
+    このミドルウェアが次のリクエストのmeta['playwright_page']に割り当てる。
+    再利用可能なページが無い場合は、ページを作成するブラウザコンテキストをmeta['playwright_context']に設定する。
+
+    Attributes:
+        pool (PagePool): ページのプール
+    """
+
+    def __init__(self):
+        self.pool = PagePool(PAGE_POOL_SIZE, PAGE_POOL_CONTEXTS)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls()
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        return s
+
+    def spider_opened(self, spider):
+        spider.page_pool = self.pool
+
+    def process_request(self, request, spider):
+        if not request.meta.get('playwright'):
+            return None
+        page = request.meta.get('playwright_page')
+        if page is not None and not page.is_closed():
+            return None
+        page, context_name = self.pool.acquire()
+        request.meta['playwright_context'] = context_name
+        if page:
+            request.meta['playwright_page'] = page
         else:
-            post_slack(f"スクレイピング中にエラーが発生したため終了します。エラー内容: {failure.getErrorMessage()}\nリトライ回数: {self.retry_times}/{max_retry_times}\nURL: {response.url}")
-            spider.logger.error(f"Giving up on {response.url} after {self.retry_times} retries")
-            
+            request.meta.pop('playwright_page', None)
+        return None
+
+
+class FrontierPolitenessMiddleware:
+    """
+    複数ワーカーで取得する場合(spider.frontierがある場合)に、全ワーカー合計でのドメイン毎のリクエスト間隔を守るミドルウェア。
+
+    リクエスト毎にフロンティアでドメインの次のリクエスト枠を予約し、枠の時刻まで待機してからダウンローダーに渡す。
+    予約はフロンティアへの書き込み(SQLiteのロック待ちを含む)のため、reactorを止めないようスレッドプールで行う。
+    キャッシュから返されたリクエストは枠を消費しないよう、HttpCacheMiddlewareより後に配置する。
+
+    Attributes:
+        interval (float): ドメイン毎のリクエスト間隔(秒)
+    """
+
+    def __init__(self, interval=FRONTIER_POLITENESS_INTERVAL):
+        self.interval = interval
+
+    async def process_request(self, request, spider):
+        frontier = getattr(spider, 'frontier', None)
+        if frontier is None or self.interval <= 0:
+            return None
+        wait = await deferred_to_future(threads.deferToThread(frontier.reserve, urlparse_cached(request).hostname, self.interval))
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return None
@@ -4,15 +4,22 @@
 `Article` クラスは、ニュース記事の情報を表すモデルで、
 記事のID、タイトル、記事番号、投稿日、URL、および記事本文を属性として持ちます。
 記事の本文は、特定のリンクのセレクターが特殊であるため、取得に失敗する可能性があることから、NULLを許可しています。
+記事の本文はzstdで圧縮して保存することもでき(const.pyのDB_COMPRESS_ARTICLES参照)、
+圧縮に使用する辞書は `CompressionDict` クラスのテーブルにバージョン付きで保存します。
+投稿日は文字列(post_date)に加えて、期間で検索するためのインデックス付きの日時(posted_at)でも保存します。
+記事の更新は、タイトルと本文のハッシュ(content_hash)で検出し、更新前の内容は差分として `ArticleRevision` クラスのテーブルに保存します。
+SQLiteの場合は、接続時にWAL等の高速化の設定を適用できます(const.pyのSQLITE_PERFORMANCE_PROFILE参照)。
 
 データベース接続とテーブル作成のためのエンジンとセッションの設定は、
 実際のデータベース接続情報に基づいて適宜調整する必要があります。
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
+from datetime import datetime
+from sqlalchemy import create_engine, event, inspect, text, BigInteger, Column, Integer, LargeBinary, String, Text, DateTime
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from const import MYSQL_PATH, SQLITE_PATH, DB_TYPE
+from sqlalchemy.orm import object_session, sessionmaker
+import compression
+from const import MYSQL_PATH, SQLITE_PATH, DB_TYPE, SQLITE_PERFORMANCE_PROFILE, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE
 
 Base = declarative_base()
 
@@ -28,24 +35,158 @@ class Article(Base):
 		title (String): 記事のタイトル。NULLを許可しません。
 		article_number (String): 記事の番号または識別子。NULLを許可しません。
 		post_date (String): 記事の投稿日。DateTime型ではなく、特定のフォーマットの文字列として格納されます。NULLを許可しません。
+		posted_at (DateTime): 記事の投稿日時。期間での検索用にインデックスを作成します。エラー記事の場合はNULLです。
 		url (String): 記事のURL。一意である必要があり、NULLを許可しません。
 		article (Text): 記事の本文。特定のリンクのセレクターが特殊である場合、取得に失敗することがあるため、NULLを許可します。
+			圧縮して保存した記事の場合はNULLになり、モデルのarticle属性から参照した際に展開した本文を返します。
+		article_zstd (LargeBinary): zstdで圧縮した記事の本文。圧縮せずに保存した記事の場合はNULLです。
+		dict_id (Integer): 圧縮に使用した辞書のID(CompressionDict参照)。辞書を使用せずに圧縮した場合はNULLです。
+		simhash (BigInteger): 重複記事の検出に使用する本文のSimHash(符号付き64bit整数)。本文が無い場合はNULLです。
+		duplicate_of (String): 本文が類似する保存済の記事のURL。重複記事ではない場合はNULLです。
+		content_hash (String): 記事のタイトルと本文のハッシュ(revisions.py参照)。更新の検出に使用します。
+		updated_at (DateTime): 記事の内容を最後に更新した日時。更新されていない記事の場合はNULLです。
 	"""
 	__tablename__ = 'articles'
 	
 	id = Column(Integer, primary_key=True, autoincrement=True)
 	title = Column(String(255), nullable=False)
 	article_number = Column(String(255), nullable=False)
-	# post_date = Column(DateTime, nullable=False)
 	post_date = Column(String(12), nullable=False)
+	posted_at = Column(DateTime, nullable=True, index=True)
 	url = Column(String(255), unique=True, nullable=False)
-	article = Column(Text, nullable=True)
+	_article = Column('article', Text, nullable=True)
+	article_zstd = Column(LargeBinary, nullable=True)
+	dict_id = Column(Integer, nullable=True)
+	simhash = Column(BigInteger, nullable=True)
+	duplicate_of = Column(String(255), nullable=True)
+	content_hash = Column(String(32), nullable=True)
+	updated_at = Column(DateTime, nullable=True)
 # 記事のリンクによってはセレクターが特殊な場合があり、記事の取得に失敗することがあるため、articleはNULLを許可する
 
+	@property
+	def article(self):
+		"""
+		記事の本文。圧縮して保存した記事の場合は展開して返します。
+		"""
+		if self.article_zstd is None:
+			return self._article
+		return compression.decompress(self.article_zstd, self.dict_id, lambda dict_id: load_dictionary(object_session(self), dict_id))
+
+	@article.setter
+	def article(self, value):
+		self._article = value
+		self.article_zstd = None
+		self.dict_id = None
+
+
+class CompressionDict(Base):
+	"""
+	記事の本文の圧縮に使用するzstdの辞書を表すクラス。
+
+	辞書は学習し直す毎に新しいIDで追加し、既存の辞書は圧縮済の記事の展開のために残します。
+
+	Attributes:
+		id (Integer): 辞書のID(バージョン)。主キーとして自動インクリメントされます。
+		data (LargeBinary): 辞書の内容。
+		sample_count (Integer): 学習に使用した記事数。
+		created_at (DateTime): 辞書の作成日時。
+	"""
+	__tablename__ = 'compression_dicts'
+
+	id = Column(Integer, primary_key=True, autoincrement=True)
+	data = Column(LargeBinary, nullable=False)
+	sample_count = Column(Integer, nullable=False)
+	created_at = Column(DateTime, nullable=False, default=datetime.now)
+
+
+class ArticleRevision(Base):
+	"""
+	更新された記事の、更新前の内容を表すクラス。
+
+	更新前の本文は全体を保存せず、更新後の本文から復元するための差分(revisions.py参照)として保存します。
+	記事が複数回更新された場合は、最新の本文から新しい順に差分を適用して各時点の本文を復元します。
+
+	Attributes:
+		id (Integer): 更新履歴のID。主キーとして自動インクリメントされます。
+		article_id (Integer): 記事のID(Article参照)。
+		title (String): 更新前のタイトル。
+		content_hash (String): 更新前のタイトルと本文のハッシュ。
+		diff (Text): 更新後の本文から更新前の本文を復元するための差分(JSON)。
+		created_at (DateTime): 更新を検出した日時。
+	"""
+	__tablename__ = 'article_revisions'
+
+	id = Column(Integer, primary_key=True, autoincrement=True)
+	article_id = Column(Integer, nullable=False, index=True)
+	title = Column(String(255), nullable=False)
+	content_hash = Column(String(32), nullable=False)
+	diff = Column(Text, nullable=False)
+	created_at = Column(DateTime, nullable=False, default=datetime.now)
+
+
+def load_dictionary(session, dict_id):
+	"""
+	辞書のIDに対応する辞書の内容を読み込む関数。
+
+	Args:
+		session (Session): データベースセッション。
+		dict_id (int): 辞書のID。
+
+	Returns:
+		bytes: 辞書の内容。
+	"""
+	return session.get(CompressionDict, dict_id).data
+
+
+def upgrade_schema(engine):
+	"""
+	既存のデータベースに、モデルに追加した列とインデックスが無い場合は追加する関数。
+	既存の記事のposted_atの設定はmanage.py migrateで行います。
+
+	Args:
+		engine (Engine): データベースのエンジン。
+	"""
+	Base.metadata.create_all(bind=engine)
+	columns = {column['name'] for column in inspect(engine).get_columns(Article.__tablename__)}
+	with engine.begin() as connection:
+		for column in Article.__table__.columns:
+			if column.name not in columns:
+				column_type = column.type.compile(dialect=engine.dialect)
+				connection.execute(text(f"ALTER TABLE {Article.__tablename__} ADD COLUMN {column.name} {column_type}"))
+	for index in Article.__table__.indexes:
+		index.create(bind=engine, checkfirst=True)
+
+
+def apply_sqlite_profile(engine, mmap_size=SQLITE_MMAP_SIZE, cache_size=SQLITE_CACHE_SIZE):
+	"""
+	SQLiteのエンジンの接続時に、書き込みと検索を高速化する設定を適用する関数。
+
+	- journal_mode=WAL: 書き込み中も読み込みができ、コミット毎のロールバックジャーナルの同期が不要になります。
+	- synchronous=NORMAL: WALの場合はチェックポイント時のみ同期します(電源断時は直前のコミットが失われる可能性があります)。
+	- mmap_size: データベースファイルをメモリマップして読み込みます。
+	- cache_size: ページキャッシュのサイズです。
+
+	Args:
+		engine (Engine): SQLiteのエンジン。
+		mmap_size (int): メモリマップするサイズ(バイト)。
+		cache_size (int): ページキャッシュのサイズ(KB)。
+	"""
+	@event.listens_for(engine, 'connect')
+	def set_sqlite_pragma(dbapi_connection, connection_record):
+		cursor = dbapi_connection.cursor()
+		cursor.execute("PRAGMA journal_mode=WAL")
+		cursor.execute("PRAGMA synchronous=NORMAL")
+		cursor.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+		cursor.execute(f"PRAGMA cache_size=-{int(cache_size)}")
+		cursor.execute("PRAGMA temp_store=MEMORY")
+		cursor.close()
+
 # データベース接続とテーブル作成のためのエンジンとセッションを設定する部分は、
 # 実際のデータベース接続情報に基づいて適宜調整してください。
 if DB_TYPE == "SQLITE":
 	engine = create_engine(SQLITE_PATH) #sqlite3を使う場合
+	if SQLITE_PERFORMANCE_PROFILE:
+		apply_sqlite_profile(engine)
 elif DB_TYPE == "MYSQL":
 	engine = create_engine(MYSQL_PATH) #MySQLを使う場合
 Session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
\ No newline at end of file
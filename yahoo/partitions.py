@@ -0,0 +1,139 @@
+"""
+投稿日毎に分割・圧縮したCSVファイルの読み書きを行うモジュール。
+
+ファイルは「<保存先フォルダ>/YYYY/MM/DD.csv.gz」の形式で投稿日毎に分割する。
+投稿日が不明な記事(エラー記事等)は「<保存先フォルダ>/unknown.csv.gz」に保存する。
+圧縮形式はgzip(標準ライブラリ)またはzstd(zstandardパッケージが必要)で、
+実行毎に新しい圧縮ストリームを追記するため、既存のファイルを展開し直すことはない。
+"""
+import csv
+import gzip
+import io
+import os
+from common_func import setup_logger
+from const import LOG_LEVEL, LOG_FILE
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# ロガーの設定
+logger = setup_logger('news', LOG_FILE, LOG_LEVEL)
+
+CSV_HEADER = ['title', 'article_number', 'post_date', 'url', 'article']
+# 圧縮形式と拡張子の対応
+EXTENSIONS = {
+    None: '.csv',
+    'gzip': '.csv.gz',
+    'zstd': '.csv.zst',
+}
+
+
+def resolve_compression(compression):
+    """
+    使用できる圧縮形式を返す。zstdが指定されていてzstandardが無い場合はgzipを使用する。
+
+    :param compression: 'gzip', 'zstd'またはNone
+    :return: str or None
+    """
+    if compression == 'zstd' and zstandard is None:
+        logger.warning("zstandardがインストールされていないため、gzipで圧縮します")
+        return 'gzip'
+    return compression
+
+
+def partition_path(root, post_date, compression):
+    """
+    投稿日(YYYYMMDDhhmm形式)に対応するファイルのパスを返す。
+
+    :param root: 保存先フォルダ
+    :param post_date: 記事の投稿日
+    :param compression: 圧縮形式
+    :return: str
+    """
+    extension = EXTENSIONS[compression]
+    if not post_date or len(post_date) < 8 or not post_date[:8].isdigit():
+        return os.path.join(root, f"unknown{extension}")
+    return os.path.join(root, post_date[:4], post_date[4:6], f"{post_date[6:8]}{extension}")
+
+
+def iter_partition_files(root):
+    """
+    保存先フォルダ内のCSVファイルのパスをパス順に返す。
+
+    :param root: 保存先フォルダ
+    :return: list
+    """
+    paths = []
+    for (directory, _, files) in os.walk(root):
+        paths.extend(os.path.join(directory, name) for name in files if name.endswith(tuple(EXTENSIONS.values())))
+    return sorted(paths)
+
+
+def open_text(path):
+    """
+    CSVファイルを拡張子に応じて展開しながら読み込むテキストストリームを返す。
+
+    :param path: CSVファイルのパス
+    :return: TextIO
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', newline='', encoding='utf-8')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f"{path}の読み込みにはzstandardが必要です")
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(reader, newline='', encoding='utf-8')
+    return open(path, newline='', encoding='utf-8')
+
+
+class PartitionWriter:
+    """
+    1つのCSVファイルに圧縮しながら追記するライター。
+
+    Attributes:
+        path (str): CSVファイルのパス
+        compression (str): 圧縮形式
+    """
+
+    def __init__(self, path, compression, buffer_size):
+        self.path = path
+        self.compression = compression
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'ab', buffering=buffer_size)
+        if compression == 'gzip':
+            self.stream = gzip.GzipFile(fileobj=self.file, mode='ab')
+        elif compression == 'zstd':
+            self.stream = zstandard.ZstdCompressor().stream_writer(self.file, closefd=False)
+        else:
+            self.stream = self.file
+        self.text = io.TextIOWrapper(self.stream, newline='', encoding='utf-8', write_through=False)
+        self.writer = csv.writer(self.text)
+        if is_new:
+            self.writer.writerow(CSV_HEADER)
+
+    def writerow(self, row):
+        self.writer.writerow(row)
+
+    def flush(self):
+        """
+        バッファの内容を圧縮してファイルに書き込む。
+        """
+        self.text.flush()
+        if self.compression == 'zstd':
+            self.stream.flush(zstandard.FLUSH_BLOCK)
+        elif self.compression == 'gzip':
+            self.stream.flush()
+        self.file.flush()
+
+    def close(self):
+        """
+        圧縮ストリームを終端してファイルを閉じる。
+        """
+        self.text.flush()
+        self.text.detach()
+        if self.stream is not self.file:
+            self.stream.close()
+        self.file.close()
@@ -1,6 +1,9 @@
 """
 Yahooニュースのスクレイピング結果を保存するためのパイプラインクラスを定義します。
+NearDuplicatePipeline: 本文が類似する記事(重複記事)を検出し、印を付けるかスキップするパイプラインクラス
 CsvPipeline: CSVファイルに結果を保存するパイプラインクラス
+PartitionedCsvPipeline: 投稿日毎に分割・圧縮したCSVファイルに結果を保存するパイプラインクラス
+ParquetPipeline: 投稿日毎に分割したParquetファイルに結果を保存するパイプラインクラス(pyarrowが必要)
 SQLitePipeline: SQLiteデータベースに結果を保存するパイプラインクラス
 SQLAlchemyPipeline: SQLAlchemyを使用してデータベースに結果を保存するパイプラインクラス
 """
@@ -13,15 +16,111 @@ SQLAlchemyPipeline: SQLAlchemyを使用してデータベースに結果を保
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+import csv
+import os
+import queue
 import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import mysql, sqlite
 from sqlalchemy.exc import SQLAlchemyError
-from models import Base, Article, Session
+from scrapy.exceptions import DropItem, NotConfigured
+from twisted.internet import defer, task, threads
+from models import Article, ArticleRevision, CompressionDict, Session, upgrade_schema
+from revisions import content_hash, make_diff
+from simhash import SimHashIndex, simhash, to_signed, to_unsigned
+import compression
+import search
+from url_index import UrlIndex
+from metrics import METRICS
+from partitions import CSV_HEADER, PartitionWriter, partition_path, resolve_compression
 from common_func import setup_logger
-from const import CSV_FILE, LOG_LEVEL, LOG_FILE
+from dates import TIMEZONE, parse_post_date, to_naive
+from const import CSV_FILE, LOG_LEVEL, LOG_FILE, DB_BATCH_SIZE, DB_FLUSH_INTERVAL, DB_QUEUE_SIZE, DB_COMPRESS_ARTICLES, CSV_PARTITION_DIR, CSV_COMPRESSION, CSV_BUFFER_SIZE, CSV_FLUSH_INTERVAL, CSV_MAX_OPEN_PARTITIONS, PARQUET_DIR, PARQUET_BATCH_SIZE, PARQUET_ROW_GROUP_SIZE, PARQUET_COMPRESSION, PARQUET_DICTIONARY_COLUMNS, NEAR_DUPLICATE_MODE, NEAR_DUPLICATE_THRESHOLD, NEAR_DUPLICATE_MIN_LENGTH, NEAR_DUPLICATE_WINDOW_DAYS, SEARCH_INDEX_ENABLED
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
 
 # ロガーの設定
 logger = setup_logger('news', LOG_FILE, LOG_LEVEL)
 
+def check_single_process(crawler, name):
+    """
+    複数ワーカーで取得する場合(spider.frontierがある場合)は、パイプラインを無効にします。
+    CSVファイルと索引ファイルは1プロセスからの追記を前提とするため、ワーカー毎のプロセスから同じファイルに追記すると行が混在します。
+
+    :param crawler: Crawler
+    :param name: パイプラインのクラス名
+    """
+    if getattr(crawler.spider, 'frontier', None):
+        raise NotConfigured(f"複数ワーカーで取得するため、{name}を使用しません(記事はDBに保存されます)")
+
+class NearDuplicatePipeline:
+    """
+    本文が類似する記事(更新記事や配信元の転載等、URLが異なる同じ記事)を検出するパイプラインです。
+
+    本文のSimHash(simhash.py参照)を計算し、保存済の記事と実行中に処理した記事のSimHashの索引から最も近い記事を探します。
+    類似度(1 - ハミング距離 / 64)がNEAR_DUPLICATE_THRESHOLD以上の記事がある場合は重複記事とみなし、
+    NEAR_DUPLICATE_MODEが'mark'の場合はduplicate_ofに元の記事のURLを設定して保存し、'skip'の場合は保存しません。
+    保存済の記事のSimHashは、DBのsimhash列から直近NEAR_DUPLICATE_WINDOW_DAYS日分を読み込みます。
+    保存用のパイプラインより前(優先度の数値が小さい位置)に設定して使用します。
+    """
+
+    def __init__(self, mode=NEAR_DUPLICATE_MODE, threshold=NEAR_DUPLICATE_THRESHOLD, min_length=NEAR_DUPLICATE_MIN_LENGTH, window_days=NEAR_DUPLICATE_WINDOW_DAYS):
+        if mode == 'off':
+            raise NotConfigured("NEAR_DUPLICATE_MODEが'off'のため、重複記事の検出を行いません")
+        self.mode = mode
+        self.min_length = min_length
+        self.window_days = window_days
+        self.index = SimHashIndex(int((1 - threshold) * 64))
+
+    def open_spider(self, spider):
+        """
+        DBから保存済の記事のSimHashを読み込みます。
+        """
+        session = Session()
+        try:
+            upgrade_schema(session.get_bind())
+            query = select(Article.simhash, Article.url).where(Article.simhash.is_not(None))
+            if self.window_days:
+                # posted_atはAsia/Tokyoの日時(タイムゾーン情報無し)のため、実行環境のタイムゾーンに関わらずAsia/Tokyoの現在日時と比較する
+                query = query.where(Article.posted_at >= to_naive(datetime.now(TIMEZONE)) - timedelta(days=self.window_days))
+            for (value, url) in session.execute(query):
+                self.index.add(to_unsigned(value), url)
+        except SQLAlchemyError as e:
+            logger.warning(f"[near_duplicate]保存済の記事のSimHashを読み込めませんでした: {e}")
+        finally:
+            session.close()
+        logger.info(f"[near_duplicate]保存済の記事のSimHashを{len(self.index)}件読み込みました")
+
+    def process_item(self, item, spider):
+        """
+        本文のSimHashを計算し、重複記事の場合は印を付けるかスキップします。
+        """
+        article = item.get('article')
+        if not article or len(article) < self.min_length:
+            return item
+        value = simhash(article)
+        item['simhash'] = to_signed(value)
+        nearest = self.index.nearest(value)
+        if nearest and nearest[0] != item.get('url'):
+            url, distance = nearest
+            spider.near_duplicate_count += 1
+            if self.mode == 'skip':
+                raise DropItem(f"[near_duplicate]重複記事のためスキップします。リンク: {item.get('url')} 元の記事: {url} 距離: {distance}")
+            item['duplicate_of'] = url
+            logger.info(f"[near_duplicate]重複記事です。リンク: {item.get('url')} 元の記事: {url} 距離: {distance}")
+            return item
+        self.index.add(value, item.get('url'))
+        return item
+
 class CsvPipeline:
     """
     スクレイピングしたアイテムをCSVファイルに保存するパイプラインです。
@@ -29,27 +128,36 @@ class CsvPipeline:
     このパイプラインは、スパイダーの開始時にCSVファイルを開き、
     記事のタイトル、記事番号、投稿日、URL、本文を含む各アイテムを書き込みます。
     ただし、urlがすでにファイルに存在する場合、アイテムは無視されます。
+    保存済のURLはCSVファイルを読み込まずに、CSVファイルの隣の索引ファイルで判定します(url_index.py参照)。
+    複数ワーカーで取得する場合(spider.frontierがある場合)は、同じCSVファイルに複数のプロセスから追記しないよう無効になります。
     """
 
+    @classmethod
+    def from_crawler(cls, crawler):
+        check_single_process(crawler, cls.__name__)
+        return cls()
+
     def open_spider(self, spider):
         """
-        CSVファイルを開き、ヘッダーを書き込みます (新規作成の場合)。
+        CSVファイルと索引ファイルを開き、ヘッダーを書き込みます (新規作成の場合)。
         """
         spider.flag_use_csv = True
         
-        self.file = open(CSV_FILE, "a+", newline='', encoding='utf-8')
-        self.file.seek(0)
-        self.existing_urls = set(line.split(',')[3].strip() for line in self.file.readlines())
+        self.url_index = UrlIndex(CSV_FILE)
+        # 行毎にファイルに書き込む(異常終了時に書き込みバッファの行が失われないようにする)
+        self.file = open(CSV_FILE, "a", newline='', encoding='utf-8', buffering=1)
+        self.writer = csv.writer(self.file)
         
         # 新規作成の場合、ヘッダーを書き込む
         if self.file.tell() == 0:
-            self.file.write("title,article_number,post_date,url,article\n")
+            self.writer.writerow(CSV_HEADER)
         
     def close_spider(self, spider):
         """
-        CSVファイルを閉じます。
+        CSVファイルを閉じ、追加したURLを索引ファイルに反映します。
         """
         self.file.close()
+        self.url_index.close()
         
     def process_item(self, item, spider):
         """
@@ -57,22 +165,210 @@ class CsvPipeline:
         ただし、urlがすでにファイルに存在する場合、アイテムは無視されます。
         """
         # 重複チェック
-        if item.get('url') in self.existing_urls:
+        if item.get('url') in self.url_index:
             logger.warning(f"[csv]取得した記事は既に保存済のためスキップします。リンク: {item.get('url')}")
             spider.skip_csv_count += 1
             return item
         
-        #titleとarticleはダブルクォートで囲む
-        title = f'"{item.get("title")}"'
-        article = f'"{item.get("article")}"'
-
-        # アイテムを書き込む
-        line = f"{title},{item.get('article_number')},{item.get('post_date')},{item.get('url')},{article}\n"
-        self.file.write(line)
+        # アイテムを書き込む(カンマ・ダブルクォート・改行を含む値はcsv.writerでエスケープする)
+        self.writer.writerow([item.get(field) for field in CSV_HEADER])
         logger.info(f"[csv]記事が正常に保存されました。リンク: {item.get('url')}")
-        self.existing_urls.add(item.get('url'))  # 重複チェック用にURLを追加
+        self.url_index.add(item.get('url'))  # 重複チェック用にURLを追加
         return item
     
+class PartitionedCsvPipeline:
+    """
+    スクレイピングしたアイテムを、投稿日毎に分割・圧縮したCSVファイルに保存するパイプラインです。
+
+    記事はCSV_PARTITION_DIR/YYYY/MM/DD.csv.gz(圧縮形式はCSV_COMPRESSION)に追記します。
+    書き込みはCSV_BUFFER_SIZEのバッファに溜め、CSV_FLUSH_INTERVAL秒ごとと終了時にファイルに書き込みます。
+    異常終了でバッファ内の記事が失われた場合は、次回の実行時に索引ファイルがCSVファイルから作り直されるため、失われた記事は再取得されます。
+    同時に開いておくファイル数はCSV_MAX_OPEN_PARTITIONSまでとし、超えた場合は最も使われていないファイルを閉じます。
+    urlがすでに保存先フォルダ内のファイルに存在する場合、アイテムは無視されます(url_index.py参照)。
+    CsvPipelineの代わりにITEM_PIPELINESに設定して使用します。CsvPipelineと同様に、複数ワーカーで取得する場合は無効になります。
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        check_single_process(crawler, cls.__name__)
+        return cls()
+
+    def __init__(self, root=CSV_PARTITION_DIR, compression=CSV_COMPRESSION, buffer_size=CSV_BUFFER_SIZE, flush_interval=CSV_FLUSH_INTERVAL, max_open=CSV_MAX_OPEN_PARTITIONS):
+        self.root = root
+        self.compression = resolve_compression(compression)
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.max_open = max(max_open, 1)
+        self.writers = OrderedDict()
+        self.flush_loop = None
+
+    def open_spider(self, spider):
+        """
+        保存先フォルダの索引ファイルを開き、定期的にバッファを書き込むタイマーを開始します。
+        """
+        spider.flag_use_csv = True
+        self.url_index = UrlIndex(self.root)
+        if self.flush_interval:
+            self.flush_loop = task.LoopingCall(self.flush)
+            self.flush_loop.start(self.flush_interval, now=False)
+
+    def close_spider(self, spider):
+        """
+        全てのファイルを閉じ、追加したURLを索引ファイルに反映します。
+        """
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+        for writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
+        self.url_index.close()
+
+    def process_item(self, item, spider):
+        """
+        各アイテムを投稿日に対応するファイルに書き込みます。
+        ただし、urlがすでに保存済の場合、アイテムは無視されます。
+        """
+        if item.get('url') in self.url_index:
+            logger.warning(f"[csv]取得した記事は既に保存済のためスキップします。リンク: {item.get('url')}")
+            spider.skip_csv_count += 1
+            return item
+        
+        writer = self._writer(partition_path(self.root, item.get('post_date'), self.compression))
+        writer.writerow([item.get(field) for field in CSV_HEADER])
+        logger.info(f"[csv]記事が正常に保存されました。ファイル: {writer.path} リンク: {item.get('url')}")
+        self.url_index.add(item.get('url'))  # 重複チェック用にURLを追加
+        return item
+
+    def flush(self):
+        """
+        開いている全てのファイルのバッファを書き込みます。
+        """
+        for writer in self.writers.values():
+            writer.flush()
+
+    def _writer(self, path):
+        """
+        パスに対応するライターを返します。開いていない場合は開き、上限を超えた場合は最も使われていないファイルを閉じます。
+
+        :param path: CSVファイルのパス
+        :return: PartitionWriter
+        """
+        writer = self.writers.get(path)
+        if writer:
+            self.writers.move_to_end(path)
+            return writer
+        if len(self.writers) >= self.max_open:
+            _, oldest = self.writers.popitem(last=False)
+            oldest.close()
+        writer = self.writers[path] = PartitionWriter(path, self.compression, self.buffer_size)
+        return writer
+
+class ParquetPipeline:
+    """
+    スクレイピングしたアイテムを、投稿日毎に分割したParquetファイルに保存するパイプラインです。
+
+    アイテムはPARQUET_BATCH_SIZE件ごとにArrowのRecordBatchに変換して溜め、
+    投稿日毎にPARQUET_ROW_GROUP_SIZE件に達したら1つの行グループとして書き込みます。
+    ファイルはPARQUET_DIR/year=YYYY/month=MM/day=DD/part-<開始時刻>-<プロセスID>.parquetの形式で、実行毎に新しいファイルを作成します。
+    同じ値が繰り返し現れる列(PARQUET_DICTIONARY_COLUMNS)は辞書エンコーディングで保存します。
+    投稿日の無いエラー記事は保存しません。
+    pyarrowがインストールされていない場合は、このパイプラインは無効になります。
+    """
+    SCHEMA = pa.schema([
+        ('title', pa.string()),
+        ('article_number', pa.string()),
+        ('post_date', pa.string()),
+        ('posted_at', pa.timestamp('s')),
+        ('url', pa.string()),
+        ('article', pa.string()),
+    ]) if pa else None
+
+    def __init__(self, root=PARQUET_DIR, batch_size=PARQUET_BATCH_SIZE, row_group_size=PARQUET_ROW_GROUP_SIZE, compression=PARQUET_COMPRESSION, dictionary_columns=PARQUET_DICTIONARY_COLUMNS):
+        if pa is None:
+            raise NotConfigured("pyarrowがインストールされていないため、ParquetPipelineを使用できません")
+        self.root = root
+        self.batch_size = max(batch_size, 1)
+        self.row_group_size = max(row_group_size, 1)
+        self.compression = compression
+        self.dictionary_columns = list(dictionary_columns)
+        self.rows = {} # 投稿日毎のRecordBatchに変換前の記事
+        self.batches = {} # 投稿日毎の書き込み前のRecordBatch
+        self.writers = {}
+        self.urls = set()
+
+    def open_spider(self, spider):
+        self.file_name = f"part-{datetime.now().strftime('%Y%m%d%H%M%S')}-{os.getpid()}.parquet"
+
+    def close_spider(self, spider):
+        """
+        残っている記事を書き込み、全てのファイルを閉じます。
+        件数がPARQUET_BATCH_SIZEの倍数の投稿日は、記事が全てRecordBatchに変換済でself.rowsに残っていないため、self.batchesの投稿日も対象とします。
+        """
+        for day in set(self.rows) | set(self.batches):
+            self._write(day, force=True)
+        for writer in self.writers.values():
+            writer.close()
+        logger.info(f"[parquet]{len(self.urls)}件の記事を{len(self.writers)}個のファイルに保存しました")
+
+    def process_item(self, item, spider):
+        """
+        各アイテムを投稿日毎のバッファに追加します。
+        """
+        post_date = item.get('post_date')
+        posted_at = to_naive(item.get('posted_at') or parse_post_date(post_date))
+        url = item.get('url')
+        if posted_at is None or url in self.urls:
+            return item
+        self.urls.add(url)
+        day = post_date[:8]
+        self.rows.setdefault(day, []).append({
+            'title': item.get('title'),
+            'article_number': item.get('article_number'),
+            'post_date': post_date,
+            'posted_at': posted_at,
+            'url': url,
+            'article': item.get('article'),
+        })
+        if len(self.rows[day]) >= self.batch_size:
+            self._write(day)
+        return item
+
+    def _write(self, day, force=False):
+        """
+        投稿日のバッファをRecordBatchに変換し、行グループの件数に達した場合(forceの場合は常に)ファイルに書き込みます。
+
+        :param day: 投稿日(YYYYMMDD)
+        :param force: Trueの場合は件数に関わらず書き込む
+        """
+        rows = self.rows.pop(day, [])
+        batches = self.batches.setdefault(day, [])
+        if rows:
+            batches.append(pa.RecordBatch.from_pylist(rows, schema=self.SCHEMA))
+        if not batches or (not force and sum(batch.num_rows for batch in batches) < self.row_group_size):
+            return
+        table = pa.Table.from_batches(batches, schema=self.SCHEMA)
+        self._writer(day).write_table(table, row_group_size=self.row_group_size)
+        self.batches[day] = []
+
+    def _writer(self, day):
+        """
+        投稿日に対応するParquetファイルのライターを返します。
+
+        :param day: 投稿日(YYYYMMDD)
+        :return: pyarrow.parquet.ParquetWriter
+        """
+        writer = self.writers.get(day)
+        if writer is None:
+            directory = os.path.join(self.root, f"year={day[:4]}", f"month={day[4:6]}", f"day={day[6:8]}")
+            os.makedirs(directory, exist_ok=True)
+            writer = self.writers[day] = pq.ParquetWriter(
+                os.path.join(directory, self.file_name),
+                self.SCHEMA,
+                compression=self.compression,
+                use_dictionary=self.dictionary_columns,
+            )
+        return writer
+
 #SQLAlchemyPipelineがあるので使わない
 class SQLitePipeline:
     """
@@ -131,50 +427,340 @@ class SQLAlchemyPipeline:
     記事用のテーブルが存在しない場合は作成します。このパイプラインによって処理された
     各アイテムは、記事テーブルに挿入されます。同じURLを持つアイテムがデータベースに
     既に存在する場合、挿入は無視されます。これにより、各記事が一度だけ保存されることが保証されます。
+    
+    保存済の記事を再取得した場合(const.pyのREVISIT_DAYS参照。アイテムのrevisitがTrueの場合)は、タイトルと本文のハッシュ(content_hash)を比較し、
+    変更が無ければスキップします。変更がある場合は、更新前の内容を差分として記事の更新履歴(article_revisions)に保存し、
+    記事を最新の内容で更新します(revisions.py参照)。
+    
+    アイテムはバッファに溜め、DB_BATCH_SIZE件ごと、またはDB_FLUSH_INTERVAL秒ごとにまとめて保存します(const.py参照)。
+    保存にはデータベースの一括UPSERT(SQLiteはINSERT ... ON CONFLICT、MySQLはINSERT ... ON DUPLICATE KEY)を使用し、
+    1回のコミットでバッファ内の記事をまとめて挿入します。まとめて保存できなかった場合は1件ずつ保存し直し、
+    保存できなかった記事のみをエラーとします。
+    
+    データベースへの書き込みは専用の書き込みスレッドで行い、reactorのスレッド(Playwrightのコールバック)を止めません。
+    アイテムは上限(DB_QUEUE_SIZE)付きのキューで書き込みスレッドに渡し、process_itemは保存が完了した時点で
+    発火するDeferredを返します。キューが一杯の場合はreactor側で待機させ、Scrapyのアイテム処理を遅らせます。
+    
+    DB_COMPRESS_ARTICLESがTrueの場合は、記事の本文を最新の辞書(manage.py train-dictで作成)でzstd圧縮して保存します。
+    
+    SEARCH_INDEX_ENABLEDがTrueでSQLite(FTS5)を使用している場合は、記事の挿入と同じトランザクションで
+    タイトルと本文を全文検索の索引に登録します(search.py参照)。
     """
     skip_DB_count = 0
     flag_use_DB = False
     
+    def __init__(self, batch_size=DB_BATCH_SIZE, flush_interval=DB_FLUSH_INTERVAL, compress=DB_COMPRESS_ARTICLES, queue_size=DB_QUEUE_SIZE, search_index=SEARCH_INDEX_ENABLED):
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.compress = compress
+        self.search_index = search_index
+        self.dictionary = None
+        self.queue = queue.Queue(maxsize=max(queue_size, 1))
+        self.backlog = deque() # キューが一杯の間に受け取ったアイテム(reactorのスレッドでのみ操作する)
+        self.writer = None
+    
     def open_spider(self, spider):
         """
-        データベースセッションを開き、記事テーブルが存在しない場合は作成します。
+        データベースセッションを開き、記事テーブルが存在しない場合は作成します(既存のテーブルに無い列は追加します)。
+        その後、書き込みスレッドを開始します。
         """
         spider.flag_use_DB = True
+        self.spider = spider
         try:
             self.session = Session()
-            Base.metadata.create_all(bind=self.session.get_bind())
+            upgrade_schema(self.session.get_bind())
+            if self.compress:
+                self._load_dictionary()
+            if self.search_index:
+                self.search_index = search.create_index(self.session)
+                self.session.commit()
+                if not self.search_index:
+                    logger.info("[DB]SQLite(FTS5のtrigram)が使用できないため、全文検索の索引を作成しません")
         except SQLAlchemyError as e:
             logger.error(f"データベース接続エラー: {e}")
             raise e  # スパイダーの実行を停止するためにエラーを伝播させる
+        METRICS.register_gauge('queue_depth', lambda: self.queue.qsize() + len(self.backlog), queue='db_writer')
+        self.writer = threading.Thread(target=self._run, name='SQLAlchemyPipelineWriter', daemon=True)
+        self.writer.start()
 
     def close_spider(self, spider):
         """
-        変更をコミットし、データベースセッションを閉じます。
+        キューに残っている記事を全て保存してから書き込みスレッドを終了し、データベースセッションを閉じます。
         """
-        self.session.close()
+        pending, self.backlog = list(self.backlog), deque()
+        return threads.deferToThread(self._stop, pending)
 
     def process_item(self, item, spider):
         """
-        各アイテムを処理し、データベースの記事テーブルに挿入します。
-        同じURLを持つアイテムが既に存在する場合、挿入は無視されます。
+        各アイテムを書き込みスレッドのキューに追加します。
+        返すDeferredは、アイテムの保存(またはスキップ・エラー)が確定した時点で発火します。
         """
+        d = defer.Deferred()
+        if self.backlog or not self._offer((item, d)):
+            self.backlog.append((item, d))
+        return d
+
+    def _offer(self, entry):
         try:
-            article = Article(
-                title=item.get('title'),
-                article_number=item.get('article_number'),
-                post_date=item.get('post_date'),
-                url=item.get('url'),
-                article=item.get('article')
-            )
-            self.session.merge(article)
+            self.queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            return False
+
+    def _drain_backlog(self):
+        """
+        reactorで待機しているアイテムを、キューの空きの分だけ書き込みスレッドに渡します。
+        """
+        while self.backlog and self._offer(self.backlog[0]):
+            self.backlog.popleft()
+
+    def _stop(self, pending):
+        """
+        書き込みスレッドの終了を待ちます(スレッドプールで実行します)。
+        """
+        for entry in pending:
+            self.queue.put(entry)
+        self.queue.put(None)
+        self.writer.join()
+        self.session.close()
+
+    def _run(self):
+        """
+        書き込みスレッドの処理。最初のアイテムを受け取ってからDB_BATCH_SIZE件に達するか、
+        DB_FLUSH_INTERVAL秒経過するまでアイテムを集めてまとめて保存します。Noneを受け取ったら終了します。
+        """
+        from twisted.internet import reactor # 設定したreactor(asyncio)がインストールされた後に読み込む
+        stopping = False
+        while not stopping:
+            entry = self.queue.get()
+            if entry is None:
+                break
+            batch = [entry]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    entry = self.queue.get(timeout=max(deadline - time.monotonic(), 0.001))
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            results = self._write_batch([item for (item, _) in batch])
+            reactor.callFromThread(self._finish, batch, results)
+
+    def _finish(self, batch, results):
+        """
+        保存結果をスパイダーの件数に反映し、各アイテムのDeferredを発火します(reactorのスレッドで実行します)。
+        """
+        for ((item, d), status) in zip(batch, results):
+            if status == 'skipped':
+                self.spider.skip_DB_count += 1
+            elif status == 'unchanged':
+                self.spider.unchanged_count += 1
+            elif status == 'updated':
+                self.spider.revision_count += 1
+            d.callback(item)
+        self._drain_backlog()
+
+    def _write_batch(self, items):
+        """
+        アイテムをまとめてデータベースの記事テーブルに挿入します(書き込みスレッドで実行します)。
+        バッチ内で重複するURLの記事は無視されます。同じURLを持つ記事が既に存在する場合はスキップし、
+        再取得した記事(revisitがTrue)の場合のみ内容の変更を確認します(_reviseを参照)。
+        まとめて保存できなかった場合はロールバックし、1件ずつ保存し直します。
+
+        :param items: アイテムのリスト
+        :return: list: アイテム毎の結果('inserted', 'updated', 'unchanged', 'skipped', 'error')
+        """
+        results = ['inserted'] * len(items)
+        # バッチ内で重複するURLは最初の記事のみを対象とする
+        rows = {}
+        positions = {}
+        for (position, item) in enumerate(items):
+            url = item.get('url')
+            if url in rows:
+                logger.warning(f"[DB]取得した記事は既に保存済のためスキップします。リンク: {url}")
+                results[position] = 'skipped'
+                continue
+            rows[url] = self._row(item)
+            positions[url] = position
+        
+        started = time.perf_counter()
+        try:
+            # 保存済のURLとハッシュを1回のSELECTでまとめて確認する
+            existing = self.session.execute(self._existing_statement(list(rows))).all()
+            for row in existing:
+                item = items[positions[row.url]]
+                if item.get('revisit'):
+                    results[positions[row.url]] = self._revise(row, rows.pop(row.url), item)
+                else:
+                    logger.warning(f"[DB]取得した記事は既に保存済のためスキップします。リンク: {row.url}")
+                    rows.pop(row.url)
+                    results[positions[row.url]] = 'skipped'
+            
+            inserted = self._insert(rows) if rows else set()
+            if inserted and self.search_index:
+                self._index_articles(items, positions, inserted)
             self.session.commit()
-            logger.info(f"[DB]記事が正常に保存されました。リンク: {item.get('url')}")
+            METRICS.observe('db_commit_seconds', time.perf_counter() - started, pipeline=type(self).__name__)
+            if rows:
+                # 確認後に他のワーカーが保存した記事は挿入されずにスキップされる
+                for url in rows:
+                    if url not in inserted:
+                        logger.warning(f"[DB]取得した記事は既に保存済のためスキップします。リンク: {url}")
+                        results[positions[url]] = 'skipped'
+                logger.info(f"[DB]{len(inserted)}件の記事が正常に保存されました。リンク: {', '.join(inserted)}")
         except SQLAlchemyError as e:
-            #ユニーク成約の場合はログレベルをwarningで出力し、それ以外のエラーはログレベルをerrorで出力
-            if "UNIQUE constraint failed" in str(e):
-                logger.warning(f"[DB]取得した記事は既に保存済のためスキップします。リンク: {item.get('url')}")
-                spider.skip_DB_count += 1
-            else:
-                logger.error(f"[DB]記事の保存中にエラーが発生しました。リンク: {item.get('url')}\n エラー内容: {e}")
             self.session.rollback()  # 変更をロールバック
-        return item
\ No newline at end of file
+            if len(positions) > 1:
+                # エラーの原因の記事のみをエラーとするため、1件ずつ保存し直す
+                logger.warning(f"[DB]{len(positions)}件の記事をまとめて保存できなかったため、1件ずつ保存します。エラー内容: {e}")
+                for position in positions.values():
+                    results[position] = self._write_batch([items[position]])[0]
+                return results
+            for (url, position) in positions.items():
+                results[position] = 'error'
+                logger.error(f"[DB]記事の保存中にエラーが発生しました。リンク: {url}\n エラー内容: {e}")
+        return results
+
+    def _existing_statement(self, urls):
+        """
+        保存済の記事のID、URL、ハッシュを確認するSELECT文を生成します。
+        MySQLでは、確認した(存在しないURLを含む)範囲をコミットまでロックし、確認後に他のワーカーが同じURLの記事を挿入できないようにします。
+
+        :param urls: 確認するURLのリスト
+        :return: Select
+        """
+        statement = select(Article.id, Article.url, Article.content_hash).where(Article.url.in_(urls))
+        if self.session.get_bind().dialect.name == 'mysql':
+            statement = statement.with_for_update()
+        return statement
+
+    def _insert(self, rows):
+        """
+        未保存の記事を一括で挿入し、実際に挿入した記事のURLを返します。URLが重複する記事(確認後に他のワーカーが保存した記事)は無視されます。
+        SQLite 3.35以降はRETURNINGで挿入した記事のURLを取得します。それより前のSQLiteは1件ずつ挿入して件数で判定します。
+        MySQLは_existing_statementのロックにより、確認時に存在しなかった記事は全て挿入されます。
+
+        :param rows: 記事のURLと値の辞書
+        :return: set: 挿入した記事のURL
+        """
+        dialect = self.session.get_bind().dialect
+        if dialect.name == 'sqlite' and dialect.insert_returning:
+            return set(self.session.execute(self._upsert_statement(list(rows.values())).returning(Article.url)).scalars())
+        if dialect.name == 'sqlite':
+            return {url for (url, row) in rows.items() if self.session.execute(self._upsert_statement([row])).rowcount == 1}
+        self.session.execute(self._upsert_statement(list(rows.values())))
+        return set(rows)
+
+    def _revise(self, existing, row, item):
+        """
+        保存済の記事とハッシュを比較し、変更がある場合は更新前の内容を更新履歴に保存して記事を更新します
+        (コミットは_write_batchで行います)。ハッシュが未設定の記事は、保存済の内容からハッシュを計算して比較します。
+
+        :param existing: 保存済の記事のID、URL、ハッシュ
+        :param row: アイテムを変換した記事テーブルの値の辞書
+        :param item: アイテム
+        :return: str: 'updated', 'unchanged'または'skipped'
+        """
+        body = item.get('article')
+        if body in (None, '-', 'Error'):
+            # 本文を取得できなかった場合は保存済の内容を上書きしない
+            logger.warning(f"[DB]取得した記事は既に保存済のためスキップします。リンク: {existing.url}")
+            return 'skipped'
+        if existing.content_hash == row['content_hash']:
+            logger.info(f"[DB]保存済の記事から変更が無いためスキップします。リンク: {existing.url}")
+            return 'unchanged'
+        
+        article = self.session.get(Article, existing.id)
+        old_title, old_body = article.title, article.article
+        old_hash = existing.content_hash or content_hash(old_title, old_body)
+        if old_hash == row['content_hash']:
+            article.content_hash = old_hash
+            logger.info(f"[DB]保存済の記事から変更が無いためスキップします。リンク: {existing.url}")
+            return 'unchanged'
+        
+        self.session.add(ArticleRevision(article_id=article.id, title=old_title, content_hash=old_hash, diff=make_diff(body, old_body)))
+        article.title = row['title']
+        article._article = row['article']
+        article.article_zstd = row.get('article_zstd')
+        article.dict_id = row.get('dict_id')
+        article.simhash = row['simhash']
+        article.content_hash = row['content_hash']
+        article.updated_at = datetime.now()
+        if self.search_index:
+            search.index_articles(self.session, [(article.id, row['title'], body)])
+        logger.info(f"[DB]保存済の記事が更新されていたため、更新前の内容を履歴に保存しました。リンク: {existing.url}")
+        return 'updated'
+
+    def _index_articles(self, items, positions, urls):
+        """
+        挿入した記事を全文検索の索引に登録します(挿入と同じトランザクションで実行します)。
+        本文は圧縮前のアイテムの値を登録します。
+
+        :param items: アイテムのリスト
+        :param positions: URLとアイテムの位置の辞書
+        :param urls: 挿入した記事のURL
+        """
+        ids = self.session.execute(select(Article.url, Article.id).where(Article.url.in_(list(urls))))
+        search.index_articles(self.session, [
+            (article_id, items[positions[url]].get('title'), items[positions[url]].get('article'))
+            for (url, article_id) in ids
+        ])
+
+    def _row(self, item):
+        """
+        アイテムを記事テーブルの列名と値の辞書に変換します。本文の圧縮が有効な場合は本文を圧縮します。
+
+        :param item: アイテム
+        :return: dict
+        """
+        row = {
+            'title': item.get('title'),
+            'article_number': item.get('article_number'),
+            'post_date': item.get('post_date'),
+            'posted_at': to_naive(item.get('posted_at') or parse_post_date(item.get('post_date'))),
+            'url': item.get('url'),
+            'article': item.get('article'),
+            'simhash': item.get('simhash'),
+            'duplicate_of': item.get('duplicate_of'),
+            'content_hash': content_hash(item.get('title'), item.get('article')),
+        }
+        if self.compress and row['article'] is not None:
+            dict_id, dict_data = self.dictionary or (None, None)
+            row['article_zstd'] = compression.compress(row['article'], dict_id, dict_data)
+            row['dict_id'] = dict_id
+            row['article'] = None
+        return row
+
+    def _load_dictionary(self):
+        """
+        最新の圧縮用の辞書を読み込みます。zstandardが無い場合は圧縮を無効にします。
+        """
+        if not compression.available():
+            logger.warning("[DB]zstandardがインストールされていないため、記事の本文を圧縮せずに保存します")
+            self.compress = False
+            return
+        latest = self.session.scalars(select(CompressionDict).order_by(CompressionDict.id.desc()).limit(1)).first()
+        if latest:
+            self.dictionary = (latest.id, latest.data)
+            logger.info(f"[DB]記事の本文を辞書(ID: {latest.id})で圧縮して保存します")
+        else:
+            logger.info("[DB]圧縮用の辞書が無いため、辞書を使用せずに記事の本文を圧縮して保存します")
+
+    def _upsert_statement(self, rows):
+        """
+        データベースの種類に応じた、URLが重複する記事を無視する一括INSERT文を生成します。
+
+        :param rows: 挿入する記事の値の辞書のリスト
+        :return: Insert
+        """
+        dialect = self.session.get_bind().dialect.name
+        if dialect == 'sqlite':
+            return sqlite.insert(Article.__table__).values(rows).on_conflict_do_nothing(index_elements=['url'])
+        if dialect == 'mysql':
+            statement = mysql.insert(Article.__table__).values(rows)
+            # 既存の記事は更新しない(urlを同じ値で更新するだけ)
+            return statement.on_duplicate_key_update(url=statement.inserted.url)
+        return insert(Article.__table__).values(rows)
@@ -0,0 +1,92 @@
+"""
+記事の更新を検出し、更新前の内容を差分として保存するモジュール。
+
+記事のタイトルと本文のハッシュ(content_hash)をデータベースに保存し、再取得した記事のハッシュと比較して更新の有無を判定する。
+更新された記事は記事テーブルを最新の内容で上書きし、更新前の本文は最新の本文から復元するための差分(逆差分)として
+article_revisionsテーブルに保存する(models.pyのArticleRevision参照)。本文全体を複製しないため、保存容量の増加は変更箇所の分のみになる。
+
+差分は文(句点または改行まで)単位で計算し、JSONの配列で表す。
+- 0以上の整数n: 新しい本文の文をn個そのまま使用する
+- 負の整数-n: 新しい本文の文をn個読み飛ばす
+- 文字列: 更新前の本文にのみ存在する文字列を追加する
+"""
+import hashlib
+import json
+import re
+from difflib import SequenceMatcher
+
+# 文(句点・改行まで)に分割する正規表現
+SEGMENT_PATTERN = re.compile(r'[^。\n]*[。\n]|[^。\n]+$')
+
+
+def content_hash(title, article):
+    """
+    記事のタイトルと本文のハッシュを返す。
+
+    :param title: 記事のタイトル
+    :param article: 記事の本文
+    :return: str: 32文字の16進数
+    """
+    return hashlib.blake2b(f"{title or ''}\0{article or ''}".encode('utf-8'), digest_size=16).hexdigest()
+
+
+def make_diff(new, old):
+    """
+    新しい本文から更新前の本文を復元するための差分を返す。
+
+    :param new: 新しい本文
+    :param old: 更新前の本文
+    :return: str: JSON形式の差分
+    """
+    new_segments = _segments(new)
+    old_segments = _segments(old)
+    operations = []
+    for (tag, i1, i2, j1, j2) in SequenceMatcher(None, new_segments, old_segments, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            operations.append(i2 - i1)
+            continue
+        if i2 > i1:
+            operations.append(i1 - i2)
+        if j2 > j1:
+            operations.append(''.join(old_segments[j1:j2]))
+    return json.dumps(operations, ensure_ascii=False, separators=(',', ':'))
+
+
+def apply_diff(new, diff):
+    """
+    新しい本文に差分を適用し、更新前の本文を復元する。
+
+    :param new: 新しい本文
+    :param diff: make_diffで作成した差分
+    :return: str: 更新前の本文
+    """
+    segments = _segments(new)
+    position = 0
+    restored = []
+    for operation in json.loads(diff):
+        if isinstance(operation, str):
+            restored.append(operation)
+        elif operation >= 0:
+            restored.extend(segments[position:position + operation])
+            position += operation
+        else:
+            position -= operation
+    return ''.join(restored)
+
+
+def iter_history(article, revisions):
+    """
+    記事の更新前の内容を新しい順に復元する。
+
+    :param article: 記事(Article)
+    :param revisions: 記事の更新履歴(ArticleRevision)の新しい順のリスト
+    :return: generator: (更新日時, タイトル, 本文)
+    """
+    body = article.article or ''
+    for revision in revisions:
+        body = apply_diff(body, revision.diff)
+        yield (revision.created_at, revision.title, body)
+
+
+def _segments(text):
+    return SEGMENT_PATTERN.findall(text or '')
@@ -7,7 +7,15 @@
 3. クローリングプロセスを開始します。
 
 このスクリプトを実行することで、NewsSpiderが定義するルールに従ってYahooニュースのデータを収集できます。
+
+--workersを指定した場合は、指定した数のワーカープロセスを起動し、共有のフロンティア(frontier.py参照)から
+一覧ページ・記事ページのURLの貸し出しを受けて分担して取得します。
+  python run_scrapy.py --workers 4
+他のホストのワーカーを同じフロンティアに参加させる場合は、--joinを指定します(フロンティアを初期化しません)。
+  python run_scrapy.py --workers 4 --frontier <共有のフロンティアのURI> --join
 """
+import argparse
+import multiprocessing
 from datetime import datetime
 import pytz
 from scrapy.crawler import CrawlerProcess
@@ -16,7 +24,9 @@ from spiders.news import NewsSpider
 from common_func import  post_slack, setup_logger
 from scrapy import signals
 from scrapy.signalmanager import dispatcher
-from const import LOG_LEVEL, LOG_FILE
+from const import LOG_LEVEL, LOG_FILE, FRONTIER_URI
+from extraction import selector_report
+from frontier import open_frontier
 
 # ロガーの設定
 # logger = setup_logger('news', 'scrapy.log', 'INFO')
@@ -50,19 +60,76 @@ def spider_closed(spider, reason): #スパイダーが終了したときに実
   end_time = datetime.now(tokyo_timezone).strftime('%Y/%m/%d %H:%M')
   logger.info(f"[{reason}]スクレイピング終了時刻: {end_time}")
   
-  slack_message = f"Yahoo Newsのスクレイピングが完了しました。\n掲載記事件数: {spider.total_articles}件/取得記事件数: {spider.fetch_count}件/登録記事件数: {spider.pass_count}件/本文取得スキップ件数: {spider.skip_count}/エラー件数: {spider.error_count}件\n"
+  slack_message = f"[{spider.worker_id}]" if spider.frontier else ""
+  slack_message += f"Yahoo Newsのスクレイピングが完了しました。\n掲載記事件数: {spider.total_articles}件/取得記事件数: {spider.fetch_count}件/登録記事件数: {spider.pass_count}件/本文取得スキップ件数: {spider.skip_count}/エラー件数: {spider.error_count}件\n"
+  stats = spider.crawler.stats
+  slack_message += f"HTTP取得件数: {stats.get_value('http_first/plain', 0)}件/レンダリング件数: {stats.get_value('http_first/rendered', 0)}件\n"
+  slack_message += f"保存済のため取得をスキップした記事件数: {spider.skip_seen_count}件\n"
+  slack_message += f"本文が類似する記事(重複記事)の件数: {spider.near_duplicate_count}件\n"
+  if spider.unchanged_count or spider.revision_count:
+    slack_message += f"再取得した記事の件数: 更新あり{spider.revision_count}件 変更なし{spider.unchanged_count}件\n"
   if spider.flag_use_csv:
     slack_message += f"csv登録済の記事件数: {spider.skip_csv_count}件\n"
   if spider.flag_use_DB:
     slack_message += f"DB登録済の記事件数: {spider.skip_DB_count}件\n"
+  if spider.budget_skip_count:
+    slack_message += f"実行時間の予算を超えたため取得しなかった件数: {spider.budget_skip_count}件\n"
+  if spider.selector_probe_error:
+    slack_message += f"セレクターが一致しないため取得を中止しました: {spider.selector_probe_error}\n"
+  degraded = selector_report(degraded_only=True)
+  if degraded:
+    slack_message += "セレクターの一致率(予備のセレクターを使用した項目):\n" + "\n".join(degraded) + "\n"
   if spider.error_count > 0:
     slack_message += f"{spider.error_article_info}"
   post_slack(slack_message)
 
-# Yahooニュースのスパイダーを実行
-process = CrawlerProcess(settings = get_project_settings()) # Scrapyのプロジェクト設定を読み込み
-dispatcher.connect(spider_opened, signal=signals.spider_opened) # スパイダーが開始したときに実行する関数を設定
-dispatcher.connect(spider_closed, signal=signals.spider_closed) # スパイダーが終了したときに実行する関数を設定
+def run_crawl(frontier=None, worker_id=None):
+  """
+  Yahooニュースのスパイダーを実行する関数。
+
+  Args:
+    frontier (str): 共有のフロンティアのURI。単独で取得する場合はNone。
+    worker_id (str): ワーカーのID。省略時はホスト名とプロセスIDから決定します。
+  """
+  process = CrawlerProcess(settings = get_project_settings()) # Scrapyのプロジェクト設定を読み込み
+  dispatcher.connect(spider_opened, signal=signals.spider_opened) # スパイダーが開始したときに実行する関数を設定
+  dispatcher.connect(spider_closed, signal=signals.spider_closed) # スパイダーが終了したときに実行する関数を設定
+
+  process.crawl(NewsSpider, frontier=frontier, worker_id=worker_id) # NewsSpiderという名前のスパイダーを使用してクローリングプロセスを初期化
+  process.start() # クローリングプロセスを開始
+
+def run_workers(workers, frontier, join=False):
+  """
+  共有のフロンティアを使用するワーカープロセスを起動し、全て終了するまで待つ関数。
+  Twistedのreactorは1プロセスで1度しか起動できないため、ワーカー毎にプロセスを起動します。
+  同じCSVファイルに複数のプロセスから追記しないよう、ワーカーではCSVのパイプラインは無効になります(pipelines.pyのcheck_single_process参照)。
+
+  Args:
+    workers (int): 起動するワーカープロセスの数。
+    frontier (str): 共有のフロンティアのURI。
+    join (bool): Trueの場合はフロンティアを初期化せず、実行中のクロールに参加します。
+  """
+  if not join:
+    backend = open_frontier(frontier)
+    backend.reset() # 前回のクロールのURLを削除
+    backend.close()
+  context = multiprocessing.get_context('spawn')
+  processes = [context.Process(target=run_crawl, args=(frontier,)) for _ in range(workers)]
+  for process in processes:
+    process.start()
+  for process in processes:
+    process.join()
+  logger.info(f"全てのワーカーが終了しました(異常終了: {sum(1 for process in processes if process.exitcode != 0)}件)")
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Yahooニュースのスクレイピングを実行します。")
+  parser.add_argument('--workers', type=int, default=0, help="共有のフロンティアを使用するワーカープロセスの数。省略時は単独で取得します。")
+  parser.add_argument('--frontier', default=FRONTIER_URI, help="共有のフロンティアのURI(const.pyのFRONTIER_URI参照)")
+  parser.add_argument('--join', action='store_true', help="フロンティアを初期化せず、実行中のクロールに参加します。")
+  args = parser.parse_args()
 
-process.crawl(NewsSpider) # NewsSpiderという名前のスパイダーを使用してクローリングプロセスを初期化
-process.start() # クローリングプロセスを開始
+  # Yahooニュースのスパイダーを実行
+  if args.workers > 0:
+    run_workers(args.workers, args.frontier, args.join)
+  else:
+    run_crawl()
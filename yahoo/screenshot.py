@@ -0,0 +1,180 @@
+"""
+Playwrightのページのスクリーンショットをバックグラウンドで保存するモジュール。
+
+スクリーンショットの取得はスパイダーのコールバックから切り離し、上限付きのキューを介して
+バックグラウンドのタスクで行う。キューが一杯の場合はスクリーンショットを諦め、コールバックを待たせない。
+保存形式はJPEG(またはPillowがある場合はWebP)で、高さをSCREENSHOT_MAX_HEIGHTまでに制限する。
+保存先フォルダの合計サイズがSCREENSHOT_MAX_TOTAL_MBを超えた場合は古いファイルから削除する。
+
+取得モード(const.pyのSCREENSHOT_MODE):
+- off: 取得しない
+- errors: エラー発生時のみ取得する
+- sampled: エラー発生時と、一覧ページをSCREENSHOT_SAMPLE_RATEの割合で取得する
+- always: エラー発生時と全ての一覧ページで取得する
+"""
+import asyncio
+import io
+import os
+import random
+from common_func import setup_logger
+from const import (LOG_LEVEL, LOG_FILE, SCREENSHOT_DIR, SCREENSHOT_FORMAT, SCREENSHOT_MAX_HEIGHT, SCREENSHOT_MAX_TOTAL_MB,
+                   SCREENSHOT_MODE, SCREENSHOT_QUALITY, SCREENSHOT_QUEUE_SIZE, SCREENSHOT_SAMPLE_RATE)
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# ロガーの設定
+logger = setup_logger('news', LOG_FILE, LOG_LEVEL)
+
+SCREENSHOT_MODES = ('off', 'errors', 'sampled', 'always')
+
+
+class ScreenshotManager:
+    """
+    スクリーンショットの取得方針に従い、バックグラウンドでスクリーンショットを保存するクラス。
+
+    capture()に渡したページは、スクリーンショットの取得後(取得しない場合は即座に)releaseで解放される。
+
+    Attributes:
+        mode (str): 取得モード('off', 'errors', 'sampled', 'always')
+        directory (str): 保存先フォルダ
+        saved_count (int): 保存したスクリーンショットの数
+        dropped_count (int): キューが一杯だったため取得しなかったスクリーンショットの数
+    """
+
+    def __init__(self, mode=SCREENSHOT_MODE, directory=SCREENSHOT_DIR):
+        if mode not in SCREENSHOT_MODES:
+            raise ValueError(f"SCREENSHOT_MODEは{SCREENSHOT_MODES}のいずれかを指定してください: {mode}")
+        self.mode = mode
+        self.directory = directory
+        self.extension = 'webp' if SCREENSHOT_FORMAT == 'webp' and Image else 'jpg'
+        self.max_total_bytes = SCREENSHOT_MAX_TOTAL_MB * 1024 * 1024
+        self.saved_count = 0
+        self.dropped_count = 0
+        self._queue = None
+        self._worker = None
+        self._files = None
+
+    def should_capture(self, error=False):
+        """
+        取得モードに従い、スクリーンショットを取得するかどうかを判定する。
+
+        :param error: エラー発生時のスクリーンショットかどうか
+        :return: bool
+        """
+        if self.mode == 'off':
+            return False
+        if error or self.mode == 'always':
+            return True
+        return self.mode == 'sampled' and random.random() < SCREENSHOT_SAMPLE_RATE
+
+    async def capture(self, page, name, release, error=False):
+        """
+        スクリーンショットの取得をキューに登録する。取得しない場合やキューが一杯の場合はページを即座に解放する。
+
+        :param page: Playwrightのページ
+        :param name: 保存するファイル名(拡張子なし)
+        :param release: ページを解放するコルーチン関数(引数なし)
+        :param error: エラー発生時のスクリーンショットかどうか
+        """
+        if not self.should_capture(error):
+            await release()
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=SCREENSHOT_QUEUE_SIZE)
+            self._worker = asyncio.ensure_future(self._run())
+        try:
+            self._queue.put_nowait((page, name, release))
+        except asyncio.QueueFull:
+            self.dropped_count += 1
+            logger.debug(f"[screenshot]キューが一杯のためスクリーンショットを取得しません: {name}")
+            await release()
+
+    async def close(self, timeout=10):
+        """
+        キューに残っているスクリーンショットを最大timeout秒待って保存し、バックグラウンドのタスクを停止する。
+
+        :param timeout: 待機する秒数
+        """
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"[screenshot]保存が完了していないスクリーンショットがあります: {self._queue.qsize()}件")
+        self._worker.cancel()
+        while not self._queue.empty():
+            _, _, release = self._queue.get_nowait()
+            await release()
+
+    async def _run(self):
+        """
+        キューからページを取り出してスクリーンショットを保存し、ページを解放する。
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            page, name, release = await self._queue.get()
+            try:
+                try:
+                    image = await self._take(page)
+                finally:
+                    await release()
+                await loop.run_in_executor(None, self._save, name, image)
+                self.saved_count += 1
+            except Exception as e:
+                logger.warning(f"[screenshot]スクリーンショットの保存に失敗しました: {name} エラー内容: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _take(self, page):
+        """
+        高さを制限したJPEG形式のスクリーンショットを取得する。
+
+        :param page: Playwrightのページ
+        :return: bytes: JPEG形式の画像データ
+        """
+        if page.is_closed():
+            raise RuntimeError("ページが既に閉じられています")
+        width = (page.viewport_size or {}).get('width', 1280)
+        return await page.screenshot(
+            type='jpeg',
+            quality=SCREENSHOT_QUALITY,
+            full_page=True,
+            clip={'x': 0, 'y': 0, 'width': width, 'height': SCREENSHOT_MAX_HEIGHT},
+        )
+
+    def _save(self, name, image):
+        """
+        画像を保存し、保存先フォルダの合計サイズが上限を超えた場合は古いファイルから削除する。
+        スレッドプールで実行される。
+
+        :param name: ファイル名(拡張子なし)
+        :param image: JPEG形式の画像データ
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        if self.extension == 'webp':
+            buffer = io.BytesIO()
+            Image.open(io.BytesIO(image)).save(buffer, format='WEBP', quality=SCREENSHOT_QUALITY)
+            image = buffer.getvalue()
+        path = os.path.join(self.directory, f"{name}.{self.extension}")
+        with open(path, 'wb') as f:
+            f.write(image)
+
+        if self._files is None:
+            # 初回のみ既存ファイルを古い順に読み込む
+            entries = [entry for entry in os.scandir(self.directory) if entry.is_file() and entry.path != path]
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            self._files = [(entry.path, entry.stat().st_size) for entry in entries]
+        self._files = [(p, size) for (p, size) in self._files if p != path]
+        self._files.append((path, len(image)))
+
+        total = sum(size for _, size in self._files)
+        while total > self.max_total_bytes and len(self._files) > 1:
+            old_path, size = self._files.pop(0)
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+            total -= size
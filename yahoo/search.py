@@ -0,0 +1,151 @@
+"""
+保存済の記事を全文検索するモジュール(SQLiteのFTS5が必要)。
+
+記事のタイトルと本文をFTS5の仮想テーブル(articles_fts)に、記事のIDを行IDとして登録する。
+日本語は単語の区切りが無いため、FTS5のtrigramトークナイザー(SQLite 3.34以降)で3文字毎に索引を作成し、
+任意の位置の3文字以上の語句を索引で検索する。本文を圧縮して保存している場合(compression.py参照)も検索できるように、
+索引には展開した本文を登録する(記事テーブルとは別に本文の内容を持つ)。
+
+3文字未満の語句(「政府」等)はtrigramの索引で検索できないため、3文字以上の語句で絞り込んだ結果に対して部分一致で判定する。
+3文字未満の語句のみの場合は索引を使用せずに全件を部分一致で判定するため、遅くなる。
+
+索引はSQLAlchemyPipelineが記事の保存時に追加する。既存の記事はmanage.py search-indexで登録する。
+"""
+import re
+from dataclasses import dataclass
+from sqlalchemy import text
+
+FTS_TABLE = 'articles_fts'
+# trigramトークナイザーで索引を使用できる語句の最小文字数
+MIN_TERM_LENGTH = 3
+# 検索結果の抜粋の前後に表示する語句の数の上限
+SNIPPET_TOKENS = 32
+
+
+@dataclass
+class SearchHit:
+    """
+    検索結果の記事。
+
+    Attributes:
+        id (int): 記事のID
+        title (str): 記事のタイトル
+        url (str): 記事のURL
+        post_date (str): 記事の投稿日
+        snippet (str): 一致した語句を【】で囲んだ本文の抜粋
+        score (float): 関連度(BM25。小さいほど関連度が高い)
+    """
+    id: int
+    title: str
+    url: str
+    post_date: str
+    snippet: str
+    score: float
+
+
+def available(connection):
+    """
+    全文検索が使用できるかどうか(SQLiteでFTS5のtrigramトークナイザーが使用できるか)を返す。
+
+    :param connection: データベースの接続またはセッション
+    :return: bool
+    """
+    dialect = connection.get_bind().dialect if hasattr(connection, 'get_bind') else connection.dialect
+    if dialect.name != 'sqlite':
+        return False
+    version = connection.execute(text("SELECT sqlite_version()")).scalar()
+    return tuple(int(part) for part in version.split('.')[:2]) >= (3, 34)
+
+
+def create_index(connection):
+    """
+    全文検索の索引(FTS5の仮想テーブル)が無い場合は作成する。
+
+    :param connection: データベースの接続またはセッション
+    :return: bool: 索引を使用できる場合はTrue
+    """
+    if not available(connection):
+        return False
+    connection.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(title, article, tokenize='trigram')"))
+    return True
+
+
+def index_articles(connection, articles):
+    """
+    記事を全文検索の索引に登録する。登録済の記事は登録し直す。コミットは呼び出し側で行う。
+
+    :param connection: データベースの接続またはセッション
+    :param articles: (記事のID, タイトル, 本文)のリスト
+    """
+    if not articles:
+        return
+    ids = [{'id': article_id} for (article_id, _, _) in articles]
+    connection.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), ids)
+    connection.execute(
+        text(f"INSERT INTO {FTS_TABLE}(rowid, title, article) VALUES (:id, :title, :article)"),
+        [{'id': article_id, 'title': title, 'article': body} for (article_id, title, body) in articles],
+    )
+
+
+def search(connection, query, limit=20, newest=False):
+    """
+    空白で区切った語句を全て含む記事を、関連度の高い順に返す。
+
+    関連度の順に並べる場合は一致した全ての記事の関連度を計算するため、多くの記事に含まれる語句では遅くなる。
+    newestがTrueの場合は新しい記事(IDの大きい記事)から順に返し、上限の件数に達した時点で検索を終了する。
+
+    :param connection: データベースの接続またはセッション
+    :param query: 検索する語句(空白区切りでAND検索)
+    :param limit: 返す記事数の上限
+    :param newest: Trueの場合は関連度ではなく新しい順に返す
+    :return: list: SearchHitのリスト
+    """
+    terms = [term for term in re.split(r'\s+', query.strip()) if term]
+    if not terms:
+        return []
+    long_terms = [term for term in terms if len(term) >= MIN_TERM_LENGTH]
+    short_terms = [term for term in terms if len(term) < MIN_TERM_LENGTH]
+    params = {'limit': limit}
+    conditions = []
+    for (number, term) in enumerate(short_terms):
+        params[f"like{number}"] = f"%{_escape_like(term)}%"
+        conditions.append(f"({FTS_TABLE}.title LIKE :like{number} ESCAPE '\\' OR {FTS_TABLE}.article LIKE :like{number} ESCAPE '\\')")
+
+    if long_terms:
+        # 語句は二重引用符で囲み、FTS5の演算子として解釈させない
+        params['match'] = ' AND '.join('"' + term.replace('"', '""') + '"' for term in long_terms)
+        conditions.insert(0, f"{FTS_TABLE} MATCH :match")
+        # rank列(既定はbm25)で並べ替えると、FTS5が関連度の計算を1回で済ませる
+        columns = f"snippet({FTS_TABLE}, -1, '【', '】', '…', {SNIPPET_TOKENS}), {FTS_TABLE}.rank"
+        order = f"{FTS_TABLE}.rowid DESC" if newest else f"{FTS_TABLE}.rank"
+    else:
+        # MATCHを使用しない場合は抜粋と関連度を計算できないため、本文から抜粋を作成し新しい記事から返す
+        columns = f"{FTS_TABLE}.article, 0.0"
+        order = f"{FTS_TABLE}.rowid DESC"
+
+    rows = connection.execute(text(
+        f"SELECT a.id, a.title, a.url, a.post_date, {columns} FROM {FTS_TABLE} JOIN articles AS a ON a.id = {FTS_TABLE}.rowid "
+        f"WHERE {' AND '.join(conditions)} ORDER BY {order} LIMIT :limit"
+    ), params)
+    hits = []
+    for (article_id, title, url, post_date, snippet, score) in rows:
+        if not long_terms:
+            snippet = _snippet(snippet or '', short_terms[0])
+        hits.append(SearchHit(article_id, title, url, post_date, snippet, score))
+    return hits
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _snippet(body, term, width=SNIPPET_TOKENS):
+    """
+    本文の語句が最初に現れる位置の前後を抜粋し、語句を【】で囲む。
+    """
+    position = body.find(term)
+    if position < 0:
+        return body[:width * 2] + ('…' if len(body) > width * 2 else '')
+    start = max(position - width, 0)
+    end = min(position + len(term) + width, len(body))
+    return ('…' if start > 0 else '') + body[start:position] + f"【{term}】" + body[position + len(term):end] + ('…' if end < len(body) else '')
@@ -0,0 +1,117 @@
+"""
+保存済の記事URLを管理するモジュール。
+
+スパイダーの開始時にCSVファイルの索引(url_index.py参照)とデータベースから保存済の記事URLを一度だけ読み込み、
+一覧ページで記事へのリクエストを送信する前に、既に保存済の記事かどうかを判定するために使用します。
+CSVとデータベースの両方を使用している場合は、両方に保存済の記事のみを保存済として扱います。
+REVISIT_DAYSが1以上の場合は、データベースに保存済の記事のうち直近REVISIT_DAYS日に投稿された記事を再取得の対象とし、
+保存済として扱いません(更新の検出はpipelines.pyのSQLAlchemyPipeline参照)。
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from models import Article, Session
+from url_index import UrlIndex
+from dates import TIMEZONE, to_naive
+from common_func import setup_logger
+from const import CSV_FILE, LOG_LEVEL, LOG_FILE, REVISIT_DAYS
+
+# ロガーの設定
+logger = setup_logger('news', LOG_FILE, LOG_LEVEL)
+
+
+class SeenUrlIndex:
+    """
+    保存済の記事URLの集合。
+
+    Attributes:
+        urls (set or UrlIndex): 保存済の記事URL
+        revisit (set): 保存済でも再取得する記事URL
+    """
+
+    def __init__(self, urls=None, revisit=None):
+        self.urls = urls if urls is not None else set()
+        self.revisit = revisit if revisit is not None else set()
+
+    def __contains__(self, url):
+        return url not in self.revisit and url in self.urls
+
+    def __len__(self):
+        return len(self.urls)
+
+    def is_revisit(self, url):
+        """
+        保存済の記事を再取得するかどうかを返す。
+
+        :param url: 記事URL
+        :return: bool
+        """
+        return url in self.revisit
+
+    @classmethod
+    def load(cls, use_csv, use_DB, csv_path=CSV_FILE, revisit_days=REVISIT_DAYS):
+        """
+        CSVファイルとデータベースから保存済の記事URLを読み込む。
+        両方を使用する場合は、両方に保存済のURLのみを対象とする。
+
+        :param use_csv: CSVファイルを使用しているかどうか
+        :param use_DB: データベースを使用しているかどうか
+        :param csv_path: CSVファイル(または分割したCSVファイルの保存先フォルダ)のパス
+        :param revisit_days: 再取得の対象とする記事の投稿日からの日数。0の場合は再取得しない
+        :return: SeenUrlIndex
+        """
+        csv_urls = load_csv_urls(csv_path) if use_csv else None
+        db_urls = load_db_urls() if use_DB else None
+        revisit = None
+        if revisit_days:
+            if use_DB:
+                revisit = load_recent_db_urls(revisit_days)
+                logger.info(f"[seen_urls]直近{revisit_days}日に投稿された保存済の記事を再取得します。件数: {len(revisit)}件")
+            else:
+                logger.warning("[seen_urls]保存済の記事の再取得はデータベースを使用している場合のみ行います")
+        if csv_urls is not None and db_urls is not None:
+            return cls({url for url in db_urls if url in csv_urls}, revisit)
+        return cls(csv_urls if csv_urls is not None else db_urls, revisit)
+
+
+def load_csv_urls(path=CSV_FILE):
+    """
+    CSVファイルに保存済の記事URLの索引を開く。CSVファイル全体は読み込まない。
+
+    :param path: CSVファイル(または分割したCSVファイルの保存先フォルダ)のパス
+    :return: UrlIndex: 記事URLの索引
+    """
+    return UrlIndex(path, readonly=True)
+
+
+def load_db_urls():
+    """
+    データベースに保存済の記事URLを読み込む。テーブルが存在しない場合は空の集合を返す。
+
+    :return: set: 記事URLの集合
+    """
+    session = Session()
+    try:
+        return set(session.scalars(select(Article.url)))
+    except SQLAlchemyError as e:
+        logger.warning(f"[seen_urls]データベースから保存済の記事を読み込めませんでした: {e}")
+        return set()
+    finally:
+        session.close()
+
+
+def load_recent_db_urls(days):
+    """
+    データベースに保存済の記事のうち、直近days日に投稿された記事URLを読み込む。
+
+    :param days: 投稿日からの日数
+    :return: set: 記事URLの集合
+    """
+    session = Session()
+    try:
+        return set(session.scalars(select(Article.url).where(Article.posted_at >= to_naive(datetime.now(TIMEZONE)) - timedelta(days=days))))
+    except SQLAlchemyError as e:
+        logger.warning(f"[seen_urls]データベースから再取得する記事を読み込めませんでした: {e}")
+        return set()
+    finally:
+        session.close()
@@ -22,13 +22,32 @@ NEWSPIDER_MODULE = 'yahoo.spiders'
 ROBOTSTXT_OBEY = True
 
 # Configure maximum concurrent requests performed by Scrapy (default: 16)
-# CONCURRENT_REQUESTS = 4
+CONCURRENT_REQUESTS = 8
+# 同時にレンダリングする記事ページの上限(AdaptiveSchedulerMiddlewareで使用)
+MAX_ARTICLE_RENDERS = 4
 
 
 # Configure a delay for requests for the same website (default: 0)
 # See https://docs.scrapy.org/en/latest/topics/settings.html#download-delay
 # See also autothrottle settings and docs
-DOWNLOAD_DELAY = 0.5
+DOWNLOAD_DELAY = 0.5 # 待機時間の下限としても使用
+# レイテンシとエラー率に応じてドメイン毎の待機時間を調整する(AdaptiveSchedulerMiddlewareで使用)
+ADAPTIVE_DELAY_ENABLED = True
+ADAPTIVE_DELAY_START = 1.0 # 開始時の待機時間(秒)
+ADAPTIVE_DELAY_MAX = 30.0 # 待機時間の上限(秒)
+ADAPTIVE_DELAY_TARGET_CONCURRENCY = 2.0 # ドメイン毎に並列で処理したいリクエスト数
+ADAPTIVE_DELAY_BACKOFF = 2.0 # エラー発生時に待機時間を何倍にするか
+# ページの種類毎の取得時間のp99からナビゲーション・wait_for_selectorのタイムアウトを決める(AdaptiveTimeoutMiddlewareで使用)
+# タイムアウトの上限はPLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT
+ADAPTIVE_TIMEOUT_ENABLED = True
+ADAPTIVE_TIMEOUT_WINDOW = 200 # 分布の計算に使用する直近の取得時間の件数
+ADAPTIVE_TIMEOUT_MIN_SAMPLES = 20 # この件数に満たない間はタイムアウトの上限を使用する
+ADAPTIVE_TIMEOUT_QUANTILE = 0.99 # 基準にするパーセンタイル
+ADAPTIVE_TIMEOUT_MULTIPLIER = 3.0 # パーセンタイルに掛ける倍率
+ADAPTIVE_TIMEOUT_FLOOR = 15000 # タイムアウトの下限(ミリ秒)
+# 実行全体の時間の予算(秒)。超えた後は一覧ページと優先度がRUN_BUDGET_MIN_PRIORITY未満のリクエスト(リトライ)を送信しない。0の場合は無制限
+RUN_TIME_BUDGET = 0
+RUN_BUDGET_MIN_PRIORITY = 0 # 記事ページ(PRIORITY_ARTICLE)は送信し、リトライ(PRIORITY_RETRY)は送信しない
 # The download delay setting will honor only one of:
 #CONCURRENT_REQUESTS_PER_DOMAIN = 16
 #CONCURRENT_REQUESTS_PER_IP = 16
@@ -55,6 +74,11 @@ SPIDER_MIDDLEWARES = {
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 DOWNLOADER_MIDDLEWARES = {
 #    'yahoo.middlewares.YahooDownloaderMiddleware': 543,
+   'scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware': 550,
+   'yahoo.middlewares.FrontierPolitenessMiddleware': 560,
+   'yahoo.middlewares.AdaptiveSchedulerMiddleware': 600,
+   'yahoo.middlewares.AdaptiveTimeoutMiddleware': 650,
+   'yahoo.middlewares.PagePoolMiddleware': 950,
 }
 
 # Enable or disable extensions
@@ -62,12 +86,25 @@ DOWNLOADER_MIDDLEWARES = {
 #EXTENSIONS = {
 #    'scrapy.extensions.telnet.TelnetConsole': None,
 #}
+# 処理時間・キューの長さを計測し、終了時にPrometheus形式のファイルとJSON形式の実行レポートを出力する(metrics.py参照)
+# 計測値を他のモジュールと共有するため、metrics.pyはyahoo.を付けずに指定する
+EXTENSIONS = {
+    'metrics.MetricsExtension': 500,
+}
+ITEM_PROCESSOR = 'metrics.TimedItemPipelineManager' # パイプライン毎の処理時間を計測する
+METRICS_ENABLED = True
+METRICS_INTERVAL = 5.0 # キューの長さ・ページ数を記録する間隔(秒)
+METRICS_PROMETHEUS_FILE = 'metrics/yahoo_news.prom' # node_exporterのtextfile collectorで読み込むファイル
+METRICS_REPORT_DIR = 'metrics' # 実行レポート(run_YYYYMMDD_hhmmss.json)の保存先
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 ITEM_PIPELINES = {
+   'yahoo.pipelines.NearDuplicatePipeline': 300,
    'yahoo.pipelines.CsvPipeline': 400,
+#    'yahoo.pipelines.PartitionedCsvPipeline': 400, #投稿日毎に分割・圧縮して保存する場合はCsvPipelineの代わりに使用
    'yahoo.pipelines.SQLAlchemyPipeline': 500,
+#    'yahoo.pipelines.ParquetPipeline': 450, #Parquetファイルにも保存する場合(pyarrowが必要)
 #    'yahoo.pipelines.SQLitePipeline': 600, #SQLAlchemyPipelineを使用するためコメントアウト
 }
 
@@ -86,16 +123,22 @@ ITEM_PIPELINES = {
 
 # Enable and configure HTTP caching (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
-#HTTPCACHE_ENABLED = True
-#HTTPCACHE_EXPIRATION_SECS = 0
-#HTTPCACHE_DIR = 'httpcache'
-#HTTPCACHE_IGNORE_HTTP_CODES = []
-#HTTPCACHE_STORAGE = 'scrapy.extensions.httpcache.FilesystemCacheStorage'
+# 有効期限はページの種類毎にconst.pyのCACHE_TTLで設定する(httpcache.py参照)
+HTTPCACHE_ENABLED = True
+HTTPCACHE_EXPIRATION_SECS = 0
+HTTPCACHE_DIR = 'httpcache'
+HTTPCACHE_GZIP = True
+HTTPCACHE_POLICY = 'yahoo.httpcache.PageTypeCachePolicy'
+HTTPCACHE_STORAGE = 'yahoo.httpcache.BoundedFilesystemCacheStorage'
 
 DOWNLOAD_HANDLERS = {
-    "http": "scrapy_playwright.handler.ScrapyPlaywrightDownloadHandler",
-    "https": "scrapy_playwright.handler.ScrapyPlaywrightDownloadHandler",
+    "http": "yahoo.handlers.HttpFirstDownloadHandler",
+    "https": "yahoo.handlers.HttpFirstDownloadHandler",
 }
+# HTTPで取得したページに必要なセレクターがあればブラウザでのレンダリングを省略する(const.pyのHTTP_FIRST_SELECTORS参照)
+HTTP_FIRST_ENABLED = True
+# 画像・動画・フォント・広告・解析タグの読み込みを中断する(browser.py参照)
+PLAYWRIGHT_ABORT_REQUEST = 'yahoo.browser.should_abort_request'
 DOWNLOADER_MIDDLEWARES_BASE = {
     'scrapy.downloadermiddlewares.retry.RetryMiddleware': 500,
 }
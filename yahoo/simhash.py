@@ -0,0 +1,127 @@
+"""
+記事の本文の類似判定(重複記事の検出)に使用するSimHashを定義するモジュール。
+
+本文を正規化(NFKC、空白の除去)した後、文字のn-gramを特徴量として64bitのSimHashを計算する。
+似た本文のSimHashはハミング距離(異なるビットの数)が小さくなるため、距離が閾値以下の記事を重複とみなす。
+
+SimHashIndexは64bitを(最大距離+1)個の帯に分割し、帯毎のハッシュテーブルで候補を絞り込む。
+距離が最大距離以下であれば、鳩の巣原理によりいずれかの帯が完全に一致するため、見落としは無い。
+"""
+import hashlib
+import unicodedata
+from collections import Counter
+
+BITS = 64
+MASK = (1 << BITS) - 1
+
+
+def normalize(text):
+    """
+    類似判定用に本文を正規化する(NFKC正規化、空白の除去)。
+
+    :param text: 本文
+    :return: str
+    """
+    return ''.join(unicodedata.normalize('NFKC', text).split())
+
+
+def simhash(text, shingle=3):
+    """
+    本文の64bitのSimHashを計算する。
+
+    :param text: 本文
+    :param shingle: 特徴量にする文字のn-gramの長さ
+    :return: int: 0以上2^64未満の整数
+    """
+    text = normalize(text)
+    features = Counter(text[i:i + shingle] for i in range(max(len(text) - shingle + 1, 1)))
+    weights = [0] * BITS
+    for (feature, count) in features.items():
+        value = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+        for bit in range(BITS):
+            if value >> bit & 1:
+                weights[bit] += count
+            else:
+                weights[bit] -= count
+    return sum(1 << bit for bit in range(BITS) if weights[bit] > 0)
+
+
+def distance(a, b):
+    """
+    2つのSimHashのハミング距離を返す。
+
+    :return: int
+    """
+    return bin((a ^ b) & MASK).count('1')
+
+
+def to_signed(value):
+    """
+    SimHashをデータベースに保存するために符号付き64bit整数に変換する。
+    """
+    return value - (1 << BITS) if value >= 1 << (BITS - 1) else value
+
+
+def to_unsigned(value):
+    """
+    データベースから読み込んだ符号付き64bit整数をSimHashに戻す。
+    """
+    return value & MASK
+
+
+class SimHashIndex:
+    """
+    SimHashの近傍検索用の索引。
+
+    Attributes:
+        max_distance (int): 重複とみなすハミング距離の上限
+        bands (list): 帯毎の(ビット位置, ビット数)
+        tables (list): 帯毎の、帯の値をキーとした(SimHash, キー)のリストの辞書
+    """
+
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+        count = max_distance + 1
+        width, remainder = divmod(BITS, count)
+        self.bands = []
+        offset = 0
+        for band in range(count):
+            size = width + (1 if band < remainder else 0)
+            self.bands.append((offset, size))
+            offset += size
+        self.tables = [{} for _ in self.bands]
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, value, key):
+        """
+        SimHashを索引に追加する。
+
+        :param value: SimHash
+        :param key: 記事を識別する値(URL等)
+        """
+        for (table, band) in zip(self.tables, self.bands):
+            table.setdefault(self._band(value, band), []).append((value, key))
+        self.size += 1
+
+    def nearest(self, value):
+        """
+        ハミング距離がmax_distance以下の記事のうち、最も近いものを返す。
+
+        :param value: SimHash
+        :return: tuple: (キー, 距離)。該当する記事が無い場合はNone
+        """
+        best = None
+        for (table, band) in zip(self.tables, self.bands):
+            for (candidate, key) in table.get(self._band(value, band), ()):
+                d = distance(value, candidate)
+                if d <= self.max_distance and (best is None or d < best[1]):
+                    best = (key, d)
+        return best
+
+    @staticmethod
+    def _band(value, band):
+        offset, size = band
+        return value >> offset & ((1 << size) - 1)
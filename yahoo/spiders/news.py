@@ -3,12 +3,17 @@ Yahooニュースのトップピックスからニュース記事をスクレイ
 """
 import asyncio
 import os
+import random
+import socket
 import sys
+from functools import partial
 import scrapy
+from scrapy import signals
+from scrapy.exceptions import CloseSpider, DontCloseSpider
+from scrapy.http import HtmlResponse
 from scrapy_playwright.page import PageMethod
-from scrapy.selector import Selector
 from scrapy.loader import ItemLoader
-from common_func import get_this_year, setup_logger
+from common_func import setup_logger
 
 # 現在のファイルのディレクトリパスを取得
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -17,28 +22,60 @@ parent_dir = os.path.dirname(current_dir)
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
     
-from const import ARTICLE_LINK,  ARTICLES_SELECTOR, HEADLINE_CONTENT_SELECTOR, LOG_LEVEL, LOG_FILE, BASE_URL, POST_DATE, TARGET_TODAY, TITLE, TOP_PICS_URL, TOP_PICS_SELECTOR, ARTICLE_SELECTOR, LINK_TO_ARTICLE_SELECTOR, NEXT_PAGE_SELECTOR, ARTICLE_CONTENT_SELECTOR, TIMEOUT, TOTAL_ARTICLES_SELECTOR
-from common_func import convert_date, get_today, list2str, post_slack
+from const import LOG_LEVEL, LOG_FILE, BASE_URL, TARGET_TODAY, TOP_PICS_URL, TIMEOUT, SELECTOR_PROBE, HTTP_FIRST_SELECTORS, SKIP_SEEN_ARTICLES, LISTING_LOOKAHEAD, PRIORITY_LISTING, PRIORITY_ARTICLE, PRIORITY_RETRY, RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX, FRONTIER_LEASE_BATCH, FRONTIER_LEASE_SECONDS, FRONTIER_MAX_ATTEMPTS, CSV_FILE, CSV_PARTITION_DIR
+from common_func import list2str, post_slack
+from dates import RunClock, format_post_date, parse_post_date
+from extraction import ARTICLES, ARTICLE_CONTENT, ARTICLE_LINK_HREF, ARTICLE_ROOT, HEADLINE_CONTENT, LINK_TO_ARTICLE, LISTING_ROOT, NEXT_PAGE, POST_DATE_TEXT, TITLE_TEXT, TOTAL_ARTICLES, extract_text, probe, selector_report
+from frontier import FrontierEntry, open_frontier
+from metrics import METRICS
 from items import YahooItem
+from screenshot import ScreenshotManager
+from seen_urls import SeenUrlIndex
 
 # ロガーの設定
 logger = setup_logger('news', LOG_FILE, LOG_LEVEL)
 
+# ページの種類毎の待機するセレクター(候補のいずれか)とコールバックメソッド名
+STAGES = {
+    'listing': {'wait_selector': LISTING_ROOT.wait_selector, 'callback': 'start_parse'},
+    'headline': {'wait_selector': ARTICLE_ROOT.wait_selector, 'callback': 'parse_headline'},
+    'article': {'wait_selector': ARTICLE_ROOT.wait_selector, 'callback': 'parse_article'},
+}
+
+
+def retry_backoff(retry_times):
+    """
+    リトライまでの待機秒数を指数バックオフとジッターで計算する関数。
+    待機秒数は「RETRY_BACKOFF_BASE * 2^retry_times(上限RETRY_BACKOFF_MAX)」の半分から全体の範囲でランダムに決まる。
+
+    :param retry_times: これまでのリトライ回数
+    :return float: 待機秒数
+    """
+    delay = min(RETRY_BACKOFF_BASE * (2 ** retry_times), RETRY_BACKOFF_MAX)
+    return delay / 2 + random.uniform(0, delay / 2)
+
 
 class NewsSpider(scrapy.Spider):
     """
     Yahooニュースのトップピックスからニュース記事をスクレイピングするSpiderクラス。
     
     スパイダーの動作：
-    1. スパイダーは最初にYahooニュースのトップピックスページにアクセスし、ページのスクリーンショットを取得し、
+    1. スパイダーは最初にYahooニュースのトップピックスページにアクセスし、
        Yahooニュースのトップピックスページのセレクタがロードされるのを待つ。
+       スクリーンショットはconst.pyのSCREENSHOT_MODEに従いバックグラウンドで取得する。
     2. Yahooニュースのトップピックスページから各ニュース記事に対してリクエストを行い、記事の内容を取得する。
     3. 各ニュース記事のリンクがある場合は、リンクをクリックして記事の内容を取得する。
     4. 記事の内容を取得したら、記事のタイトル、記事番号、投稿日、URL、本文をItemLoaderに格納し、
        ItemLoaderを使ってデータを格納し、CSVファイルまたはデータベースに保存する。
-    5. ページの最後までスクレイピングした後、次のページがある場合はリクエストを送信する。
+    5. 次のページがある場合は、記事の取得と並行して次のページのリクエストを優先度を上げて送信する。
     6. スクレイピングが完了したら、Slackにスクレイピングの結果を通知する。
-    エラー発生時は、3回までリトライする。
+    エラー発生時は、指数バックオフで待機した後に3回までリトライする。
+    
+    SELECTOR_PROBEがTrueの場合は、最初の一覧ページと最初の記事でセレクターを確認し(extraction.py参照)、
+    確認が済むまで残りの記事と次の一覧ページのリクエストを保留する。必須の項目が一致しない場合は取得を中止する。
+    
+    フロンティアのURI(-a frontier=sqlite:///frontier.db)を指定した場合は、一覧ページ・記事ページのURLをフロンティアに登録し、
+    複数のワーカーで貸し出しを受けたURLのみを取得する(frontier.py、run_scrapy.pyの--workers参照)。
     
     methods:
         start_requests: スパイダーの最初のリクエストを生成する。
@@ -49,11 +86,8 @@ class NewsSpider(scrapy.Spider):
     
     Attributes:
         name (str): スパイダーの名前
-        status (str): 進行中のステータス情報(メソッド名で管理)
         pass_count (int): 登録成功した記事数
         error_count (int): エラー記事数
-        page_number (int): ページ番号
-        article_number (int): 記事の番号
         flag_today_article (bool): 当日の記事かどうかのフラグ(const.pyのTARGET_TODAY参照)
         fetch_count (int): 現在の取得記事数
         error_article_info (str): slack通知用のエラー記事情報
@@ -61,14 +95,23 @@ class NewsSpider(scrapy.Spider):
         flag_use_DB (bool): データベースを使用するかどうかのフラグ
         skip_csv_count (int): CSVファイルに登録済の記事数
         skip_DB_count (int): データベースに登録済の記事数
+        skip_seen_count (int): 保存済のためリクエストを送信しなかった記事数
+        near_duplicate_count (int): 本文が類似する記事(重複記事)の数
+        unchanged_count (int): 再取得した保存済の記事のうち、変更が無かった記事数
+        revision_count (int): 再取得した保存済の記事のうち、更新されていた記事数
+        probe_pending (set): セレクターの確認が済んでいないページの種類('listing', 'article')
+        probe_held (list): セレクターの確認が済むまで保留しているリクエスト
+        selector_probe_error (str): セレクターの確認で取得を中止した場合の理由
+        budget_skip_count (int): 実行時間の予算を超えたため送信しなかったリクエスト数
+        run_budget (RunBudget): 実行時間の予算(AdaptiveTimeoutMiddlewareが設定する。未使用時はNone)
+        seen_urls (SeenUrlIndex): 保存済の記事URL(const.pyのSKIP_SEEN_ARTICLES参照)
+        frontier (FrontierBackend): 複数ワーカーで共有するフロンティア。単独で取得する場合はNone
+        worker_id (str): フロンティアの貸し出しに使用するワーカーのID
     """
     name = 'news'
-    status = ""
     pass_count = 0 # 取得記事数
     error_count = 0 # エラー記事数
     skip_count = 0 # 本文取得をスキップした記事数
-    page_number = 1
-    article_number = 1
     flag_today_article = True
     fetch_count = 0
     error_article_info = ""
@@ -78,111 +121,143 @@ class NewsSpider(scrapy.Spider):
     flag_use_DB = False
     skip_csv_count = 0
     skip_DB_count = 0
+    skip_seen_count = 0
+    near_duplicate_count = 0
+    unchanged_count = 0
+    revision_count = 0
+    total_articles = "-" # 一覧ページを取得しなかったワーカーの場合は"-"のまま
+    selector_probe_error = None
+    budget_skip_count = 0
+    run_budget = None
+
+    def __init__(self, frontier=None, worker_id=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.frontier = open_frontier(frontier) if frontier else None
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.clock = RunClock() # 投稿日時の年を補うための基準日時(実行中は変更しない)
+        self.screenshots = ScreenshotManager() # スクリーンショットはバックグラウンドで取得する(const.pyのSCREENSHOT_MODE参照)
+        self.pending_articles = {} # 一覧ページ番号毎の取得が完了していない記事数
+        self.deferred_listing_request = None # 保留中の次の一覧ページのリクエスト
+        # セレクターの確認(フロンティアを使用する場合は記事のリクエストを保留できないため、一覧ページのみ確認する)
+        self.probe_pending = ({'listing'} if self.frontier else {'listing', 'article'}) if SELECTOR_PROBE else set()
+        self.probe_held = []
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        return spider
 
     def start_requests(self):
         """
         スパイダーの最初のリクエストを生成する。
-        Yahooニュースのトップピックスページにアクセスし、ページのスクリーンショットを取得し、
+        Yahooニュースのトップピックスページにアクセスし、
         Yahooニュースのトップピックスページのセレクタがロードされるのを待つ。
+        フロンティアを使用する場合は、トップピックスページをフロンティアに登録し、貸し出しを受けたURLを取得する。
         """
-        self.status = "start_requests"
-        logger.info(self.status)
-        yield scrapy.Request(
+        logger.info("start_requests")
+        self.seen_urls = self._load_seen_urls()
+        if self.frontier:
+            # 登録済の場合(他のワーカーが登録した場合)は無視される
+            self.frontier.push([FrontierEntry(TOP_PICS_URL, 'listing', PRIORITY_LISTING, {'page_number': 1})])
+            yield from self._lease_requests()
+            return
+        yield self._build_request(
             TOP_PICS_URL,
-            meta={
-                'playwright': True,
-                'playwright_include_page': True,
-                'playwright_page_methods': [
-                    PageMethod("screenshot", path="start.png", full_page=True),
-                    PageMethod('wait_for_selector', TOP_PICS_SELECTOR, timeout=TIMEOUT),
-                ],
-            },
-            callback=self.start_parse,
-            errback=self.errback,
+            page_type='listing',
+            dont_filter=False,
+            page_number=1,
         )
 
     async def start_parse(self, response):
         """
         Yahooニュースのトップピックスページのレスポンスを処理し、各ニュース記事に対してリクエストを行う。
-        各ニュース記事の処理が完了したら、次のページがある場合はリクエストを送信する。
+        次のページがある場合は、記事の取得を待たずに次のページのリクエストを先に送信する。
+        ただし、記事の取得が完了していない一覧ページがLISTING_LOOKAHEADに達している場合は、
+        記事の取得が進むまで次のページのリクエストを保留する。
 
         :param response: ページのレスポンス
         """
-        self.status = "start_parse"
-        logger.info(self.status)
-        self.total_articles = response.css(TOTAL_ARTICLES_SELECTOR).get().replace("件","") # 掲載記事数を取得
-        logger.info(f"掲載記事件数: {self.total_articles}件")
+        logger.info("start_parse")
+        page_number = response.meta.get('page_number') or 1
         page = response.meta.get('playwright_page')
         if page:
-            screenshot = await page.screenshot(path=f"SS/page{self.page_number}.png", full_page=True)
-            await page.close() # Playwrightのページを閉じる
-        
-        today = get_today() # 今日の日付を取得
+            # スクリーンショットはバックグラウンドで取得し、取得後にページを再利用のためにプールへ戻す
+            await self.screenshots.capture(page, f"page{page_number}", partial(self._release_page, response))
+        if 'listing' in self.probe_pending:
+            self._probe('listing', response)
+        self.total_articles = (TOTAL_ARTICLES.get(response) or "-").replace("件","") # 掲載記事数を取得
+        logger.info(f"掲載記事件数: {self.total_articles}件")
         
-        articles = response.css(ARTICLES_SELECTOR) # Scrapyのセレクタで記事を取得
-        for (index, article) in enumerate(articles):
-            self.article_number = index + 1
-            
-            title = article.css(TITLE).get() # タイトルを取得
-            article_number = f"{self.page_number}-{self.article_number}" # 記事番号を取得
-            post_date = convert_date(article.css(POST_DATE).get()) # 投稿日を取得
-            url = article.css(ARTICLE_LINK).get() # URLを取得
+        article_requests = []
+        with METRICS.timer('extraction_seconds', page_type='listing'):
+            articles = ARTICLES.getall(response) # コンパイル済のセレクタで記事を取得(extraction.py参照)
+            # 一覧ページの投稿日時をまとめて変換(年跨ぎはRunClockで考慮:dates.py参照)
+            posted_ats = self.clock.parse_many([POST_DATE_TEXT.get(article) for article in articles])
+            # 記事毎のタイトルとURLを取得
+            fields = [(TITLE_TEXT.get(article), ARTICLE_LINK_HREF.get(article)) for article in articles]
+        for (index, ((title, url), posted_at)) in enumerate(zip(fields, posted_ats)):
+            article_number = f"{page_number}-{index + 1}" # 記事番号を取得
+            if posted_at is None:
+                logger.warning(f"[start_parse]投稿日時を取得できませんでした。記事番号: {article_number} URL: {url}")
             
             # 取得した投稿日が今日ではない場合は処理を終了(TARGET_TODAYがTrueの場合のみ:const.py参照)
-            if TARGET_TODAY and post_date['date'] != today:
+            if TARGET_TODAY and not self.clock.is_today(posted_at):
                 self.flag_today_article = False
                 logger.info("前日の記事を取得したため終了します")
                 break
-            
-            #年跨ぎを考慮
-            if int(post_date['date']) <= int(today): #取得した記事の投稿日が今年の場合
-                post_date = f"{get_this_year()}{post_date['date']}{post_date['time']}"
-            else: #取得した記事の投稿日が昨年の場合
-                post_date = f"{int(get_this_year())-1}{post_date['date']}{post_date['time']}"
+            post_date = format_post_date(posted_at) # YYYYMMDDhhmm形式
                 
+            # 保存済の記事はリクエストを送信しない
+            if url in self.seen_urls:
+                self.skip_seen_count += 1
+                logger.info(f"[start_parse]保存済のためスキップします。記事番号: {article_number} URL: {url}")
+                continue
+            
             self.fetch_count += 1 # 現在の取得記事数をカウント
             logger.info(f"[start_parse]記事取得: {self.fetch_count}回目 記事番号: {article_number} タイトル: {title} 投稿日: {post_date} URL: {url}")
             
             # 記事のリンクに移動
-            yield scrapy.Request(
+            article_requests.append(self._build_request(
                 url,
-                meta={
-                    'playwright': True,
-                    'playwright_include_page': True,
-                    'playwright_page_methods': [
-                        PageMethod('wait_for_selector', ARTICLE_SELECTOR, timeout=TIMEOUT),
-                    ],
-                    'title': title,
-                    'article_number': article_number,
-                    'post_date': post_date,
-                    'url': url,
-                },
-                callback=self.parse_headline,
-                errback=self.errback,
-                dont_filter=True,
-            )
-            await asyncio.sleep(10) # ページ遷移のために10秒待機
+                page_type='headline',
+                page_number=page_number,
+                title=title,
+                article_number=article_number,
+                post_date=post_date,
+            ))
+        if article_requests and not self.frontier:
+            self.pending_articles[page_number] = len(article_requests)
             
-        # 次のページがある場合はリクエストを送信
-        self.status = "start_parse_next_page"
-        logger.info(self.status)
-        next_page_selector = response.css(NEXT_PAGE_SELECTOR).get()
+        # 次のページがある場合は記事より先にリクエストを送信
+        logger.info("start_parse_next_page")
+        next_request = None
+        next_page_selector = NEXT_PAGE.get(response)
         if next_page_selector and self.flag_today_article:
-            self.page_number += 1
             next_url = BASE_URL + next_page_selector
-            yield scrapy.Request(
+            next_request = self._build_request(
                 next_url,
-                meta={
-                    'playwright': True,
-                    'playwright_include_page': True,
-                    'playwright_page_methods' : [
-                        PageMethod('wait_for_selector', TOP_PICS_SELECTOR, timeout=TIMEOUT),
-                    ],
-                },
-                callback=self.start_parse,
-                errback=self.errback,
-                dont_filter=True,
+                page_type='listing',
+                page_number=page_number + 1,
             )
+        outgoing = []
+        if self.frontier:
+            # フロンティアに登録し、各ワーカーが貸し出しを受けて取得する
+            self._enqueue(([next_request] if next_request else []) + article_requests)
+            article_requests = self._ack(response.meta)
+        elif next_request:
+            if len(self.pending_articles) < LISTING_LOOKAHEAD:
+                outgoing.append(next_request)
+            else:
+                logger.info(f"[start_parse]記事の取得が完了していない一覧ページが{len(self.pending_articles)}件あるため次のページを保留します")
+                self.deferred_listing_request = next_request
+        outgoing += article_requests
+        if 'article' in self.probe_pending and article_requests:
+            # 最初の記事でセレクターを確認するまで、残りのリクエストを保留する
+            outgoing = self._hold_for_probe(article_requests[0], outgoing)
+        
+        for request in outgoing:
+            yield request
 
     async def parse_headline(self, response):
         """
@@ -191,46 +266,46 @@ class NewsSpider(scrapy.Spider):
 
         :param response: ページのレスポンス
         """
-        self.status = "parse_headline"
-        logger.info(self.status)
+        logger.info("parse_headline")
         logger.info(f"[parse_headline]記事取得: {self.fetch_count}回目 記事番号: {response.meta['article_number']} タイトル: {response.meta['title']} 投稿日: {response.meta['post_date']} URL: {response.meta['url']}")
-        page = response.meta.get('playwright_page')
-        if page:
-            await page.close() # Playwrightのページを閉じる
+        await self._release_page(response) # Playwrightのページを再利用のためにプールへ戻す
+        
+        probing = response.meta.get('selector_probe')
+        if probing:
+            self._probe('headline', response)
         
         # ページ内にLINK_TO_ARTICLE_SELECTORが存在するか確認
-        if not response.css(LINK_TO_ARTICLE_SELECTOR):
+        with METRICS.timer('extraction_seconds', page_type='headline'):
+            link = LINK_TO_ARTICLE.get(response)
             #存在しない場合は既に記事の詳細ページを開いているので、そのまま記事を取得
-            article = response.css(HEADLINE_CONTENT_SELECTOR).get()
+            article = HEADLINE_CONTENT.get(response) if link is None else None
+        if link is None:
             # ItemLoaderを使ってデータを格納
-            loader = ItemLoader(item=YahooItem(), response=response)
+            loader = ItemLoader(item=YahooItem()) # responseを渡すとHTMLを再解析するため渡さない
             loader.add_value('title', response.meta['title'])
             loader.add_value('article_number', response.meta['article_number'])
             loader.add_value('post_date', response.meta['post_date'])
+            loader.add_value('posted_at', parse_post_date(response.meta['post_date']))
             loader.add_value('url', response.meta['url'])
             loader.add_value('article', article)
+            loader.add_value('revisit', response.meta.get('revisit'))
             yield loader.load_item()
             self.pass_count += 1 # 取得成功した記事数をカウント
+            for request in self._finish_article(response.meta) + (self._release_held() if probing else []):
+                yield request
             
         else: # リンクがある場合はリンクをクリックして記事の内容を取得
-            url = response.css(LINK_TO_ARTICLE_SELECTOR).attrib['href']
-            yield scrapy.Request(
+            url = link.get('href')
+            yield self._build_request(
                 url,
-                meta={
-                    'playwright': True,
-                    'playwright_include_page': True,
-                    'playwright_page_methods': [
-                        # PageMethod('click', LINK_TO_ARTICLE_SELECTOR),
-                        PageMethod('wait_for_selector', ARTICLE_SELECTOR, timeout=TIMEOUT),
-                    ],
-                    'title': response.meta['title'],
-                    'article_number': response.meta['article_number'],
-                    'post_date': response.meta['post_date'],
-                    'url': response.meta['url'],
-                },
-                callback=self.parse_article,
-                errback=self.errback,
-                dont_filter=True,
+                page_type='article',
+                page_number=response.meta.get('page_number'),
+                title=response.meta['title'],
+                article_number=response.meta['article_number'],
+                post_date=response.meta['post_date'],
+                url=response.meta['url'],
+                frontier_id=response.meta.get('frontier_id'),
+                selector_probe=probing,
             )
 
     async def parse_article(self, response):
@@ -240,19 +315,16 @@ class NewsSpider(scrapy.Spider):
         
         :param response: ページのレスポンス
         """
-        self.status = "parse_article"
-        logger.info(self.status)
+        logger.info("parse_article")
         logger.info(f"[parse_article]記事取得: {self.fetch_count}回目 記事番号: {response.meta['article_number']} タイトル: {response.meta['title']} 投稿日: {response.meta['post_date']} URL: {response.meta['url']}")
         page = response.meta.get('playwright_page')
-        # 記事の内容を取得する前にページのコンテンツを取得
-        content = await page.content()
-        selector = Selector(text=content)
+        # 記事の本文のテキストノードを1回だけ取得(ページのHTMLは再解析しない。IN_PAGE_EXTRACTIONの場合はページ内で取得:extraction.py参照)
+        with METRICS.timer('extraction_seconds', page_type='article'):
+            nodes = await extract_text(response, ARTICLE_CONTENT, page)
         
-        if page and selector.css(ARTICLE_CONTENT_SELECTOR): # 記事の内容を取得できるか確認
-            # 記事の内容を取得。'article#uamods'は記事のHTML要素を指定するセレクタ
+        if nodes: # 記事の内容を取得できるか確認
             try:
-                article = selector.css(ARTICLE_CONTENT_SELECTOR).getall()
-                article = list2str(article) # 記事の内容を文字列に変換
+                article = list2str(nodes) # 記事の内容を文字列に変換
             except Exception as e:
                 self.skip_count += 1
                 logger.warning("この記事のセレクターは特殊のため本文取得をスキップします",e)
@@ -264,77 +336,90 @@ class NewsSpider(scrapy.Spider):
             logger.warning("特殊な記事ページの為、本文取得をスキップします")
             self.error_article_info += f"特殊な記事ページの為、本文取得をスキップしました\n{response.meta['url']} \n"
             article = "-"
-        await page.close()  # コンテンツ取得後にページを閉じる
+        await self._release_page(response)  # コンテンツ取得後にページを再利用のためにプールへ戻す
+        held = []
+        if response.meta.get('selector_probe'):
+            self._probe('article', response)
+            held = self._release_held()
         
         #記事の内容以外の情報をItemLoaderに格納
-        loader = ItemLoader(item=YahooItem(), response=response)
+        loader = ItemLoader(item=YahooItem()) # responseを渡すとHTMLを再解析するため渡さない
         loader.add_value('title', response.meta['title'])
         loader.add_value('article_number', response.meta['article_number'])
         loader.add_value('post_date', response.meta['post_date'])
+        loader.add_value('posted_at', parse_post_date(response.meta['post_date']))
         loader.add_value('url', response.meta['url'])
         loader.add_value('article', article) # 記事の内容を格納
+        loader.add_value('revisit', response.meta.get('revisit'))
         yield loader.load_item() # ItemLoaderを使ってデータを格納
         self.pass_count += 1 # 取得成功した記事数をカウント
+        for request in self._finish_article(response.meta) + held:
+            yield request
 
     async def errback(self, failure):
         """
         リクエストが失敗した場合のエラーハンドリング。
         ページのスクリーンショットを取得し、エラーメッセージをログに記録する。
+        リトライはリクエストのmetaに保持したページの種類(page_type)と記事情報を元に行い、
+        指数バックオフ(RETRY_BACKOFF_BASE秒 * 2^リトライ回数、上限RETRY_BACKOFF_MAX秒)にジッターを加えた時間待機してから送信する。
+        セレクターを確認する記事の場合は、表示されたページでセレクターが一致しない場合のみ取得を中止し、
+        ネットワークのエラー等はリトライする。リトライしても取得できない場合は、保留していた次の記事で確認する。
 
         :param failure: 失敗したリクエストの情報
         """
+        meta = failure.request.meta
+        if meta.get('budget_exceeded'):
+            # 実行時間の予算を超えたため送信しなかったリクエストは、リトライせずエラー記事としても保存しない
+            self.budget_skip_count += 1
+            logger.info(f"[errback]実行時間の予算を超えたため取得しません。種類: {meta.get('page_type')} URL: {failure.request.url}")
+            # 取得の完了として記録し、一覧ページの先読みの枠とフロンティアの貸し出しを解放する
+            requests = self._ack(meta, failed=True) if meta.get('page_type') == 'listing' else self._finish_article(meta, failed=True)
+            if meta.get('selector_probe'):
+                requests += self._release_held()
+            for request in requests:
+                yield request
+            return
         logger.info("errback")
-        logger.info(f"[errback]記事取得: {self.fetch_count}回目 記事番号: {self.page_number}-{self.article_number} タイトル: {failure.request.meta.get('title')} 投稿日: {failure.request.meta.get('post_date')} URL: {failure.request.url}")
-        page = failure.request.meta.get("playwright_page")
+        logger.info(f"[errback]記事取得: {self.fetch_count}回目 種類: {meta.get('page_type')} 記事番号: {meta.get('article_number')} タイトル: {meta.get('title')} 投稿日: {meta.get('post_date')} URL: {failure.request.url}")
+        page = meta.get("playwright_page")
+        probing = meta.get('selector_probe')
+        # セレクターを確認する記事の場合は、ページを閉じる前に表示されたDOMを取得する
+        rendered = await self._rendered_response(page) if probing else None
         if page:
-            screenshot = await page.screenshot(path=f"SS/error{self.page_number}-{self.article_number}.png", full_page=True)
-            await page.close()  # 失敗したページを閉じる
+            # スクリーンショットはバックグラウンドで取得し、取得後に失敗したページを閉じる
+            name = meta.get('article_number') or f"page{meta.get('page_number')}"
+            await self.screenshots.capture(page, f"error{name}", page.close, error=True)
+
+        if rendered is not None:
+            # ページの読み込みは完了しているのにセレクターが一致しない場合は、リトライせずに取得を中止する
+            # (ネットワークのエラー等でページを表示できなかった場合は、他のリクエストと同様にリトライする)
+            self._probe(meta.get('page_type'), rendered)
 
         # リトライ回数を取得
-        max_retry_times = self.settings.get('RETRY_TIMES')
-        retry_times = failure.request.meta.get('retry_times', 0)
+        max_retry_times = self.settings.getint('RETRY_TIMES')
+        retry_times = meta.get('retry_times', 0)
         
         # エラーメッセージをログに記録
         logger.error(f"Request failed: {failure.request.url}, Reason: {failure.value}")
         
         if retry_times < max_retry_times:
-            logger.info(f"エラー発生のためリトライします。URL: {failure.request.url}\nリトライ回数: {retry_times}/{max_retry_times}")
-            retry_times += 1
-            
-            #statusによってscrapy.Requestのselectorとcallbackメソッドを変更
-            if self.status == "start_requests":
-                selector = TOP_PICS_SELECTOR
-                callback = self.start_parse
-            elif self.status == "start_parse":
-                selector = ARTICLE_SELECTOR
-                callback = self.parse_headline
-            elif self.status == "start_parse_next_page":
-                selector = TOP_PICS_SELECTOR
-                callback = self.start_parse
-            elif self.status == "parse_headline":
-                selector = ARTICLE_SELECTOR
-                callback = self.parse_article
-            elif self.status == "parse_article":
-                selector = ARTICLE_SELECTOR
-                callback = self.parse_article
+            delay = retry_backoff(retry_times)
+            logger.info(f"エラー発生のため{delay:.1f}秒後にリトライします。URL: {failure.request.url}\nリトライ回数: {retry_times}/{max_retry_times}")
+            await asyncio.sleep(delay)
             
-            yield scrapy.Request(
+            # 失敗したリクエストと同じページの種類・記事情報でリクエストを作り直す
+            yield self._build_request(
                 failure.request.url,
-                meta={
-                    'playwright': True,
-                    'playwright_include_page': True,
-                    'playwright_page_methods': [
-                        PageMethod('wait_for_selector', selector, timeout=TIMEOUT),
-                    ],
-                    'title': failure.request.meta.get('title'),
-                    'article_number': failure.request.meta.get('article_number'),
-                    'post_date': failure.request.meta.get('post_date'),
-                    'url': failure.request.url,
-                    'retry_times': retry_times,
-                },
-                callback=callback,
-                errback=self.errback,
-                dont_filter=True,
+                page_type=meta.get('page_type'),
+                priority=PRIORITY_RETRY,
+                page_number=meta.get('page_number'),
+                title=meta.get('title'),
+                article_number=meta.get('article_number'),
+                post_date=meta.get('post_date'),
+                url=meta.get('url'),
+                frontier_id=meta.get('frontier_id'),
+                retry_times=retry_times + 1,
+                selector_probe=probing,
             )
         else:
             self.error_article_info += f"取得失敗した記事: {failure.request.url}\n"
@@ -349,3 +434,249 @@ class NewsSpider(scrapy.Spider):
             loader.add_value('article', 'Error')
             yield loader.load_item()
             retry_times = 0 # リトライ回数をリセット
+            if meta.get('page_type') != 'listing':
+                requests = self._finish_article(meta, failed=True)
+            else:
+                requests = self._ack(meta, failed=True)
+            if probing:
+                requests += self._next_probe()
+            for request in requests:
+                yield request
+
+    def _finish_article(self, meta, failed=False):
+        """
+        記事の取得完了(成功または失敗)を記録する。
+        記事の取得が完了していない一覧ページがLISTING_LOOKAHEADを下回った場合は、保留中の一覧ページのリクエストを返す。
+        フロンティアを使用する場合は、完了を記録して次に取得するURLの貸し出しを受ける。
+
+        :param meta: 完了した記事のリクエストのmeta
+        :param failed: 取得に失敗した場合はTrue
+        :return: list: 送信するリクエストのリスト
+        """
+        if self.frontier:
+            return self._ack(meta, failed)
+        page_number = meta.get('page_number')
+        if page_number in self.pending_articles:
+            self.pending_articles[page_number] -= 1
+            if self.pending_articles[page_number] <= 0:
+                del self.pending_articles[page_number]
+        if self.deferred_listing_request and len(self.pending_articles) < LISTING_LOOKAHEAD:
+            request, self.deferred_listing_request = self.deferred_listing_request, None
+            return [request]
+        return []
+
+    def _probe(self, page_type, response):
+        """
+        ページの項目のセレクターを確認する。先頭の候補が一致しない項目は、一致した予備の候補に切り替える。
+        必須の項目が一致しない場合は、タイムアウトとリトライを繰り返さないように取得を中止する。
+
+        :param page_type: ページの種類('listing', 'headline', 'article')
+        :param response: 確認するページのレスポンス
+        :raises CloseSpider: 必須の項目が一致しない場合
+        """
+        self.probe_pending.discard(page_type)
+        result = probe(page_type, response)
+        for (name, css) in result.switched.items():
+            logger.warning(f"[selector_probe]{name}のセレクターを切り替えました: {css}")
+        if result.failed:
+            self.selector_probe_error = f"{page_type}: {', '.join(result.failed)}"
+            logger.error(f"[selector_probe]セレクターが一致しないため、取得を中止します。{self.selector_probe_error} URL: {response.url}")
+            raise CloseSpider('selector_probe_failed')
+        logger.info(f"[selector_probe]{page_type}のセレクターを確認しました")
+
+    def _hold_for_probe(self, probe_request, requests):
+        """
+        セレクターを確認する記事のリクエスト以外を、確認が済むまで保留する。
+
+        :param probe_request: セレクターを確認する記事のリクエスト
+        :param requests: 送信するリクエストのリスト
+        :return: list: 送信するリクエストのリスト(確認する記事のリクエストのみ)
+        """
+        probe_request.meta['selector_probe'] = True
+        self.probe_held = [request for request in requests if request is not probe_request]
+        logger.info(f"[selector_probe]最初の記事でセレクターを確認するまで{len(self.probe_held)}件のリクエストを保留します")
+        return [probe_request]
+
+    def _release_held(self):
+        """
+        セレクターの確認が済んだため、保留していたリクエストを返す。
+
+        :return: list: 送信するリクエストのリスト
+        """
+        self.probe_pending.discard('article')
+        requests, self.probe_held = self.probe_held, []
+        return requests
+
+    def _next_probe(self):
+        """
+        セレクターを確認する記事をリトライしても取得できなかったため、保留していた次の記事で確認する。
+        保留していた記事が無い場合は、保留していたリクエストを全て返す。
+
+        :return: list: 送信するリクエストのリスト
+        """
+        held = self._release_held()
+        articles = [request for request in held if request.meta.get('page_type') != 'listing']
+        if not articles:
+            return held
+        self.probe_pending.add('article')
+        return self._hold_for_probe(articles[0], held)
+
+    @staticmethod
+    async def _rendered_response(page):
+        """
+        読み込みが完了したページのDOMをレスポンスとして返す。
+
+        :param page: Playwrightのページ
+        :return: HtmlResponse: ネットワークのエラー等でページの読み込みが完了していない場合はNone
+        """
+        if not page or page.is_closed() or not page.url.startswith('http'):
+            return None
+        try:
+            if await page.evaluate('document.readyState') != 'complete':
+                return None
+            body = await page.content()
+        except Exception as e:
+            logger.warning(f"[selector_probe]ページのDOMを取得できませんでした: {e}")
+            return None
+        return HtmlResponse(page.url, body=body, encoding='utf-8')
+
+    def spider_idle(self):
+        """
+        スパイダーの処理待ちのリクエストが無くなった際に、フロンティアから次に取得するURLの貸し出しを受ける。
+        他のワーカーが処理中のURLがある場合は、貸し出し期限切れに備えてスパイダーを終了しない。
+        """
+        if not self.frontier:
+            return
+        if self.run_budget and self.run_budget.exceeded():
+            # 実行時間の予算を超えた場合は貸し出しを受けずに終了する(貸し出し中のURLは期限切れ後に他のワーカーが取得する)
+            return
+        requests = self._lease_requests()
+        for request in requests:
+            self.crawler.engine.crawl(request)
+        if requests or self.frontier.has_pending():
+            raise DontCloseSpider
+
+    def _lease_requests(self, limit=FRONTIER_LEASE_BATCH):
+        """
+        フロンティアから貸し出しを受けたURLのリクエストを生成する。
+
+        :param limit: 貸し出しを受ける最大件数
+        :return: list: 送信するリクエストのリスト
+        """
+        entries = self.frontier.lease(self.worker_id, limit, FRONTIER_LEASE_SECONDS, FRONTIER_MAX_ATTEMPTS)
+        return [
+            self._build_request(entry.url, page_type=entry.page_type, priority=entry.priority, frontier_id=entry.id, **entry.meta)
+            for entry in entries
+        ]
+
+    def _enqueue(self, requests):
+        """
+        リクエストをフロンティアに登録する。記事情報はmetaから引き継ぐ。
+
+        :param requests: 登録するリクエストのリスト
+        """
+        entries = []
+        for request in requests:
+            meta = {key: request.meta[key] for key in ('page_number', 'title', 'article_number', 'post_date', 'url') if key in request.meta}
+            entries.append(FrontierEntry(request.url, request.meta['page_type'], request.priority, meta))
+        added = self.frontier.push(entries)
+        logger.info(f"[frontier]{added}件のURLを登録しました(登録済: {len(entries) - added}件)")
+
+    def _ack(self, meta, failed=False):
+        """
+        フロンティアから貸し出しを受けたURLの処理完了を記録し、代わりのURLの貸し出しを受ける。
+
+        :param meta: 完了したリクエストのmeta
+        :param failed: 取得に失敗した場合はTrue
+        :return: list: 送信するリクエストのリスト
+        """
+        if not self.frontier or meta.get('frontier_id') is None:
+            return []
+        self.frontier.ack(meta['frontier_id'], failed)
+        return self._lease_requests(limit=1)
+
+    def _load_seen_urls(self):
+        """
+        有効なパイプライン(CSV/DB)から保存済の記事URLを読み込む。
+
+        :return: SeenUrlIndex
+        """
+        if not SKIP_SEEN_ARTICLES:
+            return SeenUrlIndex()
+        pipelines = ' '.join(self.settings.getdict('ITEM_PIPELINES'))
+        csv_path = CSV_PARTITION_DIR if 'PartitionedCsvPipeline' in pipelines else CSV_FILE
+        seen_urls = SeenUrlIndex.load(use_csv='CsvPipeline' in pipelines, use_DB='SQLAlchemyPipeline' in pipelines, csv_path=csv_path)
+        logger.info(f"保存済の記事件数: {len(seen_urls)}件")
+        return seen_urls
+
+    async def closed(self, reason):
+        """
+        スパイダー終了時に、取得待ちのスクリーンショットを保存してから終了する。
+
+        :param reason: スパイダーが終了した理由
+        """
+        for line in selector_report():
+            logger.info(f"[selector]{line}")
+        await self.screenshots.close()
+        if self.frontier:
+            self.frontier.close()
+
+    async def _release_page(self, response):
+        """
+        コールバックで使い終わったPlaywrightのページをプールに戻す。
+        プールが無い場合(PagePoolMiddleware未使用時)はページを閉じる。
+
+        :param response: ページを含むレスポンス
+        """
+        page = response.meta.get('playwright_page')
+        if not page:
+            return
+        page_pool = getattr(self, 'page_pool', None)
+        if page_pool:
+            await page_pool.release(page, response.meta.get('playwright_context'))
+        else:
+            await page.close()
+
+    def _build_request(self, request_url, page_type, page_methods=None, dont_filter=True, priority=None, **meta):
+        """
+        Playwrightでページを取得するリクエストを生成する。
+        ページの種類(page_type)から待機するセレクターとコールバックを決定し、リクエストのmetaに保持する。
+        リトライ時もこのmetaを元にリクエストを作り直すため、並列に処理しても他のリクエストの状態に影響されない。
+        HTTP_FIRST_SELECTORSにpage_typeが定義されている場合は、まずHTTPで取得し、
+        必要なセレクターが無い場合のみブラウザでレンダリングする(yahoo.handlers.HttpFirstDownloadHandler参照)。
+
+        :param request_url: 取得するURL
+        :param page_type: ページの種類('listing', 'headline', 'article')
+        :param page_methods: wait_for_selectorの前に実行するPageMethodのリスト
+        :param dont_filter: 重複リクエストのフィルタリングを無効にするかどうか
+        :param priority: リクエストの優先度。省略時は一覧ページがPRIORITY_LISTING、記事ページがPRIORITY_ARTICLE
+        :param meta: リクエストに引き継ぐ記事情報(page_number, title, article_number, post_date, url等)
+        :return: scrapy.Request
+        """
+        stage = STAGES[page_type]
+        if meta.get('url') is None:
+            meta['url'] = request_url
+        if priority is None:
+            priority = PRIORITY_LISTING if page_type == 'listing' else PRIORITY_ARTICLE
+        if self.seen_urls.is_revisit(meta['url']):
+            meta['dont_cache'] = True # 更新を確認するため、キャッシュを使用せずに再取得する
+            meta['revisit'] = True # 保存済の記事の更新の確認はこの印がある記事のみ行う(SQLAlchemyPipeline参照)
+        return scrapy.Request(
+            request_url,
+            meta={
+                'playwright': True,
+                'playwright_include_page': True,
+                'playwright_page_methods': [
+                    *(page_methods or []),
+                    PageMethod('wait_for_selector', stage['wait_selector'], timeout=TIMEOUT),
+                ],
+                'page_type': page_type,
+                'wait_selector': stage['wait_selector'],
+                'http_first_selectors': HTTP_FIRST_SELECTORS.get(page_type),
+                **meta,
+            },
+            callback=getattr(self, stage['callback']),
+            errback=self.errback,
+            dont_filter=dont_filter,
+            priority=priority,
+        )
@@ -0,0 +1,160 @@
+"""
+記事の本文のテキストノードを正規化するモジュール。
+
+テキストノードのリストを、各ノードの両端の空白を除いて1回だけ連結し、以下の処理を行う。
+文字単位の処理はPythonのループではなく、str.strip/str.replace等(C実装)で行い、
+ノードの内部に該当する文字が無い処理は、文字列を作り直さずに省略する。
+- 空白: テキストノードの両端の空白(Unicodeの空白全て)は削除して連結する(従来のlist2strと同様にノード間は詰める)。
+  ノードの内部の改行、全角スペース、タブ、ノーブレークスペースは半角スペースとして扱い、
+  英単語の間(前後が共にASCII文字)のみ半角スペース1つとして残し、それ以外は削除する。
+  英文のみの本文の場合は、ノード間の空白も単語の区切りとして残す。
+  段落を残す場合は、改行を段落の区切りとして改行1つで残す。ゼロ幅スペースとBOMは削除する。
+- NFKC正規化(既定では行わない): 正規化済かどうかを先に判定し(unicodedata.is_normalized)、正規化済の場合は文字列を作り直さない。
+  全角英数字・記号のみが原因の場合は、変換表で半角に変換し、NFKC正規化全体は行わない。
+  ノードの内部のその他のUnicodeの空白(En Space等)は、NFKC正規化で半角スペースになる。
+
+`python yahoo/textnorm.py`で、従来のlist2strとの処理時間を比較できる。
+"""
+import argparse
+import re
+import timeit
+import unicodedata
+from const import TEXT_KEEP_PARAGRAPHS, TEXT_NFKC
+
+# 削除する不可視文字(ゼロ幅スペース、BOM)。ゼロ幅接合子等は絵文字の結合等に使用されるため残す
+INVISIBLE = ('\u200b', '\ufeff')
+# テキストノードの内部で半角スペースとして扱う空白(改行、全角スペース、タブ、復帰、ノーブレークスペース)
+INNER_SPACES = ('\n', '\u3000', '\t', '\r', '\xa0')
+# 段落を残す場合に半角スペースとして扱う空白(改行等の段落の区切りはstr.splitlinesで分割する)
+PARAGRAPH_SPACES = ('\u3000', '\t', '\xa0')
+# 全角英数字・記号(！～～)と、半角への変換表(NFKCと同じ変換)
+FULLWIDTH_RUN = re.compile('[！-～]+')
+FULLWIDTH_TABLE = {code: code - 0xfee0 for code in range(0xff01, 0xff5f)}
+# 前がASCII文字の半角スペース(英単語の区切りとして残す可能性があるもの)
+WORD_SPACE = re.compile(r' (?<=[!-~] )')
+# 前後のいずれかがASCII文字ではない半角スペース(単語の区切りとして残さないもの)
+NON_WORD_SPACE = re.compile(r' (?:(?<=[^\x00-\x7f] )|(?=[^\x00-\x7f]))')
+
+
+def normalize_text(nodes, keep_paragraphs=TEXT_KEEP_PARAGRAPHS, nfkc=TEXT_NFKC):
+    """
+    テキストノードのリストを連結し、正規化した文字列を返す。
+
+    :param nodes: テキストノード(文字列)のリスト
+    :param keep_paragraphs: Trueの場合は段落の区切り(改行)を改行1つとして残す
+    :param nfkc: Trueの場合はNFKC正規化を行う
+    :return: str
+    """
+    if keep_paragraphs:
+        text = _normalize(''.join(nodes), nfkc, PARAGRAPH_SPACES)
+        return '\n'.join(filter(None, map(str.strip, text.splitlines())))
+    text = ''.join(map(str.strip, nodes))
+    if text.isascii():
+        # 英文のみの場合は、ノード間の空白も単語の区切りとして残す
+        return ' '.join(''.join(nodes).split())
+    return _normalize(text, nfkc, INNER_SPACES)
+
+
+def _normalize(text, nfkc, spaces):
+    """
+    連結した文字列の不可視文字と空白を正規化する。spacesの文字は半角スペースとして扱う。
+    """
+    for char in INVISIBLE:
+        if char in text:
+            text = text.replace(char, '')
+    for char in spaces:
+        if char in text:
+            text = text.replace(char, ' ')
+    if nfkc:
+        text = _nfkc(text)
+    if ' ' in text:
+        text = _squeeze_spaces(text)
+    return text
+
+
+def _squeeze_spaces(text):
+    """
+    英単語の間(前後が共にASCII文字)の半角スペースのみ1つ残し、それ以外の半角スペースを削除する。
+    前がASCII文字の半角スペースが無い場合(日本語のみの本文)は、正規表現の置換を行わずに全て削除する。
+    """
+    if WORD_SPACE.search(text) is None:
+        return text.replace(' ', '')
+    while '  ' in text:
+        text = text.replace('  ', ' ')
+    return NON_WORD_SPACE.sub('', text).strip(' ')
+
+
+def _nfkc(text):
+    """
+    NFKC正規化を行う。正規化済の場合と、全角英数字・記号の変換のみで正規化済になる場合は、NFKC正規化全体を行わない。
+    """
+    if unicodedata.is_normalized('NFKC', text):
+        return text
+    text = FULLWIDTH_RUN.sub(_fold_fullwidth, text)
+    if unicodedata.is_normalized('NFKC', text):
+        return text
+    return unicodedata.normalize('NFKC', text)
+
+
+def _fold_fullwidth(match):
+    return match.group().translate(FULLWIDTH_TABLE)
+
+
+def legacy_list2str(nodes):
+    """
+    従来のlist2str(処理時間の比較用)。
+    """
+    return ''.join(nodes).strip().replace('\n', '').replace(' ', '')
+
+
+def naive_normalize(nodes):
+    """
+    文字列全体にNFKC正規化と正規表現の置換を順に適用する素朴な実装(処理時間の比較用)。
+    """
+    text = unicodedata.normalize('NFKC', ''.join(nodes))
+    text = re.sub(r'(?<=[\x21-\x7e])\s+(?=[\x21-\x7e])', ' ', text)
+    return re.sub(r'(?<![\x21-\x7e])\s+|\s+(?![\x21-\x7e])|[​-‍⁠﻿]', '', text).strip()
+
+
+def benchmark(size=20000, repeat=200):
+    """
+    記事の本文を模したテキストノードで、従来のlist2str、素朴な実装、normalize_textの処理時間を計測する。
+    本文は段落毎のテキストノード(先頭に字下げの全角スペース、末尾に改行)で、日本語のみ、英文を含むもの、
+    全角数字を含むもの(NFKC正規化が必要なもの)、段落の途中に全角スペースを含むものの4種類。
+    処理時間は、repeat回の実行を5回計測した最小値から求める。
+
+    :param size: 本文の文字数(概算)
+    :param repeat: 繰り返し回数
+    :return: list: (本文の種類, 関数名, 1回あたりの処理時間(ミリ秒))のリスト
+    """
+    paragraph = "　東京都は18日、新たに感染者が確認されたと発表した。専門家は「引き続き警戒が必要だ」と話している。\n"
+    english = "The Bank of Japan kept its policy rate unchanged on Tuesday.\n"
+    bodies = {
+        'japanese': [paragraph],
+        'mixed': [paragraph, '  ', english, '\n\n'],
+        'fullwidth': [paragraph.replace('18', '１８')],
+        'inner-space': [paragraph.replace('。専', '。　専')],
+    }
+    functions = (
+        ('list2str(legacy)', legacy_list2str),
+        ('naive', naive_normalize),
+        ('normalize_text', lambda nodes: normalize_text(nodes, keep_paragraphs=False, nfkc=False)),
+        ('normalize_text(nfkc)', lambda nodes: normalize_text(nodes, keep_paragraphs=False, nfkc=True)),
+        ('normalize_text(paragraphs)', lambda nodes: normalize_text(nodes, keep_paragraphs=True, nfkc=False)),
+    )
+    results = []
+    for (body, parts) in bodies.items():
+        nodes = parts * (size // sum(map(len, parts)) + 1)
+        for (name, function) in functions:
+            elapsed = min(timeit.repeat(lambda: function(nodes), number=repeat, repeat=5))
+            results.append((body, name, elapsed / repeat * 1000))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="list2strとnormalize_textの処理時間を比較します。")
+    parser.add_argument('--size', type=int, default=20000, help="本文の文字数(概算)")
+    parser.add_argument('--repeat', type=int, default=200, help="繰り返し回数")
+    args = parser.parse_args()
+    for (body, name, elapsed) in benchmark(args.size, args.repeat):
+        print(f"{body:<13}{name:<28}{elapsed:>10.3f}ms")
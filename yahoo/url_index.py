@@ -0,0 +1,237 @@
+"""
+CSVファイルに保存済の記事URLを、CSVファイルの隣に置いた索引ファイルで管理するモジュール。
+
+索引ファイル(<CSVファイル>.idx)はURLの64bitハッシュを昇順に並べたもので、メモリマップして二分探索で検索する。
+そのため、CSVファイルの行数が増えても起動時間とメモリ使用量はほぼ一定になる。
+実行中に追加したURLのハッシュは追記ログ(<CSVファイル>.idx.log)に書き込み、終了時に索引ファイルへ統合する。
+索引ファイルが無い場合や、索引ファイルに記録したCSVファイルのサイズと実際のサイズが異なる場合(異常終了や手動での編集)は、
+CSVファイルを読み込んで索引ファイルを作り直す。
+開く際に追記ログが残っている場合(前回の実行が終了時に統合せずに異常終了した場合)も、索引ファイルを作り直す。
+追記ログのURLの行は、CSVファイルの書き込みバッファに残ったまま失われた可能性があるため、追記ログは使用せずにCSVファイルの内容のみから作り直し、追記ログを空にする。
+投稿日毎に分割したCSVファイルの保存先フォルダ(partitions.py参照)を指定した場合は、フォルダ内の全てのCSVファイルを対象とし、
+CSVファイルのサイズの合計で索引ファイルが対応しているかを判定する。
+
+64bitハッシュの衝突(異なるURLを保存済と判定する)確率は、数百万件の場合でも10^-6程度で実用上無視できる。
+"""
+import csv
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from common_func import setup_logger
+from const import LOG_LEVEL, LOG_FILE
+from partitions import iter_partition_files, open_text
+
+try:
+    import fcntl
+except ImportError: # Windowsの場合は複数プロセスでの同時更新を排他しない
+    fcntl = None
+
+# ロガーの設定
+logger = setup_logger('news', LOG_FILE, LOG_LEVEL)
+
+# 索引ファイルのヘッダー(識別子、作成時のCSVファイルのサイズ、ハッシュの件数)
+HEADER = struct.Struct('=8sQQ')
+MAGIC = b'URLIDX01'
+# 索引ファイルを書き込む際の1回あたりの件数
+WRITE_CHUNK = 64 * 1024
+
+
+def url_hash(url):
+    """
+    URLの64bitハッシュを返す。
+
+    :param url: URL
+    :return: int
+    """
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class UrlIndex:
+    """
+    CSVファイルに保存済の記事URLの索引。`url in index`で保存済かどうかを判定する。
+
+    Attributes:
+        csv_path (str): CSVファイルまたは分割したCSVファイルの保存先フォルダのパス
+        index_path (str): 索引ファイルのパス
+        log_path (str): 追記ログのパス
+        url_column (int): CSVファイルのURLの列番号
+        readonly (bool): Trueの場合は追加・統合を行わない(スパイダーでの重複判定用)
+        added (set): 索引ファイルに未統合のURLのハッシュ
+    """
+
+    def __init__(self, csv_path, url_column=3, readonly=False):
+        self.csv_path = csv_path
+        self.index_path = f"{csv_path}.idx"
+        self.log_path = f"{csv_path}.idx.log"
+        self.url_column = url_column
+        self.readonly = readonly
+        self.added = set()
+        self._mmap = None
+        self._hashes = memoryview(b'').cast('Q')
+        self._log = None
+
+        with self._lock():
+            if not self._is_valid() or self._has_log():
+                self._rebuild()
+        self._open()
+        if not readonly:
+            self._log = open(self.log_path, 'ab')
+
+    def __contains__(self, url):
+        key = url_hash(url)
+        return key in self.added or self._in_index(key)
+
+    def __len__(self):
+        return len(self._hashes) + len(self.added)
+
+    def add(self, url):
+        """
+        URLを索引に追加し、追記ログに書き込む。
+
+        :param url: CSVファイルに書き込んだ記事のURL
+        """
+        key = url_hash(url)
+        self.added.add(key)
+        with self._lock():
+            self._log.write(array('Q', [key]).tobytes())
+            self._log.flush()
+
+    def close(self):
+        """
+        追記ログを索引ファイルに統合して閉じる。CSVファイルを閉じた後に呼び出すこと。
+        """
+        if not self.readonly:
+            with self._lock():
+                self._compact()
+            self._log.close()
+        self._close_mmap()
+
+    def _is_valid(self):
+        """
+        索引ファイルが現在のCSVファイルに対応しているかどうかを返す。
+        """
+        if not os.path.exists(self.index_path):
+            return False
+        with open(self.index_path, 'rb') as f:
+            header = f.read(HEADER.size)
+        if len(header) != HEADER.size:
+            return False
+        magic, csv_size, count = HEADER.unpack(header)
+        return magic == MAGIC and csv_size == self._csv_size() and os.path.getsize(self.index_path) == HEADER.size + count * 8
+
+    def _has_log(self):
+        """
+        未統合の追記ログがあるかどうかを返す。
+        """
+        return os.path.exists(self.log_path) and os.path.getsize(self.log_path) > 0
+
+    def _rebuild(self):
+        """
+        CSVファイルを読み込んで索引ファイルを作り直し、追記ログを空にする。
+        """
+        hashes = set()
+        for path in self._csv_files():
+            try:
+                with open_text(path) as f:
+                    reader = csv.reader(f)
+                    next(reader, None) # ヘッダーを読み飛ばす
+                    for row in reader:
+                        if len(row) > self.url_column:
+                            hashes.add(url_hash(row[self.url_column].strip()))
+            except (EOFError, OSError, RuntimeError) as e:
+                # 書き込み中の圧縮ファイルは末尾が不完全な場合があるため、読み込めた行までを対象とする
+                logger.warning(f"[url_index]{path}の読み込みを途中で終了しました: {e}")
+        self._write(sorted(hashes), len(hashes))
+        if self._has_log():
+            # 追記ログのURLはCSVファイルに書き込まれた分のみ索引に含まれている
+            open(self.log_path, 'wb').close()
+        logger.info(f"[url_index]CSVファイルから索引を作成しました。件数: {len(hashes)}件")
+
+    def _compact(self):
+        """
+        追記ログ(他のプロセスが追加した分を含む)を索引ファイルに統合し、追記ログを空にする。
+        """
+        with open(self.log_path, 'rb') as f:
+            logged = array('Q')
+            logged.frombytes(f.read())
+        new_hashes = sorted(key for key in set(logged) | self.added if not self._in_index(key))
+        if new_hashes or not self._is_valid():
+            self._write(heapq.merge(self._hashes, new_hashes), len(self._hashes) + len(new_hashes))
+        self._log.truncate(0)
+        self.added = set()
+
+    def _write(self, hashes, count):
+        """
+        昇順のハッシュを一時ファイルに書き込み、索引ファイルと置き換える。
+
+        :param hashes: 昇順のハッシュのイテラブル
+        :param count: ハッシュの件数
+        """
+        csv_size = self._csv_size()
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, csv_size, count))
+            chunk = array('Q')
+            for key in hashes:
+                chunk.append(key)
+                if len(chunk) >= WRITE_CHUNK:
+                    chunk.tofile(f)
+                    chunk = array('Q')
+            chunk.tofile(f)
+        os.replace(tmp_path, self.index_path)
+
+    def _csv_files(self):
+        if os.path.isdir(self.csv_path):
+            return iter_partition_files(self.csv_path)
+        return [self.csv_path] if os.path.exists(self.csv_path) else []
+
+    def _csv_size(self):
+        return sum(os.path.getsize(path) for path in self._csv_files())
+
+    def _in_index(self, key):
+        position = bisect_left(self._hashes, key)
+        return position < len(self._hashes) and self._hashes[position] == key
+
+    def _open(self):
+        """
+        索引ファイルをメモリマップする。
+        """
+        with open(self.index_path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._hashes = memoryview(self._mmap)[HEADER.size:].cast('Q')
+
+    def _close_mmap(self):
+        self._hashes.release()
+        self._hashes = memoryview(b'').cast('Q')
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _lock(self):
+        return _FileLock(f"{self.index_path}.lock")
+
+
+class _FileLock:
+    """
+    索引ファイルの作成・統合と追記ログへの書き込みを、複数プロセス間で排他するロック。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        if fcntl:
+            self.file = open(self.path, 'a')
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.file:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+        return False